@@ -0,0 +1,36 @@
+"""
+Carregamento único das variáveis de ambiente do arquivo .env.
+
+Os pontos de entrada (main.py, cert_storage.py) e src/infrastructure/config.py
+chamam load_env() em vez de load_dotenv(): o arquivo é lido e interpretado
+apenas uma vez por processo.
+"""
+
+import functools
+import os
+
+from dotenv import dotenv_values, find_dotenv  # pyright: ignore[reportMissingImports]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_PATH = os.path.join(BACKEND_DIR, ".env")
+
+
+@functools.cache
+def load_env() -> None:
+    """
+    Carrega o .env da pasta Backend e, se existir, o .env do diretório atual.
+
+    Variáveis já definidas no ambiente têm prioridade (equivalente a
+    load_dotenv com override=False).
+    """
+    caminhos = [ENV_PATH]
+    env_cwd = find_dotenv(usecwd=True)
+    if env_cwd and os.path.abspath(env_cwd) != ENV_PATH:
+        caminhos.append(env_cwd)
+
+    for caminho in caminhos:
+        if not os.path.isfile(caminho):
+            continue
+        for chave, valor in dotenv_values(caminho).items():
+            if valor is not None:
+                os.environ.setdefault(chave, valor)
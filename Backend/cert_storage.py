@@ -1,14 +1,76 @@
 # backend/cert_storage.py
+import functools
 import os
-from cryptography.fernet import Fernet  # pyright: ignore[reportMissingImports]
-from dotenv import load_dotenv, set_key, find_dotenv  # pyright: ignore[reportMissingImports]
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
 
-# Carrega variáveis de ambiente do arquivo .env
-# Tenta carregar do diretório atual e do diretório Backend
+from cryptography import x509  # pyright: ignore[reportMissingImports]
+from cryptography.fernet import Fernet  # pyright: ignore[reportMissingImports]
+from cryptography.hazmat.primitives.serialization import pkcs12  # pyright: ignore[reportMissingImports]
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # pyright: ignore[reportMissingImports]
+from dotenv import dotenv_values, set_key, find_dotenv  # pyright: ignore[reportMissingImports]
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from _env import load_env
+from src.infrastructure.logger import get_logger
+from src.utils.criptografia_utils import (
+    derivar_chave_aesgcm,
+    criptografar,
+    descriptografar,
+    escrever_bundle,
+    ler_bundle,
+)
+
+logger = get_logger(__name__)
+
+# Carrega variáveis de ambiente do arquivo .env (uma única vez por processo)
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(backend_dir, ".env")
-load_dotenv(env_path)  # Carrega do diretório Backend
-load_dotenv()  # Também tenta do diretório atual
+load_env()
+
+# Lock que coordena a geração da chave entre os workers da máquina: sem ele,
+# cada worker iniciado sem FERNET_KEY geraria (e gravaria no .env) uma chave
+# diferente. O arquivo fica ao lado do .env, na pasta do backend.
+_ENV_LOCK_PATH = env_path + ".lock"
+
+
+@contextmanager
+def _lock_env():
+    """
+    Mantém um lock exclusivo (flock) do .env enquanto a chave é lida/gerada.
+
+    Em sistemas sem fcntl (Windows) não há lock: cada processo segue direto.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    fd = os.open(_ENV_LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _salvar_chave_env(env_file: str, chave: str) -> None:
+    """Grava a chave gerada no .env (criando o arquivo, se necessário)."""
+    # Se o arquivo não existe, cria um novo
+    if not os.path.exists(env_file):
+        with open(env_file, 'w') as f:
+            f.write(f"# Chave Fernet para criptografia de certificados\n")
+            f.write(f"# Esta chave foi gerada automaticamente - NÃO altere ou perca esta chave!\n")
+            f.write(f"# Se você perder esta chave, não conseguirá descriptografar os certificados salvos.\n")
+            f.write(f"FERNET_KEY={chave}\n")
+    else:
+        # Adiciona ou atualiza a chave no arquivo existente
+        set_key(env_file, "FERNET_KEY", chave)
+
 
 # SEMPRE usa uma chave fixa persistente no arquivo .env
 # Se não existir, gera UMA chave e salva no .env para uso permanente
@@ -17,44 +79,46 @@ env_key = os.getenv("FERNET_KEY")
 if env_key:
     # Chave encontrada no ambiente/.env - usa ela
     FERNET_KEY = env_key
-    print(f"✅ Usando chave FERNET_KEY do arquivo .env")
+    logger.debug("Usando chave FERNET_KEY do arquivo .env")
 else:
-    # Chave não encontrada - gera UMA chave e SALVA no .env permanentemente
-    print("⚠️  FERNET_KEY não encontrada. Gerando chave permanente...")
-    generated_key = Fernet.generate_key()
-    FERNET_KEY = generated_key.decode()  # Converte bytes para string
-    
-    # Salva a chave no arquivo .env
+    # Tenta encontrar o arquivo .env ou criar um novo
+    env_file = find_dotenv(env_path) or env_path
     try:
-        # Tenta encontrar o arquivo .env ou criar um novo
-        env_file = find_dotenv(env_path) or env_path
-        
-        # Se o arquivo não existe, cria um novo
-        if not os.path.exists(env_file):
-            with open(env_file, 'w') as f:
-                f.write(f"# Chave Fernet para criptografia de certificados\n")
-                f.write(f"# Esta chave foi gerada automaticamente - NÃO altere ou perca esta chave!\n")
-                f.write(f"# Se você perder esta chave, não conseguirá descriptografar os certificados salvos.\n")
-                f.write(f"FERNET_KEY={FERNET_KEY}\n")
-        else:
-            # Adiciona ou atualiza a chave no arquivo existente
-            set_key(env_file, "FERNET_KEY", FERNET_KEY)
-        
-        print(f"✅ Chave FERNET_KEY gerada e salva permanentemente em: {env_file}")
-        print(f"   Chave: {FERNET_KEY[:40]}...")
-        print(f"   ⚠️  IMPORTANTE: Esta chave foi salva no arquivo .env")
-        print(f"   ⚠️  NÃO delete ou altere esta chave, ou você perderá acesso aos certificados!")
-        
-        # Recarrega o .env para garantir que está disponível
-        load_dotenv(env_file, override=True)
+        with _lock_env():
+            # Outro worker pode ter gravado a chave enquanto este aguardava o lock
+            env_key = dotenv_values(env_file).get("FERNET_KEY") if os.path.exists(env_file) else None
+            if env_key:
+                FERNET_KEY = env_key
+                logger.debug("Usando chave FERNET_KEY gerada por outro worker")
+            else:
+                # Chave não encontrada - gera UMA chave e SALVA no .env permanentemente
+                logger.warning("FERNET_KEY não encontrada. Gerando chave permanente...")
+                FERNET_KEY = Fernet.generate_key().decode()  # Converte bytes para string
+                _salvar_chave_env(env_file, FERNET_KEY)
+                logger.warning("Chave FERNET_KEY gerada e salva permanentemente em: %s", env_file)
+                logger.warning("IMPORTANTE: NÃO delete ou altere esta chave, ou você perderá acesso aos certificados!")
         
+        # Disponibiliza a chave no ambiente sem reler o .env
+        os.environ["FERNET_KEY"] = FERNET_KEY
+    
     except Exception as e:
-        print(f"❌ ERRO ao salvar chave no .env: {str(e)}")
-        print(f"   Usando chave temporária (NÃO RECOMENDADO)")
-        print(f"   Para corrigir, adicione manualmente no arquivo {env_path}:")
-        print(f"   FERNET_KEY={FERNET_KEY}")
+        FERNET_KEY = Fernet.generate_key().decode()
+        logger.error("ERRO ao salvar chave no .env: %s", e)
+        logger.error("Usando chave temporária (NÃO RECOMENDADO)")
+        logger.error("Para corrigir, adicione manualmente no arquivo %s: FERNET_KEY=%s", env_path, FERNET_KEY)
+
+
+@functools.cache
+def _fernet() -> Fernet:
+    """Instância Fernet (apenas leitura de arquivos legados), criada no primeiro uso."""
+    return Fernet(FERNET_KEY)
+
+
+@functools.cache
+def _aesgcm() -> AESGCM:
+    """Instância AES-GCM usada para gravar e ler certificados, criada no primeiro uso."""
+    return AESGCM(derivar_chave_aesgcm(FERNET_KEY))
 
-fernet = Fernet(FERNET_KEY)
 
 # Pasta onde os certificados serão guardados
 # Salva dentro da pasta Backend, funcionando em qualquer OS
@@ -63,43 +127,41 @@ BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 BASE_DIR = os.path.join(BACKEND_DIR, "certificados_armazenados")
 os.makedirs(BASE_DIR, exist_ok=True)
 
+# Modelos de caminho pré-montados (o CNPJ já chega sanitizado, só dígitos)
+_BUNDLE_TPL = f"{BASE_DIR}{os.sep}{{}}.bundle.enc"
+_PFX_TPL = f"{BASE_DIR}{os.sep}{{}}.pfx.enc"
+_PWD_TPL = f"{BASE_DIR}{os.sep}{{}}.pwd.enc"
+
 # Log para debug - mostra onde está salvando
-print(f"📁 Certificados serão salvos em: {BASE_DIR}")
+logger.debug("Certificados serão salvos em: %s", BASE_DIR)
 
 def salvar_certificado(cnpj: str, conteudo_pfx: bytes, senha: str):
     """
     Criptografa e salva o certificado e a senha no disco.
     """
     try:
-        encrypted_pfx = fernet.encrypt(conteudo_pfx)
-        encrypted_pwd = fernet.encrypt(senha.encode())
-
-        file_path = os.path.join(BASE_DIR, f"{cnpj}.pfx.enc")
-        pwd_path = os.path.join(BASE_DIR, f"{cnpj}.pwd.enc")
+        aesgcm = _aesgcm()
+        encrypted_pfx = criptografar(aesgcm, conteudo_pfx)
+        encrypted_pwd = criptografar(aesgcm, senha.encode())
 
-        print(f"💾 Salvando certificado em: {file_path}")
-        print(f"💾 Salvando senha em: {pwd_path}")
+        bundle_path = _BUNDLE_TPL.format(cnpj)
 
-        with open(file_path, "wb") as f:
-            f.write(encrypted_pfx)
+        logger.debug("Salvando certificado e senha em: %s", bundle_path)
 
-        with open(pwd_path, "wb") as f:
-            f.write(encrypted_pwd)
+        escrever_bundle(bundle_path, encrypted_pfx, encrypted_pwd)
         
-        print(f"✅ Certificado salvo com sucesso para CNPJ: {cnpj}")
+        logger.debug("Certificado salvo com sucesso para CNPJ: %s", cnpj)
     except PermissionError as e:
         error_msg = f"Sem permissão para escrever em {BASE_DIR}: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error(error_msg)
         raise PermissionError(error_msg)
     except OSError as e:
         error_msg = f"Erro ao salvar arquivo em {BASE_DIR}: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error(error_msg)
         raise OSError(error_msg)
     except Exception as e:
-        import traceback
         error_msg = f"Erro inesperado ao salvar certificado: {str(e)}"
-        print(f"❌ {error_msg}")
-        print(traceback.format_exc())
+        logger.error(error_msg, exc_info=True)
         raise Exception(error_msg)
 
 def carregar_certificado(cnpj: str):
@@ -113,20 +175,27 @@ def carregar_certificado(cnpj: str):
     if not cnpj_str:
         raise ValueError(f"CNPJ inválido: {cnpj}")
     
-    file_path = os.path.join(BASE_DIR, f"{cnpj_str}.pfx.enc")
-    pwd_path = os.path.join(BASE_DIR, f"{cnpj_str}.pwd.enc")
-
-    if not os.path.exists(file_path) or not os.path.exists(pwd_path):
-        raise FileNotFoundError(f"Certificado ou senha não encontrados para CNPJ: {cnpj_str}")
+    bundle_path = _BUNDLE_TPL.format(cnpj_str)
+    # Formato legado: certificado e senha em arquivos separados
+    file_path = _PFX_TPL.format(cnpj_str)
+    pwd_path = _PWD_TPL.format(cnpj_str)
 
+    # Sem os.path.exists: o próprio open() sinaliza a ausência do arquivo
     try:
-        with open(file_path, "rb") as f:
-            encrypted_pfx = f.read()
-        with open(pwd_path, "rb") as f:
-            encrypted_pwd = f.read()
-
-        conteudo_pfx = fernet.decrypt(encrypted_pfx)
-        senha_bytes = fernet.decrypt(encrypted_pwd)
+        try:
+            encrypted_pfx, encrypted_pwd = ler_bundle(bundle_path)
+        except FileNotFoundError:
+            try:
+                with open(file_path, "rb") as f:
+                    encrypted_pfx = f.read()
+                with open(pwd_path, "rb") as f:
+                    encrypted_pwd = f.read()
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Certificado ou senha não encontrados para CNPJ: {cnpj_str}") from None
+
+        aesgcm, fernet = _aesgcm(), _fernet()
+        conteudo_pfx = descriptografar(aesgcm, fernet, encrypted_pfx)
+        senha_bytes = descriptografar(aesgcm, fernet, encrypted_pwd)
         
         if senha_bytes is None:
             raise ValueError(f"Senha descriptografada está None para CNPJ: {cnpj_str}")
@@ -137,5 +206,44 @@ def carregar_certificado(cnpj: str):
             raise ValueError(f"Senha descriptografada está vazia para CNPJ: {cnpj_str}")
 
         return conteudo_pfx, senha
+    except FileNotFoundError:
+        raise
     except Exception as e:
-        raise Exception(f"Erro ao carregar certificado para CNPJ {cnpj_str}: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Erro ao carregar certificado para CNPJ {cnpj_str}: {str(e)}")
+
+
+def _common_name_armazenado(cnpj: str) -> Optional[str]:
+    """
+    Carrega o certificado salvo de um CNPJ e retorna o Common Name do titular.
+    """
+    conteudo_pfx, senha = carregar_certificado(cnpj)
+    _, cert, _ = pkcs12.load_key_and_certificates(conteudo_pfx, senha.encode())
+    if cert is None:
+        raise ValueError(f"Certificado não encontrado no PKCS12 do CNPJ: {cnpj}")
+    atributos_cn = cert.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    return atributos_cn[0].value if atributos_cn else None
+
+
+def validar_certificados_em_lote(cnpjs: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Valida vários certificados armazenados em paralelo.
+
+    A descriptografia e o parse PKCS12 acontecem no OpenSSL, que libera o GIL,
+    então as threads realmente rodam em paralelo entre os núcleos.
+
+    Returns:
+        Dicionário {cnpj: common_name} apenas com os certificados válidos
+    """
+    cnpjs = list(dict.fromkeys(cnpjs))
+    if not cnpjs:
+        return {}
+
+    resultado: Dict[str, Optional[str]] = {}
+    with ThreadPoolExecutor(max_workers=min(len(cnpjs), os.cpu_count() or 1)) as executor:
+        futuros = {cnpj: executor.submit(_common_name_armazenado, cnpj) for cnpj in cnpjs}
+        for cnpj, futuro in futuros.items():
+            try:
+                resultado[cnpj] = futuro.result()
+            except Exception as e:
+                logger.warning("Certificado inválido para CNPJ %s: %s", cnpj, e)
+    return resultado
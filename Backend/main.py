@@ -5,19 +5,20 @@ Este arquivo configura e inicializa o servidor FastAPI, registra os routers
 e configura middlewares (CORS, tratamento de erros, etc.).
 """
 
+import logging
 import os
 import sys
-from dotenv import load_dotenv
+import traceback
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 
+from _env import load_env
+
 # IMPORTANTE: Carregar .env ANTES de importar qualquer módulo que use configurações
 backend_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(backend_dir, ".env")
-load_dotenv(env_path)
-load_dotenv()  # Também tenta do diretório atual
+load_env()
 
 # Adiciona src ao path para importar módulos
 src_path = os.path.join(backend_dir, "src")
@@ -38,7 +39,7 @@ try:
     init_db()
     logger.info("✅ Banco de dados de certificados inicializado")
 except Exception as e:
-    logger.warning(f"⚠️  Erro ao inicializar banco de dados de certificados: {e}")
+    logger.warning("⚠️  Erro ao inicializar banco de dados de certificados: %s", e)
     logger.warning("   A aplicação continuará, mas funcionalidades de persistência podem não funcionar")
 
 # Cria a aplicação FastAPI
@@ -50,6 +51,7 @@ app = FastAPI(
     - **Segurança**: Certificados digitais ICP-Brasil criptografados
     - **Automação**: Portal NFSe Nacional via Playwright
     """,
+    default_response_class=ORJSONResponse,
 )
 
 # Handler global para erros de validação do FastAPI
@@ -67,13 +69,10 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
             "type": error.get("type")
         })
     
-    logger.warning(f"Erro de validação: {error_details}")
-    return JSONResponse(
+    logger.warning("Erro de validação: %s", error_details)
+    # Os headers CORS são adicionados pelo CORSMiddleware
+    return ORJSONResponse(
         status_code=400,
-        headers={
-            "Access-Control-Allow-Origin": request.headers.get("origin", "*"),
-            "Access-Control-Allow-Credentials": "true",
-        },
         content={
             "detail": "Erro de validação nos dados enviados",
             "errors": error_details
@@ -91,17 +90,15 @@ async def global_exception_handler(request: Request, exc: Exception):
     if isinstance(exc, HTTPException):
         raise exc
     
-    import traceback
     error_trace = traceback.format_exc()
-    logger.error(f"Erro não tratado: {str(exc)}", exc_info=True)
-    logger.error(f"Traceback completo:\n{error_trace}")
+    logger.error("Erro não tratado: %s", exc, exc_info=True)
+    logger.error("Traceback completo:\n%s", error_trace)
     
-    return JSONResponse(
+    # O handler de Exception roda no ServerErrorMiddleware, fora do CORSMiddleware,
+    # então os headers CORS vêm da tabela pré-calculada por origem permitida
+    return ORJSONResponse(
         status_code=500,
-        headers={
-            "Access-Control-Allow-Origin": request.headers.get("origin", "*"),
-            "Access-Control-Allow-Credentials": "true",
-        },
+        headers=_CORS_HEADERS_POR_ORIGEM.get(request.headers.get("origin")),
         content={
             "detail": f"Erro interno do servidor: {str(exc)}",
             "type": type(exc).__name__
@@ -116,7 +113,17 @@ cors_origins = CORS_ORIGINS or [
     "http://127.0.0.1:1234",
 ]
 
-logger.info(f"Configurando CORS com origens: {cors_origins}")
+logger.info("Configurando CORS com origens: %s", cors_origins)
+
+# Headers CORS das respostas de erro 500, montados uma única vez por origem
+_CORS_HEADERS_POR_ORIGEM = {
+    origem: {
+        "Access-Control-Allow-Origin": origem,
+        "Access-Control-Allow-Credentials": "true",
+        "Vary": "Origin",
+    }
+    for origem in cors_origins
+}
 
 app.add_middleware(
     CORSMiddleware,
@@ -140,8 +147,8 @@ try:
     
     from src.routers.execucao import router as execucao_router
     logger.info("✅ Router Execução importado")
-    logger.info(f"   Prefixo do router execucao: {execucao_router.prefix}")
-    logger.info(f"   Rotas do router execucao: {[route.path for route in execucao_router.routes]}")
+    logger.info("   Prefixo do router execucao: %s", execucao_router.prefix)
+    logger.debug("   Rotas do router execucao: %s", [route.path for route in execucao_router.routes])
     
     from src.routers.empresas import router as empresas_router
     logger.info("✅ Router Empresas importado")
@@ -164,18 +171,18 @@ try:
     app.include_router(certificado_router)
     app.include_router(settings_router)
     
-    # Lista todas as rotas registradas para debug
-    logger.info("📋 Rotas registradas na aplicação:")
-    for route in app.routes:
-        if hasattr(route, 'path') and hasattr(route, 'methods'):
-            methods = ', '.join(route.methods) if route.methods else 'N/A'
-            logger.info(f"   {methods} {route.path}")
+    # Lista todas as rotas registradas (apenas com log em DEBUG)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📋 Rotas registradas na aplicação:")
+        for route in app.routes:
+            if hasattr(route, 'path') and hasattr(route, 'methods'):
+                methods = ', '.join(route.methods) if route.methods else 'N/A'
+                logger.debug("   %s %s", methods, route.path)
     
     logger.info("✅ Todos os routers foram registrados com sucesso!")
 except Exception as e:
-    logger.error(f"❌ ERRO ao carregar routers: {e}", exc_info=True)
-    import traceback
-    logger.error(f"Traceback completo:\n{traceback.format_exc()}")
+    logger.error("❌ ERRO ao carregar routers: %s", e, exc_info=True)
+    logger.error("Traceback completo:\n%s", traceback.format_exc())
     logger.warning("   Algumas funcionalidades podem não estar disponíveis")
 
 # Endpoint de health check
@@ -184,17 +191,18 @@ def health():
     """Endpoint de health check."""
     return {"status": "ok", "message": "AutoNacional API está funcionando"}
 
-# Endpoint de debug para listar todas as rotas
-@app.get("/debug/routes", tags=["Debug"])
-def list_routes():
-    """Lista todas as rotas registradas na aplicação (apenas para debug)."""
-    routes = []
-    for route in app.routes:
-        if hasattr(route, 'path') and hasattr(route, 'methods'):
-            methods = list(route.methods) if route.methods else []
-            routes.append({
-                "path": route.path,
-                "methods": methods,
-                "name": getattr(route, 'name', 'N/A')
-            })
-    return {"routes": routes, "total": len(routes)}
+# Endpoint de debug para listar todas as rotas (habilitado com ENABLE_DEBUG_ROUTES)
+if os.getenv("ENABLE_DEBUG_ROUTES"):
+    @app.get("/debug/routes", tags=["Debug"])
+    def list_routes():
+        """Lista todas as rotas registradas na aplicação (apenas para debug)."""
+        routes = []
+        for route in app.routes:
+            if hasattr(route, 'path') and hasattr(route, 'methods'):
+                methods = list(route.methods) if route.methods else []
+                routes.append({
+                    "path": route.path,
+                    "methods": methods,
+                    "name": getattr(route, 'name', 'N/A')
+                })
+        return {"routes": routes, "total": len(routes)}
@@ -9,9 +9,12 @@ Este script ajuda a identificar problemas comuns:
 4. Problemas com requisições HTTP
 """
 
+import argparse
 import sys
 import os
+import traceback
 from pathlib import Path
+from typing import Dict, List, Optional
 
 # Adiciona o diretório do script ao path
 script_dir = Path(__file__).parent
@@ -27,6 +30,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_HREF_XML = "/EmissorNacional/Notas/Download/NFSe/"
+_HREF_PDF = "/EmissorNacional/Notas/Download/DANFSe/"
+
+# Coleta href e texto dos links de todos os menus encontrados
+_JS_LINKS_MENU = """
+menus => menus.flatMap(menu => Array.from(menu.querySelectorAll('a'), a => ({
+    href: a.getAttribute('href'),
+    texto: a.innerText,
+})))
+"""
+
+# Lê competência e hrefs de download de todas as linhas da tabela de uma vez
+_JS_LINHAS_TABELA = """
+(linhas, [hrefXml, hrefPdf]) => linhas.map(tr => {
+    const buscarHref = trecho => {
+        const link = tr.querySelector(`a[href*="${trecho}"]`);
+        return link ? link.getAttribute('href') : null;
+    };
+    const celulaCompetencia = tr.children[2];
+    return {
+        competencia: celulaCompetencia ? celulaCompetencia.innerText.trim() : null,
+        xml: buscarHref(hrefXml),
+        pdf: buscarHref(hrefPdf),
+    };
+})
+"""
+
+
+def _possui_link_download(links: List[Dict[str, Optional[str]]]) -> bool:
+    """Indica se algum dos links lidos do menu é de download (XML ou DANFSe)."""
+    return any(
+        _HREF_XML in href or _HREF_PDF in href
+        for href in (link['href'] or '' for link in links)
+    )
+
+
+def coletar_linhas(page: Page) -> List[Dict[str, Optional[str]]]:
+    """
+    Coleta os dados de todas as linhas da tabela em uma única chamada ao navegador.
+    
+    Args:
+        page: Página do Playwright com a tabela de notas carregada
+        
+    Returns:
+        Lista (na ordem da tabela) de dicts com competencia, xml e pdf; os
+        hrefs são None quando o link não está no DOM da linha
+    """
+    return page.locator("table tbody tr").evaluate_all(_JS_LINHAS_TABELA, [_HREF_XML, _HREF_PDF])
+
 
 def diagnosticar_seletores(page: Page, linha_index: int = 0):
     """
@@ -42,9 +94,9 @@ def diagnosticar_seletores(page: Page, linha_index: int = 0):
         # Aguarda tabela carregar
         page.wait_for_selector("table tbody tr", timeout=10000)
         
-        # Obtém todas as linhas
-        linhas = page.locator("table tbody tr")
-        total_linhas = linhas.count()
+        # Obtém os dados de todas as linhas
+        dados_linhas = coletar_linhas(page)
+        total_linhas = len(dados_linhas)
         
         logger.info(f"📊 Total de linhas encontradas: {total_linhas}")
         
@@ -53,16 +105,18 @@ def diagnosticar_seletores(page: Page, linha_index: int = 0):
             return
         
         # Obtém a linha específica
-        linha = linhas.nth(linha_index)
+        linha = page.locator("table tbody tr").nth(linha_index)
         celulas = linha.locator("td")
         
         # Lê informações da linha
+        dados_linha = dados_linhas[linha_index]
         logger.info(f"📋 Informações da linha {linha_index + 1}:")
-        try:
-            competencia = celulas.nth(2).inner_text()
-            logger.info(f"   Competência: {competencia.strip()}")
-        except Exception as e:
-            logger.warning(f"   ⚠️ Erro ao ler competência: {e}")
+        if dados_linha['competencia'] is not None:
+            logger.info(f"   Competência: {dados_linha['competencia']}")
+        else:
+            logger.warning(f"   ⚠️ Célula de competência não encontrada")
+        logger.info(f"   Href XML no DOM (sem abrir o menu): {dados_linha['xml']}")
+        logger.info(f"   Href PDF no DOM (sem abrir o menu): {dados_linha['pdf']}")
         
         # Tenta encontrar o menu suspenso
         logger.info(f"🔍 Procurando menu suspenso...")
@@ -81,82 +135,92 @@ def diagnosticar_seletores(page: Page, linha_index: int = 0):
         except Exception as e:
             logger.warning(f"   ⚠️ Erro ao verificar visibilidade: {e}")
         
-        # Tenta encontrar o ícone de ações
-        logger.info(f"🔍 Procurando ícone de ações...")
-        coluna_acoes_idx = 5  # Para recebidas
         try:
-            coluna_acoes = celulas.nth(coluna_acoes_idx)
-            icone_acoes = coluna_acoes.locator("div a i, a i").first
-            icone_count = icone_acoes.count()
-            logger.info(f"   Ícone de ações encontrado: {icone_count} ocorrência(s)")
+            # Os links do menu normalmente já estão no DOM (apenas ocultos); o
+            # menu só é aberto quando eles ainda não foram renderizados
+            links = menu_suspenso.evaluate_all(_JS_LINKS_MENU)
             
-            if icone_count > 0:
+            if _possui_link_download(links):
+                logger.info(f"✅ Links de download já presentes no DOM, sem abrir o menu")
+            else:
+                # Tenta encontrar o ícone de ações
+                logger.info(f"🔍 Procurando ícone de ações...")
+                coluna_acoes_idx = 5  # Para recebidas
+                coluna_acoes = celulas.nth(coluna_acoes_idx)
+                icone_acoes = coluna_acoes.locator("div a i, a i").first
+                icone_count = icone_acoes.count()
+                logger.info(f"   Ícone de ações encontrado: {icone_count} ocorrência(s)")
+                
+                if icone_count == 0:
+                    logger.error(f"❌ Ícone de ações não encontrado")
+                    return
+                
                 # Tenta clicar no ícone
                 logger.info(f"🖱️ Clicando no ícone de ações...")
                 icone_acoes.click()
-                page.wait_for_timeout(500)
                 
-                # Aguarda menu aparecer
+                # Aguarda menu aparecer (sem espera fixa após o clique)
                 menu_suspenso.first.wait_for(state='visible', timeout=3000)
                 logger.info(f"✅ Menu aberto com sucesso")
                 
-                # Tenta encontrar links dentro do menu
-                logger.info(f"🔍 Procurando links dentro do menu...")
-                
-                # Link XML
-                link_xml = menu_suspenso.locator('a[href*="/EmissorNacional/Notas/Download/NFSe/"]').first
-                xml_count = link_xml.count()
-                logger.info(f"   Link XML encontrado: {xml_count} ocorrência(s)")
-                
-                if xml_count > 0:
-                    try:
-                        href_xml = link_xml.get_attribute('href')
-                        logger.info(f"   ✅ Href XML: {href_xml}")
-                    except Exception as e:
-                        logger.error(f"   ❌ Erro ao obter href XML: {e}")
-                else:
-                    logger.warning(f"   ⚠️ Link XML não encontrado")
-                
-                # Link PDF
-                link_pdf = menu_suspenso.locator('a[href*="/EmissorNacional/Notas/Download/DANFSe/"]').first
-                pdf_count = link_pdf.count()
-                logger.info(f"   Link PDF encontrado: {pdf_count} ocorrência(s)")
-                
-                if pdf_count > 0:
-                    try:
-                        href_pdf = link_pdf.get_attribute('href')
-                        logger.info(f"   ✅ Href PDF: {href_pdf}")
-                    except Exception as e:
-                        logger.error(f"   ❌ Erro ao obter href PDF: {e}")
-                else:
-                    logger.warning(f"   ⚠️ Link PDF não encontrado")
-                
-                # Lista todos os links dentro do menu
-                logger.info(f"🔍 Listando todos os links dentro do menu...")
-                todos_links = menu_suspenso.locator('a').all()
-                logger.info(f"   Total de links encontrados: {len(todos_links)}")
-                
-                for i, link in enumerate(todos_links):
-                    try:
-                        href = link.get_attribute('href')
-                        texto = link.inner_text()
-                        logger.info(f"   Link {i+1}: href='{href}', texto='{texto}'")
-                    except Exception as e:
-                        logger.warning(f"   ⚠️ Erro ao ler link {i+1}: {e}")
-                
+                # Lê href e texto de todos os links em uma única chamada ao navegador
+                links = menu_suspenso.evaluate_all(_JS_LINKS_MENU)
+            
+            # Tenta encontrar links dentro do menu
+            logger.info(f"🔍 Procurando links dentro do menu...")
+            
+            # Link XML
+            hrefs_xml = [link['href'] for link in links if _HREF_XML in (link['href'] or '')]
+            logger.info(f"   Link XML encontrado: {len(hrefs_xml)} ocorrência(s)")
+            
+            if hrefs_xml:
+                logger.info(f"   ✅ Href XML: {hrefs_xml[0]}")
             else:
-                logger.error(f"❌ Ícone de ações não encontrado")
-        except Exception as e:
-            logger.error(f"❌ Erro ao processar ícone de ações: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+                logger.warning(f"   ⚠️ Link XML não encontrado")
+            
+            # Link PDF
+            hrefs_pdf = [link['href'] for link in links if _HREF_PDF in (link['href'] or '')]
+            logger.info(f"   Link PDF encontrado: {len(hrefs_pdf)} ocorrência(s)")
+            
+            if hrefs_pdf:
+                logger.info(f"   ✅ Href PDF: {hrefs_pdf[0]}")
+            else:
+                logger.warning(f"   ⚠️ Link PDF não encontrado")
+            
+            # Lista todos os links dentro do menu
+            logger.info(f"🔍 Listando todos os links dentro do menu...")
+            logger.info(f"   Total de links encontrados: {len(links)}")
+            
+            for i, link in enumerate(links):
+                logger.info(f"   Link {i+1}: href='{link['href']}', texto='{link['texto']}'")
+            
+        except PlaywrightTimeoutError:
+            logger.error(f"❌ Timeout ao abrir o menu de ações")
+        except Exception:
+            logger.exception(f"❌ Erro ao processar ícone de ações")
         
     except PlaywrightTimeoutError:
         logger.error(f"❌ Timeout ao aguardar elementos")
-    except Exception as e:
-        logger.error(f"❌ Erro durante diagnóstico: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+    except Exception:
+        logger.exception(f"❌ Erro durante diagnóstico")
+
+
+def _fechar_navegador(resultado) -> None:
+    """
+    Fecha o contexto do navegador aberto por abrir_dashboard_nfse.
+    
+    O Chromium e o Playwright são compartilhados pelo playwright_nfse e
+    encerrados por ele ao final do processo.
+    
+    Args:
+        resultado: Dicionário retornado por abrir_dashboard_nfse (ou None)
+    """
+    if not resultado:
+        return
+    
+    context = resultado.get('context')
+    if context:
+        context.close()
 
 
 def main():
@@ -166,21 +230,39 @@ def main():
     print("=" * 80)
     print()
     
-    if len(sys.argv) < 2:
-        print("Uso: python debug_download.py <cnpj> [linha_index]")
-        print()
-        print("Exemplo:")
-        print("  python debug_download.py 12345678000190 0  # Primeira linha")
-        print("  python debug_download.py 12345678000190 1  # Segunda linha")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Diagnostica seletores e links de download de linhas das Notas Recebidas",
+        epilog="Exemplo: python debug_download.py 12345678000190 0 1 2  # Três primeiras linhas"
+    )
+    
+    parser.add_argument('cnpj', help='CNPJ da empresa (apenas números)')
+    
+    parser.add_argument(
+        'linhas',
+        type=int,
+        nargs='*',
+        default=[0],
+        help='Índices das linhas a diagnosticar (0 = primeira linha); todas usam o mesmo login'
+    )
     
-    cnpj = sys.argv[1]
-    linha_index = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    parser.add_argument(
+        '--keep-open',
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help='Mantém o navegador aberto até Enter ser pressionado '
+             '(padrão: apenas quando executado em um terminal interativo)'
+    )
+    
+    args = parser.parse_args()
+    cnpj = args.cnpj
+    linhas = args.linhas
+    manter_aberto = sys.stdin.isatty() if args.keep_open is None else args.keep_open
     
     print(f"CNPJ: {cnpj}")
-    print(f"Linha a diagnosticar: {linha_index + 1}")
+    print(f"Linha(s) a diagnosticar: {', '.join(str(linha + 1) for linha in linhas)}")
     print()
     
+    resultado = None
     try:
         from playwright_nfse import abrir_dashboard_nfse
         
@@ -209,22 +291,26 @@ def main():
         print("✅ Página carregada")
         print()
         
-        # Executa diagnóstico
-        diagnosticar_seletores(page, linha_index)
+        # Executa diagnóstico de todas as linhas na mesma sessão
+        for linha_index in linhas:
+            diagnosticar_seletores(page, linha_index)
         
         print()
         print("=" * 80)
         print("✅ Diagnóstico concluído")
         print("=" * 80)
-        print()
-        print("⏸️  Navegador aberto. Pressione Enter para fechar...")
-        input()
+        
+        if manter_aberto:
+            print()
+            print("⏸️  Navegador aberto. Pressione Enter para fechar...")
+            input()
         
     except Exception as e:
         print(f"❌ Erro durante execução: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        _fechar_navegador(resultado)
 
 
 if __name__ == "__main__":
@@ -9,13 +9,15 @@ Suporta duas estratégias:
 2. Download direto via HTTP (page.request.get) - RECOMENDADO
 """
 
+import asyncio
+import functools
 import logging
 import re
 import time
 from pathlib import Path
-from typing import Optional, Callable, Awaitable
-from urllib.parse import urljoin, urlparse
-from playwright.async_api import Page, Download, APIResponse
+from typing import Any, Dict, List, Optional, Callable, Awaitable, Set, Union
+from urllib.parse import unquote, urljoin, urlsplit
+from playwright.async_api import Page, Download, APIRequestContext, APIResponse
 
 logger = logging.getLogger(__name__)
 
@@ -25,13 +27,43 @@ logger = logging.getLogger(__name__)
 BACKEND_DIR = Path(__file__).parent.parent.parent.resolve()  # Resolve para caminho absoluto
 DOWNLOADS_TESTE_DIR = BACKEND_DIR / "downloads_teste"
 
-logger.debug(f"Caminho do backend calculado: {BACKEND_DIR}")
-logger.debug(f"Caminho de downloads de teste: {DOWNLOADS_TESTE_DIR}")
+logger.debug("Caminho do backend calculado: %s", BACKEND_DIR)
+logger.debug("Caminho de downloads de teste: %s", DOWNLOADS_TESTE_DIR)
 
 # Variável global para armazenar o caminho base de downloads
 # Se não configurado, usa o caminho de teste do backend
 _downloads_base_path: Optional[str] = None
 
+# Nome do arquivo no header Content-Disposition (filename="..." ou filename*=UTF-8''...)
+_CONTENT_DISPOSITION_RE = re.compile(r"""filename\*?\s*=\s*(?:[\w-]+'[^']*')?"?([^";]+)"?""", re.IGNORECASE)
+
+# Padrões usados na sanitização de nomes de arquivo e pasta
+_CARACTERES_INVALIDOS_ARQUIVO_RE = re.compile(r'[<>:"/\\|?*]')
+_CARACTERES_INVALIDOS_PASTA_RE = re.compile(r"[^\w\s\-]")
+_ESPACOS_RE = re.compile(r'\s+')
+
+# Assinaturas dos arquivos baixados, pelos 4 primeiros bytes. Qualquer
+# conteúdo iniciado por '<' também é tratado como XML.
+_EXTENSAO_POR_ASSINATURA = {b'%PDF': '.pdf', b'<?xm': '.xml'}
+
+# Retorna o href do primeiro elemento encontrado ('' se não tiver href)
+_JS_HREF_PRIMEIRO_LINK = "els => els.length ? (els[0].getAttribute('href') || '') : null"
+
+# Diretórios já criados neste processo (evita mkdir repetido a cada download)
+_diretorios_criados: Set[Path] = set()
+
+
+def _garantir_diretorio(caminho: Path) -> None:
+    """
+    Cria o diretório (e os pais) na primeira vez que ele é usado no processo.
+    
+    Args:
+        caminho: Diretório de destino
+    """
+    if caminho not in _diretorios_criados:
+        caminho.mkdir(parents=True, exist_ok=True)
+        _diretorios_criados.add(caminho)
+
 
 def set_downloads_base_path(path: str) -> None:
     """
@@ -50,7 +82,7 @@ def set_downloads_base_path(path: str) -> None:
     """
     global _downloads_base_path
     _downloads_base_path = path
-    logger.info(f"Caminho base de downloads configurado: {path}")
+    logger.info("Caminho base de downloads configurado: %s", path)
 
 
 def get_download_base_path() -> Path:
@@ -73,8 +105,8 @@ def get_download_base_path() -> Path:
     
     # Usa o caminho fixo de testes dentro do backend
     # Cria a pasta se não existir
-    DOWNLOADS_TESTE_DIR.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Caminho base não configurado. Usando caminho fixo de testes: {DOWNLOADS_TESTE_DIR}")
+    _garantir_diretorio(DOWNLOADS_TESTE_DIR)
+    logger.info("Caminho base não configurado. Usando caminho fixo de testes: %s", DOWNLOADS_TESTE_DIR)
     return DOWNLOADS_TESTE_DIR
 
 
@@ -91,6 +123,7 @@ def formatar_competencia_para_pasta(competencia: str) -> str:
     return competencia.replace("/", "-")
 
 
+@functools.lru_cache(maxsize=256)
 def sanitizar_nome_arquivo(nome: str) -> str:
     """
     Sanitiza o nome do arquivo removendo caracteres inválidos.
@@ -102,14 +135,15 @@ def sanitizar_nome_arquivo(nome: str) -> str:
         Nome sanitizado, sem caracteres problemáticos
     """
     # Remove caracteres inválidos para nomes de arquivo
-    nome = re.sub(r'[<>:"/\\|?*]', '_', nome)
+    nome = _CARACTERES_INVALIDOS_ARQUIVO_RE.sub('_', nome)
     # Remove espaços múltiplos e substitui por underscore
-    nome = re.sub(r'\s+', '_', nome)
+    nome = _ESPACOS_RE.sub('_', nome)
     # Remove espaços no início e fim
     nome = nome.strip()
     return nome
 
 
+@functools.lru_cache(maxsize=1024)
 def sanitizar_nome_pasta(nome: str) -> str:
     """
     Sanitiza o nome para uso como nome de pasta.
@@ -122,18 +156,83 @@ def sanitizar_nome_pasta(nome: str) -> str:
     """
     nome = nome.strip()
     # Remove caracteres que não são letras, números, espaços, underscore ou hífen
-    nome = re.sub(r"[^\w\s\-]", "", nome)
+    nome = _CARACTERES_INVALIDOS_PASTA_RE.sub("", nome)
     # Remove espaços múltiplos e substitui por espaço único
-    nome = re.sub(r"\s+", " ", nome)
+    nome = _ESPACOS_RE.sub(" ", nome)
     return nome
 
 
+def _extensao_pelo_conteudo(primeiros_bytes: bytes) -> Optional[str]:
+    """
+    Identifica XML ou PDF pela assinatura dos primeiros bytes do arquivo.
+    
+    Args:
+        primeiros_bytes: Início do conteúdo baixado
+        
+    Returns:
+        '.xml', '.pdf' ou None se a assinatura não for reconhecida
+    """
+    extensao = _EXTENSAO_POR_ASSINATURA.get(primeiros_bytes[:4])
+    if extensao is None and primeiros_bytes[:1] == b'<':
+        extensao = '.xml'
+    return extensao
+
+
+def _ler_primeiros_bytes(caminho: Path, tamanho: int = 4) -> bytes:
+    """
+    Lê os primeiros bytes de um arquivo (usado para identificar o tipo).
+    
+    Args:
+        caminho: Caminho do arquivo
+        tamanho: Quantidade de bytes lidos
+        
+    Returns:
+        Bytes lidos do início do arquivo
+    """
+    with open(caminho, 'rb') as f:
+        return f.read(tamanho)
+
+
+@functools.lru_cache(maxsize=64)
+def _origem_url(url: str) -> str:
+    """
+    Retorna esquema e host de uma URL (ex: "https://www.nfse.gov.br").
+    
+    Args:
+        url: URL completa da página atual
+        
+    Returns:
+        Origem da URL, sem caminho
+    """
+    partes = urlsplit(url)
+    return f"{partes.scheme}://{partes.netloc}"
+
+
+def _montar_url_absoluta(url_atual: str, href: str) -> str:
+    """
+    Monta a URL absoluta de um link da página.
+    
+    Os links de download do portal são relativos à raiz ("/EmissorNacional/..."),
+    então basta prefixar a origem da página; os demais casos usam urljoin.
+    
+    Args:
+        url_atual: URL da página onde o link foi encontrado
+        href: Valor do atributo href
+        
+    Returns:
+        URL absoluta
+    """
+    if href.startswith('/') and not href.startswith('//'):
+        return _origem_url(url_atual) + href
+    return urljoin(url_atual, href)
+
+
 async def detectar_extensao_arquivo(download: Download) -> str:
     """
     Detecta a extensão correta do arquivo baixado.
     
     Ordem de detecção:
-    1. Tenta pelo content-type da resposta HTTP
+    1. Extensão do nome sugerido pelo servidor (Content-Disposition), sem tocar o disco
     2. Analisa o conteúdo real do arquivo (primeiros bytes)
     3. Fallback: retorna '.bin'
     
@@ -143,50 +242,30 @@ async def detectar_extensao_arquivo(download: Download) -> str:
     Returns:
         Extensão do arquivo (ex: '.xml', '.pdf', '.bin')
     """
-    extensao = None
+    # ETAPA 1: Nome sugerido, disponível assim que o download começa
+    extensao = Path(download.suggested_filename or '').suffix.lower()
+    if extensao in ('.xml', '.pdf'):
+        logger.debug("Extensão detectada pelo nome sugerido: %s", extensao)
+        return extensao
     
-    # ETAPA 1: Tentar detectar pelo content-type
+    # ETAPA 2: Analisa o conteúdo real do arquivo
+    extensao = None
     try:
-        # Aguarda o download completar para acessar informações
-        await download.path()
-        
-        # Tenta obter informações da resposta HTTP
-        # Nota: Playwright não expõe diretamente o content-type, então vamos
-        # tentar pela URL primeiro
-        url = str(download.url) if hasattr(download, 'url') else ''
+        # Lê os primeiros bytes do arquivo para identificar o tipo
+        # A leitura roda em thread para não bloquear downloads concorrentes
+        caminho_temp = await download.path()
+        primeiros_bytes = await asyncio.to_thread(_ler_primeiros_bytes, caminho_temp)
         
-        if 'xml' in url.lower() or 'application/xml' in url.lower():
-            extensao = '.xml'
-            logger.debug(f"Extensão detectada pela URL: {extensao}")
-        elif 'pdf' in url.lower() or 'danfse' in url.lower() or 'application/pdf' in url.lower():
-            extensao = '.pdf'
-            logger.debug(f"Extensão detectada pela URL: {extensao}")
+        extensao = _extensao_pelo_conteudo(primeiros_bytes)
+        if extensao:
+            logger.debug("Extensão detectada pelo conteúdo: %s", extensao)
     except Exception as e:
-        logger.warning(f"Erro ao detectar extensão pela URL: {e}")
-    
-    # ETAPA 2: Se não detectou, analisa o conteúdo real do arquivo
-    if not extensao:
-        try:
-            # Lê os primeiros bytes do arquivo para identificar o tipo
-            caminho_temp = await download.path()
-            
-            with open(caminho_temp, 'rb') as f:
-                primeiros_bytes = f.read(10)
-            
-            # Verifica assinatura do arquivo
-            if primeiros_bytes.startswith(b'<?xml') or primeiros_bytes.startswith(b'<'):
-                extensao = '.xml'
-                logger.debug(f"Extensão detectada pelo conteúdo (XML): {extensao}")
-            elif primeiros_bytes.startswith(b'%PDF'):
-                extensao = '.pdf'
-                logger.debug(f"Extensão detectada pelo conteúdo (PDF): {extensao}")
-        except Exception as e:
-            logger.warning(f"Erro ao detectar extensão pelo conteúdo: {e}")
+        logger.warning("Erro ao detectar extensão pelo conteúdo: %s", e)
     
     # ETAPA 3: Fallback
     if not extensao:
         extensao = '.bin'
-        logger.warning(f"Não foi possível detectar extensão. Usando fallback: {extensao}")
+        logger.warning("Não foi possível detectar extensão. Usando fallback: %s", extensao)
     
     return extensao
 
@@ -207,8 +286,24 @@ async def gerar_nome_arquivo(download: Download, extensao: str, prefixo: Optiona
     Returns:
         Nome do arquivo com extensão correta
     """
-    suggested_name = download.suggested_filename
+    return _montar_nome_arquivo(download.suggested_filename, extensao, prefixo)
+
+
+def _montar_nome_arquivo(suggested_name: Optional[str], extensao: str, prefixo: Optional[str] = None) -> str:
+    """
+    Aplica as regras de gerar_nome_arquivo a um nome sugerido já conhecido.
     
+    Usado também pelos downloads via HTTP, para que um arquivo tenha o mesmo
+    nome seja ele baixado pelo navegador ou pela requisição direta.
+    
+    Args:
+        suggested_name: Nome sugerido pelo servidor (Content-Disposition), se houver
+        extensao: Extensão detectada (ex: '.xml', '.pdf')
+        prefixo: Prefixo opcional para o nome (ex: 'nota_123')
+        
+    Returns:
+        Nome do arquivo com extensão correta
+    """
     # Verifica se o nome sugerido é válido
     # Considera inválido se: vazio, muito longo, ou não tem extensão conhecida
     nome_valido = (
@@ -222,7 +317,7 @@ async def gerar_nome_arquivo(download: Download, extensao: str, prefixo: Optiona
         # Usa o nome sugerido, mas garante extensão correta
         nome_base = Path(suggested_name).stem  # Remove extensão existente
         nome_final = f"{nome_base}{extensao}"
-        logger.debug(f"Usando nome sugerido: {nome_final}")
+        logger.debug("Usando nome sugerido: %s", nome_final)
     else:
         # Gera nome automático
         if prefixo:
@@ -230,7 +325,7 @@ async def gerar_nome_arquivo(download: Download, extensao: str, prefixo: Optiona
         else:
             timestamp = int(time.time())
             nome_final = f"nota_{timestamp}{extensao}"
-        logger.debug(f"Gerando nome automático: {nome_final}")
+        logger.debug("Gerando nome automático: %s", nome_final)
     
     # Sanitiza o nome final
     nome_final = sanitizar_nome_arquivo(nome_final)
@@ -276,8 +371,8 @@ def montar_caminho_completo(
     caminho_completo = base_path / comp_folder / empresa_folder / tipo_nota
     
     # Cria toda a hierarquia de pastas
-    caminho_completo.mkdir(parents=True, exist_ok=True)
-    logger.debug(f"Caminho completo montado: {caminho_completo}")
+    _garantir_diretorio(caminho_completo)
+    logger.debug("Caminho completo montado: %s", caminho_completo)
     
     return caminho_completo
 
@@ -318,24 +413,24 @@ async def salvar_download(
         ValueError: Se tipo_nota for inválido
         Exception: Se houver erro durante o download ou salvamento
     """
-    logger.info(f"Iniciando download: competencia={competencia}, empresa={empresa}, tipo={tipo_nota}")
+    logger.info("Iniciando download: competencia=%s, empresa=%s, tipo=%s", competencia, empresa, tipo_nota)
     
     # ETAPA 1: Intercepta o download
-    logger.debug(f"Aguardando download do seletor: {seletor}")
+    logger.debug("Aguardando download do seletor: %s", seletor)
     async with page.expect_download() as download_info:
         # Clica no elemento que dispara o download
         await page.click(seletor)
     
     download = await download_info.value
-    logger.debug(f"Download iniciado: {download.suggested_filename}")
+    logger.debug("Download iniciado: %s", download.suggested_filename)
     
     # ETAPA 2: Detecta extensão correta
     extensao = await detectar_extensao_arquivo(download)
-    logger.debug(f"Extensão detectada: {extensao}")
+    logger.debug("Extensão detectada: %s", extensao)
     
     # ETAPA 3: Gera nome do arquivo
     nome_arquivo = await gerar_nome_arquivo(download, extensao, nome_arquivo_prefixo)
-    logger.debug(f"Nome do arquivo gerado: {nome_arquivo}")
+    logger.debug("Nome do arquivo gerado: %s", nome_arquivo)
     
     # ETAPA 4: Monta caminho completo
     diretorio_destino = montar_caminho_completo(base_path, competencia, empresa, tipo_nota)
@@ -343,13 +438,10 @@ async def salvar_download(
     # ETAPA 5: Salva o arquivo no caminho final
     caminho_final = diretorio_destino / nome_arquivo
     
-    # Aguarda o download completar antes de salvar
-    await download.path()
-    
-    # Salva o arquivo
+    # Salva o arquivo (save_as já aguarda o download completar)
     await download.save_as(caminho_final)
     
-    logger.info(f"✅ Arquivo salvo com sucesso: {caminho_final}")
+    logger.info("✅ Arquivo salvo com sucesso: %s", caminho_final)
     
     return caminho_final
 
@@ -378,15 +470,15 @@ async def salvar_download_direto(
     Returns:
         Path do arquivo salvo
     """
-    logger.info(f"Processando download direto: competencia={competencia}, empresa={empresa}, tipo={tipo_nota}")
+    logger.info("Processando download direto: competencia=%s, empresa=%s, tipo=%s", competencia, empresa, tipo_nota)
     
     # Detecta extensão
     extensao = await detectar_extensao_arquivo(download)
-    logger.debug(f"Extensão detectada: {extensao}")
+    logger.debug("Extensão detectada: %s", extensao)
     
     # Gera nome do arquivo
     nome_arquivo = await gerar_nome_arquivo(download, extensao, nome_arquivo_prefixo)
-    logger.debug(f"Nome do arquivo gerado: {nome_arquivo}")
+    logger.debug("Nome do arquivo gerado: %s", nome_arquivo)
     
     # Monta caminho completo
     diretorio_destino = montar_caminho_completo(base_path, competencia, empresa, tipo_nota)
@@ -394,13 +486,10 @@ async def salvar_download_direto(
     # Salva o arquivo
     caminho_final = diretorio_destino / nome_arquivo
     
-    # Aguarda o download completar
-    await download.path()
-    
-    # Salva
+    # Salva (save_as já aguarda o download completar)
     await download.save_as(caminho_final)
     
-    logger.info(f"✅ Arquivo salvo com sucesso: {caminho_final}")
+    logger.info("✅ Arquivo salvo com sucesso: %s", caminho_final)
     
     return caminho_final
 
@@ -412,6 +501,7 @@ async def baixar_arquivo_direto(
     competencia: str,
     empresa: str,
     tipo_nota: str,
+    contexto_requisicao: Optional[APIRequestContext] = None,
 ) -> Path:
     """
     Baixa um arquivo diretamente via requisição HTTP usando a sessão autenticada do Playwright.
@@ -425,7 +515,7 @@ async def baixar_arquivo_direto(
     Fluxo:
     1. Localiza o link na página usando o seletor CSS
     2. Extrai o atributo href
-    3. Monta URL absoluta usando urljoin
+    3. Monta URL absoluta a partir da origem da página
     4. Faz requisição HTTP direta com page.request.get()
     5. Detecta extensão pelo content-type ou conteúdo
     6. Extrai chave da nota do href
@@ -439,6 +529,7 @@ async def baixar_arquivo_direto(
         competencia: Competência no formato "MM/AAAA" (ex: "10/2025")
         empresa: Nome da empresa (será sanitizado)
         tipo_nota: "Emitidas" ou "Recebidas"
+        contexto_requisicao: APIRequestContext usado na requisição (padrão: page.request)
         
     Returns:
         Path do arquivo salvo
@@ -468,57 +559,110 @@ async def baixar_arquivo_direto(
             tipo_nota="Emitidas"
         )
     """
-    logger.info(f"📥 Iniciando download direto via HTTP: tipo={tipo_nota}, competencia={competencia}, empresa={empresa}")
+    logger.info("📥 Iniciando download direto via HTTP: tipo=%s, competencia=%s, empresa=%s", tipo_nota, competencia, empresa)
     
     # ETAPA 1: Valida tipo_nota
     tipo_nota = tipo_nota.strip()
     if tipo_nota not in ["Emitidas", "Recebidas"]:
         raise ValueError(f"tipo_nota deve ser 'Emitidas' ou 'Recebidas'. Recebido: {tipo_nota}")
     
-    # ETAPA 2: Localiza o link na página
-    logger.debug(f"Buscando link com seletor: {seletor_link}")
-    link_element = page.locator(seletor_link).first
+    # ETAPA 2 e 3: Localiza o link e extrai o href em uma única chamada ao navegador
+    logger.debug("Buscando link com seletor: %s", seletor_link)
+    href = await page.locator(seletor_link).evaluate_all(_JS_HREF_PRIMEIRO_LINK)
     
-    if link_element.count() == 0:
+    if href is None:
         raise ValueError(f"Link não encontrado com seletor: {seletor_link}")
-    
-    # ETAPA 3: Extrai o href
-    href = await link_element.get_attribute('href')
     if not href:
         raise ValueError(f"Link encontrado mas href está vazio. Seletor: {seletor_link}")
     
-    logger.debug(f"Href extraído: {href}")
+    logger.debug("Href extraído: %s", href)
+    
+    return await baixar_href_direto(
+        page=page,
+        href=href,
+        base_path=base_path,
+        competencia=competencia,
+        empresa=empresa,
+        tipo_nota=tipo_nota,
+        contexto_requisicao=contexto_requisicao,
+    )
+
+
+async def baixar_href_direto(
+    page: Page,
+    href: str,
+    base_path: str,
+    competencia: str,
+    empresa: str,
+    tipo_nota: str,
+    contexto_requisicao: Optional[APIRequestContext] = None,
+    nome_arquivo_prefixo: Optional[str] = None,
+) -> Path:
+    """
+    Baixa via HTTP o arquivo de um href já conhecido, sem localizar o link na página.
+    
+    Usado quando os hrefs de download já foram lidos da tabela (por exemplo,
+    junto com os demais dados das linhas), evitando abrir o menu de cada nota.
+    
+    Args:
+        page: Instância do Playwright Page (sessão autenticada; usada para a URL base)
+        href: Href do link de download (relativo ou absoluto)
+        base_path: Caminho base configurado pelo usuário
+        competencia: Competência no formato "MM/AAAA" (ex: "10/2025")
+        empresa: Nome da empresa (será sanitizado)
+        tipo_nota: "Emitidas" ou "Recebidas"
+        contexto_requisicao: APIRequestContext usado na requisição (padrão: page.request)
+        nome_arquivo_prefixo: Se informado, o arquivo é nomeado como nos downloads
+            pelo navegador (salvar_download_direto): nome sugerido pelo servidor
+            ou, se inválido, o prefixo. Se None, o nome é a chave da nota.
+        
+    Returns:
+        Path do arquivo salvo
+        
+    Raises:
+        ValueError: Se tipo_nota for inválido ou a chave não puder ser extraída do href
+        Exception: Se o status não for 200 ou houver erro ao salvar
+    """
+    tipo_nota = tipo_nota.strip()
+    if tipo_nota not in ["Emitidas", "Recebidas"]:
+        raise ValueError(f"tipo_nota deve ser 'Emitidas' ou 'Recebidas'. Recebido: {tipo_nota}")
     
     # ETAPA 4: Monta URL absoluta
-    current_url = page.url
-    full_url = urljoin(current_url, href)
-    logger.debug(f"URL completa montada: {full_url}")
+    full_url = _montar_url_absoluta(page.url, href)
+    logger.debug("URL completa montada: %s", full_url)
     
     # ETAPA 5: Extrai chave da nota do href (último segmento após /)
     nome_chave = href.split("/")[-1]
     if not nome_chave:
         raise ValueError(f"Não foi possível extrair chave da nota do href: {href}")
     
-    logger.debug(f"Chave da nota extraída: {nome_chave}")
+    logger.debug("Chave da nota extraída: %s", nome_chave)
     
     # ETAPA 6: Faz requisição HTTP direta
-    logger.info(f"🌐 Fazendo requisição HTTP para: {full_url}")
-    response: APIResponse = await page.request.get(full_url)
+    logger.info("🌐 Fazendo requisição HTTP para: %s", full_url)
+    requisicao = contexto_requisicao or page.request
+    response: APIResponse = await requisicao.get(full_url)
     
-    # ETAPA 7: Verifica status da resposta
-    status = response.status
-    if status != 200:
-        raise Exception(f"Erro na requisição HTTP. Status: {status}, URL: {full_url}")
-    
-    logger.debug(f"✅ Resposta HTTP recebida com status {status}")
-    
-    # ETAPA 8: Lê headers e conteúdo
-    content_type = response.headers.get('content-type', '').lower()
-    logger.debug(f"Content-Type recebido: {content_type}")
-    
-    # Lê o conteúdo binário
-    content = await response.body()
-    logger.debug(f"Conteúdo recebido: {len(content)} bytes")
+    try:
+        # ETAPA 7: Verifica status da resposta
+        status = response.status
+        if status != 200:
+            raise Exception(f"Erro na requisição HTTP. Status: {status}, URL: {full_url}")
+        
+        logger.debug("✅ Resposta HTTP recebida com status %s", status)
+        
+        # ETAPA 8: Lê headers e conteúdo
+        content_type = response.headers.get('content-type', '').lower()
+        content_disposition = response.headers.get('content-disposition', '')
+        logger.debug("Content-Type recebido: %s", content_type)
+        
+        # Lê o conteúdo binário
+        content = await response.body()
+        logger.debug("Conteúdo recebido: %s bytes", len(content))
+    finally:
+        # Libera o corpo mantido pelo Playwright; sem isso ele fica em memória
+        # até o contexto do navegador ser fechado
+        await response.dispose()
     
     # ETAPA 9: Detecta extensão correta
     extensao = None
@@ -526,27 +670,21 @@ async def baixar_arquivo_direto(
     # 9.1: Tenta detectar pelo content-type
     if 'xml' in content_type:
         extensao = '.xml'
-        logger.info(f"✅ Extensão detectada pelo content-type (XML): {extensao}")
+        logger.info("✅ Extensão detectada pelo content-type (XML): %s", extensao)
     elif 'pdf' in content_type:
         extensao = '.pdf'
-        logger.info(f"✅ Extensão detectada pelo content-type (PDF): {extensao}")
+        logger.info("✅ Extensão detectada pelo content-type (PDF): %s", extensao)
     
     # 9.2: Se não detectou ou veio genérico, analisa o conteúdo
     if not extensao or content_type == 'application/octet-stream':
         logger.debug("Content-type não específico ou genérico. Analisando conteúdo...")
         
-        # Lê primeiros bytes do conteúdo
-        primeiros_bytes = content[:10] if len(content) >= 10 else content
-        
-        if primeiros_bytes.startswith(b'<?xml') or primeiros_bytes.startswith(b'<'):
-            extensao = '.xml'
-            logger.info(f"✅ Extensão detectada pelo conteúdo (XML): {extensao}")
-        elif primeiros_bytes.startswith(b'%PDF'):
-            extensao = '.pdf'
-            logger.info(f"✅ Extensão detectada pelo conteúdo (PDF): {extensao}")
+        extensao = _extensao_pelo_conteudo(content[:4])
+        if extensao:
+            logger.info("✅ Extensão detectada pelo conteúdo: %s", extensao)
         else:
             extensao = '.bin'
-            logger.warning(f"⚠️ Não foi possível detectar extensão. Usando fallback: {extensao}")
+            logger.warning("⚠️ Não foi possível detectar extensão. Usando fallback: %s", extensao)
     
     # ETAPA 10: Monta estrutura de pastas
     base_path_obj = Path(base_path)
@@ -554,30 +692,88 @@ async def baixar_arquivo_direto(
     empresa_folder = sanitizar_nome_pasta(empresa)
     
     pasta_final = base_path_obj / comp_folder / empresa_folder / tipo_nota
-    pasta_final.mkdir(parents=True, exist_ok=True)
-    logger.debug(f"📁 Estrutura de pastas criada: {pasta_final}")
+    _garantir_diretorio(pasta_final)
+    logger.debug("📁 Estrutura de pastas criada: %s", pasta_final)
     
     # ETAPA 11: Monta nome do arquivo final
-    nome_arquivo = f"{nome_chave}{extensao}"
-    nome_arquivo = sanitizar_nome_arquivo(nome_arquivo)
+    if nome_arquivo_prefixo is None:
+        nome_arquivo = sanitizar_nome_arquivo(f"{nome_chave}{extensao}")
+    else:
+        # Mesmo nome que o navegador sugeriria: o do Content-Disposition ou,
+        # na falta dele, o último segmento da URL
+        match = _CONTENT_DISPOSITION_RE.search(content_disposition)
+        nome_sugerido = unquote(match.group(1).strip()) if match else nome_chave
+        nome_arquivo = _montar_nome_arquivo(nome_sugerido, extensao, nome_arquivo_prefixo)
     caminho_final = pasta_final / nome_arquivo
     
-    logger.info(f"💾 Salvando arquivo em: {caminho_final}")
+    logger.info("💾 Salvando arquivo em: %s", caminho_final)
     
     # ETAPA 12: Salva o arquivo em disco
     try:
-        with open(caminho_final, "wb") as f:
-            f.write(content)
+        # A escrita roda em thread para não bloquear downloads concorrentes
+        await asyncio.to_thread(caminho_final.write_bytes, content)
+        del content
         
         # Verifica se o arquivo foi salvo corretamente
         if caminho_final.exists():
             tamanho = caminho_final.stat().st_size
-            logger.info(f"✅ Arquivo salvo com sucesso: {caminho_final} ({tamanho} bytes)")
+            logger.info("✅ Arquivo salvo com sucesso: %s (%s bytes)", caminho_final, tamanho)
         else:
             raise Exception(f"Arquivo não foi criado: {caminho_final}")
     except Exception as e:
-        logger.error(f"❌ Erro ao salvar arquivo: {e}")
+        logger.error("❌ Erro ao salvar arquivo: %s", e)
         raise
     
     return caminho_final
 
+
+async def baixar_arquivos_em_lote(
+    page: Page,
+    tarefas: List[Dict[str, Any]],
+    concorrencia: int = 8,
+    contexto_requisicao: Optional[APIRequestContext] = None,
+) -> List[Union[Path, BaseException]]:
+    """
+    Baixa vários arquivos em paralelo usando a sessão autenticada do Playwright.
+    
+    Cada tarefa contém os argumentos nomeados de baixar_arquivo_direto (exceto
+    page) ou, se tiver "href" no lugar de "seletor_link", os de
+    baixar_href_direto. Todas as requisições do lote passam pelo mesmo
+    APIRequestContext, reaproveitando as conexões já abertas com o portal; o
+    semáforo limita quantas ficam em andamento ao mesmo tempo.
+    
+    Args:
+        page: Instância do Playwright Page (sessão autenticada)
+        tarefas: Lista de dicts com seletor_link (ou href), base_path, competencia, empresa e tipo_nota
+        concorrencia: Número máximo de downloads simultâneos
+        contexto_requisicao: APIRequestContext dedicado ao lote (padrão: o do
+            contexto do navegador). Quem cria o contexto é responsável por
+            chamar dispose() ao final.
+        
+    Returns:
+        Lista na mesma ordem das tarefas, com o Path salvo ou a exceção do download
+        
+    Exemplo:
+        resultados = await baixar_arquivos_em_lote(page, [
+            {"seletor_link": 'a[href*="/Download/NFSe/"]', "base_path": "/caminho/base",
+             "competencia": "10/2025", "empresa": "Empresa XYZ", "tipo_nota": "Emitidas"},
+            {"seletor_link": 'a[href*="/Download/DANFSe/"]', "base_path": "/caminho/base",
+             "competencia": "10/2025", "empresa": "Empresa XYZ", "tipo_nota": "Emitidas"},
+        ])
+    """
+    semaforo = asyncio.Semaphore(concorrencia)
+    requisicao = contexto_requisicao or page.context.request
+    
+    async def _baixar(tarefa: Dict[str, Any]) -> Path:
+        async with semaforo:
+            baixar = baixar_href_direto if "href" in tarefa else baixar_arquivo_direto
+            return await baixar(page, contexto_requisicao=requisicao, **tarefa)
+    
+    logger.info("📥 Iniciando %s download(s) em lote (concorrência: %s)", len(tarefas), concorrencia)
+    resultados = await asyncio.gather(*(_baixar(tarefa) for tarefa in tarefas), return_exceptions=True)
+    
+    falhas = sum(1 for resultado in resultados if isinstance(resultado, BaseException))
+    if falhas:
+        logger.warning("⚠️ %s de %s download(s) falharam", falhas, len(tarefas))
+    
+    return resultados
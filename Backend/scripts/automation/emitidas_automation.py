@@ -247,7 +247,7 @@ def executar_fluxo_emitidas(page, competencia, context):
 def main():
     import argparse
     import logging
-    from playwright_nfse import abrir_dashboard_nfse, NFSeAutenticacaoError
+    from playwright_nfse import sessao_nfse, NFSeAutenticacaoError
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     parser = argparse.ArgumentParser()
     parser.add_argument("cnpj", type=str, help="CNPJ da empresa")
@@ -260,27 +260,24 @@ def main():
     headless = args.headless
     tipo = args.tipo
     try:
-        resultado = abrir_dashboard_nfse(
-            cnpj=cnpj,
-            headless=headless,
-            timeout=30000
-        )
-        page = resultado.get("page")
-        context = page.context
-        if tipo == "emitidas":
-            executar_fluxo_emitidas(page, competencia, context)
-            print("✅ Fluxo de Notas Emitidas finalizado.")
-        elif tipo == "recebidas":
-            executar_fluxo_recebidas(page, competencia, context)
-            print("✅ Fluxo de Notas Recebidas finalizado.")
-        elif tipo == "ambas":
-            executar_fluxo_emitidas(page, competencia, context)
-            print("✅ Fluxo de Notas Emitidas finalizado.")
-            executar_fluxo_recebidas(page, competencia, context)
-            print("✅ Fluxo de Notas Recebidas finalizado.")
-        if not headless:
-            print("\n⏸️  Navegador aberto. Pressione Enter para fechar...")
-            input()
+        # A página é fechada ao sair do bloco (o contexto volta ao pool)
+        with sessao_nfse(cnpj=cnpj, headless=headless, timeout=30000) as resultado:
+            page = resultado["page"]
+            context = resultado["context"]
+            if tipo == "emitidas":
+                executar_fluxo_emitidas(page, competencia, context)
+                print("✅ Fluxo de Notas Emitidas finalizado.")
+            elif tipo == "recebidas":
+                executar_fluxo_recebidas(page, competencia, context)
+                print("✅ Fluxo de Notas Recebidas finalizado.")
+            elif tipo == "ambas":
+                executar_fluxo_emitidas(page, competencia, context)
+                print("✅ Fluxo de Notas Emitidas finalizado.")
+                executar_fluxo_recebidas(page, competencia, context)
+                print("✅ Fluxo de Notas Recebidas finalizado.")
+            if not headless:
+                print("\n⏸️  Navegador aberto. Pressione Enter para fechar...")
+                input()
     except NFSeAutenticacaoError as e:
         print(f"❌ ERRO DE AUTENTICAÇÃO: {str(e)}")
         sys.exit(1)
@@ -4,8 +4,21 @@ Script para executar login no portal NFSe Nacional usando Playwright.
 
 Este script é uma interface simples para executar a automação NFSe
 via linha de comando usando Playwright com certificado A1.
+
+Uso:
+    python executar_login_nfse.py [CNPJ] [--headless] [--verbose] [--json]
+
+Por padrão só o resumo do resultado, avisos e erros são exibidos; com
+--verbose (ou NFSE_VERBOSE=1) são exibidos também os logs da automação e
+o traceback de erros inesperados.
+
+Com --json, para uso por outros processos, o resultado é escrito em uma
+única linha JSON no stdout ({"sucesso", "url", "titulo", "mensagem",
+"logs"}) e erros em uma linha JSON no stderr ({"erro", "tipo"}).
 """
 
+import json
+import logging
 import sys
 import os
 
@@ -15,107 +28,131 @@ src_path = os.path.join(backend_dir, "src")
 if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
-# Carrega variáveis de ambiente
-from dotenv import load_dotenv
-env_path = os.path.join(backend_dir, ".env")
-load_dotenv(env_path)
-load_dotenv()
+# As variáveis de ambiente (.env) são carregadas por src.infrastructure.config,
+# importado pelo playwright_nfse
+from playwright_nfse import sessao_nfse, NFSeAutenticacaoError
+
+logger = logging.getLogger(__name__)
+
+# Tabela para remover a formatação do CNPJ em uma única passada
+_CNPJ_STRIP = str.maketrans('', '', './- \t\n')
+
+_BANNER = "=" * 60
+
+
+def _escrever_json(dados: dict, stream) -> None:
+    """Escreve um objeto JSON compacto em uma única linha, com uma só escrita."""
+    stream.write(json.dumps(dados, ensure_ascii=False, separators=(",", ":")) + "\n")
+    stream.flush()
 
-from playwright_nfse import abrir_dashboard_nfse, NFSeAutenticacaoError
 
 def main():
     """Função principal que executa o login."""
     # Pega CNPJ dos argumentos
     cnpj = None
     headless = False  # Por padrão, mostra o navegador para facilitar debug
+    verbose = os.getenv("NFSE_VERBOSE") == "1"
+    saida_json = False
     
     for arg in sys.argv[1:]:
         if arg == "--headless":
             headless = True
         elif arg == "--no-headless" or arg == "--visible":
             headless = False
-        elif not arg.startswith("--"):
+        elif arg == "--verbose" or arg == "-v":
+            verbose = True
+        elif arg == "--json":
+            saida_json = True
+        elif not arg.startswith("-"):
             cnpj = arg
     
+    # O playwright_nfse configura o logging em INFO ao ser importado
+    logging.getLogger().setLevel(logging.INFO if verbose else logging.WARNING)
+    
     if not cnpj:
         cnpj = os.getenv("CNPJ_PADRAO", os.getenv("CNPJ_CERTIFICADO", "00000000000011"))
-        print(f"ℹ️  Nenhum CNPJ informado. Usando CNPJ padrão: {cnpj}")
-        print(f"   Para usar outro CNPJ: python3 {sys.argv[0]} <CNPJ>")
+        logger.warning(
+            "ℹ️  Nenhum CNPJ informado. Usando CNPJ padrão: %s "
+            "(para usar outro CNPJ: python3 %s <CNPJ>)", cnpj, sys.argv[0]
+        )
     
     # Remove formatação do CNPJ
-    cnpj_limpo = cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
+    cnpj_limpo = cnpj.translate(_CNPJ_STRIP)
     
     if len(cnpj_limpo) != 14:
-        print(f"❌ ERRO: CNPJ inválido. Deve conter 14 dígitos. Recebido: {len(cnpj_limpo)} dígitos")
+        mensagem_erro = f"CNPJ inválido. Deve conter 14 dígitos. Recebido: {len(cnpj_limpo)} dígitos"
+        if saida_json:
+            _escrever_json({"erro": mensagem_erro, "tipo": "ValueError"}, sys.stderr)
+        else:
+            logger.error("❌ ERRO: %s", mensagem_erro)
         sys.exit(1)
     
-    print("=" * 60)
-    print("🚀 AUTOMAÇÃO NFSe COM PLAYWRIGHT")
-    print("=" * 60)
-    print(f"CNPJ: {cnpj_limpo}")
-    print(f"Modo: {'Headless' if headless else 'Visível'}")
-    print("=" * 60)
-    print()
+    logger.info(
+        "\n%s\n🚀 AUTOMAÇÃO NFSe COM PLAYWRIGHT\n%s\nCNPJ: %s\nModo: %s\n%s",
+        _BANNER, _BANNER, cnpj_limpo, 'Headless' if headless else 'Visível', _BANNER
+    )
     
     try:
-        resultado = abrir_dashboard_nfse(
-            cnpj=cnpj_limpo,
-            headless=headless,
-            timeout=30000
-        )
-        
-        print()
-        print("=" * 60)
-        print("📊 RESULTADO")
-        print("=" * 60)
-        print(f"✅ Sucesso: {resultado['sucesso']}")
-        print(f"📍 URL Atual: {resultado['url_atual']}")
-        print(f"📝 Título: {resultado['titulo']}")
-        print(f"💬 Mensagem: {resultado['mensagem']}")
-        print()
-        print("📋 Logs:")
-        for log in resultado['logs']:
-            print(f"   {log}")
-        print("=" * 60)
-        
-        if resultado['sucesso']:
-            print("✅ Login realizado com sucesso!")
-            if not headless:
+        # A página é fechada ao sair do bloco (o contexto volta ao pool)
+        with sessao_nfse(cnpj=cnpj_limpo, headless=headless, timeout=30000) as resultado:
+            if saida_json:
+                _escrever_json({
+                    "sucesso": resultado['sucesso'],
+                    "url": resultado['url_atual'],
+                    "titulo": resultado['titulo'],
+                    "mensagem": resultado['mensagem'],
+                    "logs": resultado['logs'],
+                }, sys.stdout)
+                sys.exit(0 if resultado['sucesso'] else 1)
+            
+            # O resumo é montado e escrito de uma vez só
+            linhas = [
+                _BANNER,
+                "📊 RESULTADO",
+                _BANNER,
+                f"✅ Sucesso: {resultado['sucesso']}",
+                f"📍 URL Atual: {resultado['url_atual']}",
+                f"📝 Título: {resultado['titulo']}",
+                f"💬 Mensagem: {resultado['mensagem']}",
+            ]
+            if verbose:
+                linhas.append("\n📋 Logs:")
+                linhas.extend(f"   {log}" for log in resultado['logs'])
+            linhas.append(_BANNER)
+            linhas.append(
+                "✅ Login realizado com sucesso!" if resultado['sucesso']
+                else "⚠️  Login concluído com avisos"
+            )
+            print("\n".join(linhas))
+            
+            if resultado['sucesso'] and not headless:
                 print("\n⏸️  Navegador aberto. Pressione Enter para fechar...")
                 input()
-            sys.exit(0)
-        else:
-            print("⚠️  Login concluído com avisos")
-            sys.exit(1)
+        
+        sys.exit(0 if resultado['sucesso'] else 1)
             
     except NFSeAutenticacaoError as e:
-        print()
-        print("=" * 60)
-        print("❌ ERRO DE AUTENTICAÇÃO")
-        print("=" * 60)
-        print(f"Erro: {str(e)}")
-        print()
-        print("Possíveis causas:")
-        print("  • Certificado não encontrado para este CNPJ")
-        print("  • Senha do certificado incorreta")
-        print("  • Certificado inválido ou expirado")
-        print("  • Problema de conexão com o portal NFSe")
-        print("=" * 60)
+        if saida_json:
+            _escrever_json({"erro": str(e), "tipo": type(e).__name__}, sys.stderr)
+            sys.exit(1)
+        logger.error(
+            "❌ ERRO DE AUTENTICAÇÃO: %s\n"
+            "Possíveis causas:\n"
+            "  • Certificado não encontrado para este CNPJ\n"
+            "  • Senha do certificado incorreta\n"
+            "  • Certificado inválido ou expirado\n"
+            "  • Problema de conexão com o portal NFSe", e
+        )
         sys.exit(1)
         
     except Exception as e:
-        print()
-        print("=" * 60)
-        print("❌ ERRO INESPERADO")
-        print("=" * 60)
-        print(f"Erro: {str(e)}")
-        import traceback
-        print()
-        print("Traceback completo:")
-        traceback.print_exc()
-        print("=" * 60)
+        if saida_json:
+            _escrever_json({"erro": str(e), "tipo": type(e).__name__}, sys.stderr)
+        elif verbose:
+            logger.exception("❌ ERRO INESPERADO: %s", e)
+        else:
+            logger.error("❌ ERRO INESPERADO: %s (use --verbose para ver o traceback)", e)
         sys.exit(1)
 
 if __name__ == "__main__":
     main()
-
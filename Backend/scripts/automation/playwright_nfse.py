@@ -10,12 +10,24 @@ Características:
 - Autenticação via certificado cliente (client_certificates)
 - Certificado A1 carregado e usado diretamente no contexto do navegador
 - Autenticação automática sem popups de seleção
+- Logins de vários CNPJs em paralelo via API assíncrona (abrir_dashboards_em_lote)
 """
 
+import asyncio
+import atexit
+import hashlib
+import json
 import os
+import re
 import sys
 import logging
-from typing import Tuple
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from playwright.sync_api import (
     sync_playwright,
@@ -23,6 +35,16 @@ from playwright.sync_api import (
     BrowserContext,
     Page,
     Playwright,
+    Request,
+    Route,
+    Error as PlaywrightError,
+    TimeoutError as PlaywrightTimeoutError,
+)
+from playwright.async_api import (
+    async_playwright,
+    Browser as AsyncBrowser,
+    Request as AsyncRequest,
+    Route as AsyncRoute,
 )
 
 # Configuração de logging
@@ -32,105 +54,395 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Permite importar services independentemente de onde o script for executado
-# IMPORTANTE: Este código deve executar ANTES de qualquer import que dependa dele
-_backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-_src_path = os.path.join(_backend_dir, "src")
-
-# Adiciona backend_dir ao sys.path PRIMEIRO (para que src seja reconhecido como pacote)
-# Isso permite fazer "from src.services.certificate_service import ..."
+# Permite importar src.services independentemente de onde o script for executado:
+# a pasta Backend (dois níveis acima de scripts/automation) entra no sys.path
+_backend_dir = str(Path(__file__).resolve().parents[2])
 if _backend_dir not in sys.path:
     sys.path.insert(0, _backend_dir)
-# Depois adiciona src_path (para imports diretos de services quando src está no path)
-if _src_path not in sys.path:
-    sys.path.insert(0, _src_path)
-
-# Importa certificate_service - tenta múltiplas formas
-_certificate_service_imported = False
-_certificate_service_error = None
-_get_certificate_service_func = None
-
-try:
-    # Tentativa 1: Import usando src.services (quando backend_dir está no path)
-    from src.services.certificate_service import get_certificate_service  # noqa: E402
-    _get_certificate_service_func = get_certificate_service
-    _certificate_service_imported = True
-    logger.debug("✅ CertificateService importado via src.services")
-except ImportError as e1:
-    _certificate_service_error = f"src.services: {e1}"
-    try:
-        # Tentativa 2: Import direto de services (quando src está no path)
-        from services.certificate_service import get_certificate_service  # noqa: E402
-        _get_certificate_service_func = get_certificate_service
-        _certificate_service_imported = True
-        logger.debug("✅ CertificateService importado via services")
-    except ImportError as e2:
-        # Se ambas falharem, o erro será levantado quando tentar usar
-        _certificate_service_error = f"src.services: {e1}; services: {e2}"
-
-if not _certificate_service_imported:
-    # Se não conseguiu importar, levanta erro com detalhes
-    error_msg = (
-        f"Não foi possível importar certificate_service.\n"
-        f"  Erros: {_certificate_service_error}\n"
-        f"  Backend dir: {_backend_dir}\n"
-        f"  Src path: {_src_path}\n"
-        f"  Src existe: {os.path.exists(_src_path)}\n"
-        f"  Backend no path: {_backend_dir in sys.path}\n"
-        f"  Src no path: {_src_path in sys.path}\n"
-        f"  Sys.path (primeiros 3): {sys.path[:3]}"
-    )
-    logger.error(error_msg)
-    raise ImportError(error_msg)
-
-# Expõe a função para uso no módulo
-get_certificate_service = _get_certificate_service_func
+
+from src.services.certificate_service import get_certificate_service  # noqa: E402
 
 # URL base do portal NFSe Nacional
 BASE_URL = "https://www.nfse.gov.br/EmissorNacional/"
 
+# Requisições abortadas no navegador: fontes web e scripts de analytics não
+# participam da autenticação. Imagens, CSS e JS são mantidos, pois a navegação
+# do portal depende deles (ex: ícones do menu lateral).
+_RECURSOS_BLOQUEADOS_RE = re.compile(
+    r"\.(?:woff2?|ttf|otf|eot)(?:[?#]|$)"
+    r"|google-analytics\.com|googletagmanager\.com|hotjar\.com|doubleclick\.net|facebook\.(?:com|net)"
+)
+
+# Cache em disco dos recursos estáticos do portal (CSS, JS e imagens), que são
+# os mesmos para todos os CNPJs. Só recursos do próprio portal passam pelo
+# cache. Cada recurso é gravado como <sha256(url)>.bin, com o Content-Type e
+# o instante de expiração em <sha256(url)>.json. A validade segue os headers
+# Cache-Control/Expires da resposta, limitada a _VALIDADE_CACHE_ESTATICO;
+# respostas no-store, no-cache ou private não são gravadas.
+_CACHE_ESTATICO_DIR = Path(_backend_dir) / ".nfse_cache"
+_RECURSOS_ESTATICOS_RE = re.compile(
+    r"^https://www\.nfse\.gov\.br/[^?#]*\.(?:css|js|png|jpg|gif|svg|ico)(?:[?#]|$)",
+    re.IGNORECASE,
+)
+_VALIDADE_CACHE_ESTATICO = 7 * 24 * 60 * 60  # 7 dias, em segundos
+_MAX_AGE_RE = re.compile(r"\b(s-maxage|max-age)\s*=\s*\"?(\d+)")
+_DIRETIVAS_SEM_CACHE = frozenset(("no-store", "no-cache", "private"))
+
+# Elementos que indicam a página de login (botão de acesso via certificado)
+_SELETORES_LOGIN = (
+    'button:has-text("Certificado")',
+    'a:has-text("Certificado")',
+    'input[type="button"][value*="ertificado"]',
+    '#btnCertificado',
+    '.btn-certificado',
+)
+
+# Elementos que indicam o dashboard/página autenticada
+_SELETORES_DASHBOARD = (
+    ':text("Dashboard")',
+    ':text("Painel")',
+    '[href*="Dashboard"]',
+    '.dashboard',
+    '#dashboard',
+)
+
+# Listas de seletores CSS: cada detecção é feita em uma única consulta ao
+# navegador, em vez de uma consulta por seletor
+LOGIN_SEL = ", ".join(_SELETORES_LOGIN)
+DASH_SEL = ", ".join(_SELETORES_DASHBOARD)
+
+
+@contextmanager
+def _medir(etapa: str, tempos: Dict[str, float]) -> Iterator[None]:
+    """
+    Mede a duração de uma etapa do login e a registra em `tempos` (ms).
+    
+    Args:
+        etapa: Nome da etapa (ex: "goto")
+        tempos: Dicionário que recebe a duração, em milissegundos
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[etapa] = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(f"⏱️  {etapa}: {tempos[etapa]:.1f} ms")
+
+
+def _url_autenticada(url: str) -> bool:
+    """Indica se a URL corresponde a uma página autenticada (fora do login)."""
+    return "Dashboard" in url or "Login" not in url
+
 
 class NFSeAutenticacaoError(Exception):
     """Erro genérico para falhas durante autenticação no portal NFSe."""
     pass
 
 
+# Argumentos de linha de comando do Chromium
+_ARGS_CHROMIUM = [
+    # Desabilita avisos de segurança de download e recursos não usados pela
+    # automação. O Chromium considera apenas o último --disable-features, então
+    # todos os recursos ficam em uma única flag.
+    "--disable-features=DownloadBubble,DownloadBubbleV2,SafeBrowsing,Translate,BackForwardCache",
+    "--safebrowsing-disable-auto-update",
+    "--safebrowsing-disable-download-protection",
+    # Permite downloads automáticos sem confirmação
+    "--disable-web-security",
+    "--allow-running-insecure-content",
+    # Desabilita notificações de download perigoso
+    "--disable-notifications",
+    "--disable-infobars",
+    # Menos processos e serviços em segundo plano: inicialização mais rápida
+    # e menor uso de memória
+    "--disable-dev-shm-usage",  # /dev/shm costuma ser pequeno em containers
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--no-first-run",
+    "--no-default-browser-check",
+]
 
+# Como root (ex: em containers) o sandbox do Chromium não funciona; sem ele,
+# o processo zygote também é dispensável
+if getattr(os, "geteuid", lambda: -1)() == 0:
+    _ARGS_CHROMIUM += ["--no-sandbox", "--no-zygote"]
 
-def criar_contexto_com_certificado(
-    cnpj: str,
-    headless: bool = True,
-    ignore_https_errors: bool = True
-) -> Tuple[Playwright, Browser, BrowserContext]:
+# Endpoint CDP de um Chromium já em execução (ex: "http://127.0.0.1:9222", ver
+# scripts/init/iniciar_chromium.sh). Se definido, o Chromium não é lançado pelo
+# processo: os logins se conectam a ele e criam apenas contextos isolados.
+_CDP_ENDPOINT = os.getenv("NFSE_CDP_ENDPOINT")
+
+# Playwright e Chromium são reaproveitados entre logins; cada login cria apenas
+# um novo contexto. A API síncrona do Playwright só pode ser usada na thread que
+# a iniciou, então cada thread mantém a sua instância, com um navegador por modo
+# headless (definido no lançamento; com NFSE_CDP_ENDPOINT a chave é None).
+# A thread deve chamar encerrar_navegador_da_thread() antes de terminar.
+_instancias_thread = threading.local()
+
+# Contextos reaproveitados por CNPJ em cada thread (LRU). Um novo login do
+# mesmo CNPJ reutiliza o contexto já autenticado (cookies, sessão TLS com o
+# certificado e conexões abertas com o portal) e abre apenas uma nova página.
+_TAMANHO_POOL_CONTEXTOS = 4
+
+# Máximo de logins simultâneos em abrir_dashboards_em_lote. Cada contexto do
+# Chromium ocupa ~30-80 MB, então 8 contextos cabem em ~1 GB.
+_CONCORRENCIA_LOGINS = 8
+
+
+def _obter_navegador(headless: bool) -> Tuple[Playwright, Browser]:
     """
-    Cria um contexto do navegador Chromium configurado para usar certificado A1.
+    Retorna o Playwright e o Chromium da thread atual, iniciando-os na primeira chamada.
     
-    Esta função:
-    1. Carrega o certificado A1 (.pfx) e senha usando cert_storage
-    2. Inicia o Playwright e configura o Chromium para usar o certificado
-    3. Usa a funcionalidade nativa do Playwright (client_certificates) para
-       autenticação via certificado cliente sem popups de seleção
-    4. Retorna o playwright, browser e context configurados
+    Com NFSE_CDP_ENDPOINT definido, conecta ao Chromium externo em vez de
+    lançar um novo; o modo headless passa a ser o do processo externo.
+    
+    Args:
+        headless: Se True, usa (ou lança) o navegador em modo headless
+        
+    Returns:
+        Tupla (playwright, browser) compartilhada pelos logins da thread
+    """
+    playwright = getattr(_instancias_thread, "playwright", None)
+    if playwright is None:
+        logger.info("🚀 Iniciando Playwright...")
+        playwright = sync_playwright().start()
+        _instancias_thread.playwright = playwright
+        _instancias_thread.navegadores = {}
+        _instancias_thread.contextos = OrderedDict()
+    
+    navegadores = _instancias_thread.navegadores
+    chave = None if _CDP_ENDPOINT else headless
+    browser = navegadores.get(chave)
+    if browser is None or not browser.is_connected():
+        if _CDP_ENDPOINT:
+            logger.info(f"🌐 Conectando ao Chromium via CDP: {_CDP_ENDPOINT}")
+            browser = playwright.chromium.connect_over_cdp(_CDP_ENDPOINT)
+        else:
+            logger.info("🌐 Lançando Chromium...")
+            # O viewport 1920x1080 é definido no contexto; no modo visível a
+            # janela já abre maximizada
+            args = _ARGS_CHROMIUM if headless else _ARGS_CHROMIUM + ["--start-maximized"]
+            browser = playwright.chromium.launch(headless=headless, args=args)
+        navegadores[chave] = browser
+    else:
+        logger.info("🌐 Reutilizando Chromium já iniciado")
+    
+    return playwright, browser
+
+
+def _validade_cache(headers: Dict[str, str]) -> Optional[int]:
+    """
+    Calcula por quantos segundos uma resposta pode ficar no cache em disco.
+    
+    Args:
+        headers: Headers da resposta (nomes em minúsculas)
+        
+    Returns:
+        Validade em segundos (no máximo _VALIDADE_CACHE_ESTATICO), ou None se a
+        resposta não pode ser gravada em um cache compartilhado
+    """
+    cache_control = headers.get("cache-control", "").lower()
+    diretivas = {diretiva.split("=", 1)[0].strip() for diretiva in cache_control.split(",")}
+    if diretivas & _DIRETIVAS_SEM_CACHE:
+        return None
+    
+    # O cache é compartilhado entre CNPJs: s-maxage tem precedência sobre max-age
+    idades = dict(_MAX_AGE_RE.findall(cache_control))
+    idade = idades.get("s-maxage", idades.get("max-age"))
+    if idade is not None:
+        return min(int(idade), _VALIDADE_CACHE_ESTATICO) or None
+    
+    expires = headers.get("expires")
+    if expires:
+        try:
+            restante = int(parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+        return min(restante, _VALIDADE_CACHE_ESTATICO) if restante > 0 else None
+    
+    return _VALIDADE_CACHE_ESTATICO
+
+
+def _ler_cache_estatico(url: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+    """
+    Lê um recurso estático do cache em disco.
+    
+    Args:
+        url: URL do recurso
+        
+    Returns:
+        Tupla (headers, corpo), ou None se o recurso não estiver em cache ou
+        estiver expirado
+    """
+    chave = hashlib.sha256(url.encode()).hexdigest()
+    try:
+        meta = json.loads((_CACHE_ESTATICO_DIR / f"{chave}.json").read_text(encoding="utf-8"))
+        if time.time() >= meta["expira_em"]:
+            return None
+        return meta["headers"], (_CACHE_ESTATICO_DIR / f"{chave}.bin").read_bytes()
+    except (OSError, ValueError, KeyError, TypeError):
+        # Cache ausente, corrompido ou em formato antigo
+        return None
+
+
+def _gravar_cache_estatico(url: str, headers: Dict[str, str], corpo: bytes) -> None:
+    """
+    Grava um recurso estático no cache em disco, se os headers permitirem.
+    
+    Args:
+        url: URL do recurso
+        headers: Headers da resposta original (nomes em minúsculas)
+        corpo: Conteúdo do recurso
+    """
+    validade = _validade_cache(headers)
+    if validade is None:
+        return
+    
+    chave = hashlib.sha256(url.encode()).hexdigest()
+    try:
+        _CACHE_ESTATICO_DIR.mkdir(parents=True, exist_ok=True)
+        (_CACHE_ESTATICO_DIR / f"{chave}.bin").write_bytes(corpo)
+        # O .json é gravado por último: sua presença indica entrada completa
+        meta = {
+            "headers": {"content-type": headers.get("content-type") or "application/octet-stream"},
+            "expira_em": time.time() + validade,
+        }
+        (_CACHE_ESTATICO_DIR / f"{chave}.json").write_text(json.dumps(meta), encoding="utf-8")
+    except OSError as e:
+        logger.debug(f"Não foi possível gravar {url} no cache: {e}")
+
+
+def _servir_recurso_estatico(route: Route, request: Request) -> None:
+    """
+    Handler de rota que serve recursos estáticos do cache em disco.
+    
+    Em cache ausente ou expirado, busca o recurso na rede e grava a resposta
+    (apenas GET com status 200) para os próximos logins.
+    
+    Args:
+        route: Rota interceptada pelo Playwright
+        request: Requisição associada à rota
+    """
+    if request.method != "GET":
+        route.continue_()
+        return
+    
+    em_cache = _ler_cache_estatico(request.url)
+    if em_cache:
+        headers, corpo = em_cache
+        route.fulfill(status=200, headers=headers, body=corpo)
+        return
+    
+    try:
+        response = route.fetch()
+    except PlaywrightError as e:
+        logger.debug(f"Falha ao buscar recurso estático {request.url}: {e}")
+        route.continue_()
+        return
+    
+    if response.status == 200:
+        _gravar_cache_estatico(request.url, response.headers, response.body())
+    
+    route.fulfill(response=response)
+
+
+async def _servir_recurso_estatico_async(route: AsyncRoute, request: AsyncRequest) -> None:
+    """
+    Versão assíncrona de _servir_recurso_estatico, para contextos da async_api.
+    
+    Args:
+        route: Rota interceptada pelo Playwright
+        request: Requisição associada à rota
+    """
+    if request.method != "GET":
+        await route.continue_()
+        return
+    
+    em_cache = _ler_cache_estatico(request.url)
+    if em_cache:
+        headers, corpo = em_cache
+        await route.fulfill(status=200, headers=headers, body=corpo)
+        return
+    
+    try:
+        response = await route.fetch()
+    except PlaywrightError as e:
+        logger.debug(f"Falha ao buscar recurso estático {request.url}: {e}")
+        await route.continue_()
+        return
+    
+    if response.status == 200:
+        _gravar_cache_estatico(request.url, response.headers, await response.body())
+    
+    await route.fulfill(response=response)
+
+
+@atexit.register
+def encerrar_navegador_da_thread() -> None:
+    """
+    Fecha os contextos do pool e o Chromium e encerra o Playwright da thread atual.
+    
+    A API síncrona do Playwright só pode ser usada na thread que a iniciou,
+    então cada thread que faz logins deve chamar esta função antes de
+    terminar; sem isso o driver e o Chromium continuam em execução. Ao final
+    do processo ela é chamada para a thread principal.
+    
+    Para o Chromium conectado via CDP, close() apenas desconecta: o processo
+    externo continua em execução.
+    """
+    playwright = getattr(_instancias_thread, "playwright", None)
+    if playwright is None:
+        return
+    
+    navegadores = _instancias_thread.navegadores
+    contextos = _instancias_thread.contextos
+    del _instancias_thread.playwright
+    del _instancias_thread.navegadores
+    del _instancias_thread.contextos
+    
+    # Contextos do pool primeiro (no Chromium via CDP, close() do navegador
+    # não fecha os contextos criados pelo processo)
+    for context, _ in list(contextos.values()):
+        try:
+            context.close()
+        except PlaywrightError:
+            pass
+    contextos.clear()
+    
+    for browser in navegadores.values():
+        try:
+            browser.close()
+        except PlaywrightError:
+            # Já desconectado
+            pass
+    try:
+        playwright.stop()
+    except PlaywrightError:
+        pass
+
+
+def _carregar_certificado(cnpj: str) -> Tuple[bytes, str]:
+    """
+    Carrega o certificado A1 (.pfx) e a senha descriptografados do armazenamento.
     
     Args:
         cnpj: CNPJ da empresa (sem formatação, apenas números)
-        headless: Se True, executa o navegador em modo headless
-        ignore_https_errors: Se True, ignora erros de certificado SSL
         
     Returns:
-        Tupla (playwright, browser, context) configurados com certificado
+        Tupla (conteudo_pfx, senha)
         
     Raises:
         NFSeAutenticacaoError: Se o certificado não for encontrado ou inválido
     """
-    logger.info(f"🔐 Iniciando criação de contexto com certificado A1 para CNPJ: {cnpj}")
-    
     try:
         # Carrega o certificado e senha descriptografados usando o service
         logger.info("📥 Carregando certificado do armazenamento...")
         certificate_service = get_certificate_service()
         conteudo_pfx, senha = certificate_service.carregar_certificado(cnpj)
         logger.info("✅ Certificado carregado com sucesso")
+        return conteudo_pfx, senha
         
     except FileNotFoundError as e:
         error_msg = f"Certificado não encontrado para CNPJ {cnpj}: {str(e)}"
@@ -140,57 +452,127 @@ def criar_contexto_com_certificado(
         error_msg = f"Erro ao carregar certificado para CNPJ {cnpj}: {str(e)}"
         logger.error(f"❌ {error_msg}")
         raise NFSeAutenticacaoError(error_msg)
+
+
+def _opcoes_contexto(conteudo_pfx: bytes, senha: str, ignore_https_errors: bool) -> dict:
+    """
+    Monta os argumentos de new_context() com o certificado cliente configurado.
     
-    try:
-        logger.info("🚀 Iniciando Playwright...")
-        playwright = sync_playwright().start()
+    Usados tanto pela API síncrona quanto pela assíncrona do Playwright.
+    
+    Args:
+        conteudo_pfx: Conteúdo do certificado A1 em bytes
+        senha: Senha do certificado
+        ignore_https_errors: Se True, ignora erros de certificado SSL
         
-        # Lança o Chromium
-        logger.info("🌐 Lançando Chromium...")
-        browser = playwright.chromium.launch(
-            headless=headless,
-            args=[
-                # Desabilita avisos de segurança de download
-                "--disable-features=DownloadBubble,DownloadBubbleV2",
-                "--disable-features=SafeBrowsing",
-                "--safebrowsing-disable-auto-update",
-                "--safebrowsing-disable-download-protection",
-                # Permite downloads automáticos sem confirmação
-                "--disable-web-security",
-                "--allow-running-insecure-content",
-                # Desabilita notificações de download perigoso
-                "--disable-notifications",
-                "--disable-infobars",
-            ]
-        )
+    Returns:
+        Dicionário de argumentos nomeados para browser.new_context()
+    """
+    # O Playwright Python (versão 1.46+) suporta certificados cliente
+    # através do parâmetro client_certificates no new_context()
+    # Isso permite autenticação via certificado A1 sem popups de seleção
+    return {
+        "ignore_https_errors": ignore_https_errors,
+        "viewport": {"width": 1920, "height": 1080},  # Full HD 1920x1080p
+        "user_agent": (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0.0.0 Safari/537.36"
+        ),
+        # Permite downloads automáticos sem validação de segurança
+        "accept_downloads": True,
+        # Configuração de certificado cliente (suportado desde Playwright 1.46+)
+        # O certificado será usado automaticamente para requisições HTTPS
+        # ao domínio especificado, sem exibir popup de seleção
+        "client_certificates": [{
+            "origin": "https://www.nfse.gov.br",  # Domínio do portal NFSe
+            "pfx": conteudo_pfx,  # Conteúdo do certificado em bytes
+            "passphrase": senha  # Senha do certificado
+        }],
+    }
+
+
+def criar_contexto_com_certificado(
+    cnpj: str,
+    headless: bool = True,
+    ignore_https_errors: bool = True,
+    tempos: Optional[Dict[str, float]] = None
+) -> Tuple[Playwright, Browser, BrowserContext]:
+    """
+    Cria um contexto do navegador Chromium configurado para usar certificado A1.
+    
+    Esta função:
+    1. Carrega o certificado A1 (.pfx) e senha usando cert_storage
+    2. Obtém o Playwright e o Chromium da thread (iniciados apenas no primeiro login)
+    3. Usa a funcionalidade nativa do Playwright (client_certificates) para
+       autenticação via certificado cliente sem popups de seleção
+    4. Retorna o playwright, browser e context configurados
+    
+    O playwright e o browser são compartilhados entre logins e encerrados ao
+    final do processo. O context fica no pool de contextos da thread e é
+    devolvido de novo em logins do mesmo CNPJ (com cookies e estado do login
+    anterior); quem chama deve fechar apenas as páginas que abrir (ver
+    _fechar_pagina_e_contexto). Fechar o context o remove do pool.
+    
+    Args:
+        cnpj: CNPJ da empresa (sem formatação, apenas números)
+        headless: Se True, executa o navegador em modo headless
+        ignore_https_errors: Se True, ignora erros de certificado SSL
+        tempos: Se informado, recebe a duração (ms) das etapas "certificado",
+            "navegador" e "contexto"
+        
+    Returns:
+        Tupla (playwright, browser, context) configurados com certificado
         
-        # Cria um contexto com certificado cliente configurado
-        # O Playwright Python (versão 1.46+) suporta certificados cliente
-        # através do parâmetro client_certificates no new_context()
-        # Isso permite autenticação via certificado A1 sem popups de seleção
+    Raises:
+        NFSeAutenticacaoError: Se o certificado não for encontrado ou inválido
+    """
+    logger.info(f"🔐 Iniciando criação de contexto com certificado A1 para CNPJ: {cnpj}")
+    tempos = {} if tempos is None else tempos
+    
+    with _medir("certificado", tempos):
+        conteudo_pfx, senha = _carregar_certificado(cnpj)
+    
+    try:
+        with _medir("navegador", tempos):
+            playwright, browser = _obter_navegador(headless)
+        
+        inicio_contexto = time.perf_counter()
+        contextos = _instancias_thread.contextos
+        chave = (cnpj, None if _CDP_ENDPOINT else headless, ignore_https_errors)
+        # O pool guarda apenas o hash do certificado, não o conteúdo descriptografado
+        hash_pfx = hashlib.sha256(conteudo_pfx).digest()
+        em_pool = contextos.get(chave)
+        if em_pool is not None:
+            context, hash_do_contexto = em_pool
+            if hash_do_contexto == hash_pfx:
+                contextos.move_to_end(chave)
+                logger.info("♻️  Reutilizando contexto do navegador já autenticado para este CNPJ")
+                tempos["contexto"] = round((time.perf_counter() - inicio_contexto) * 1000, 1)
+                return playwright, browser, context
+            # O certificado do CNPJ foi substituído: o contexto antigo é descartado
+            context.close()
         
         logger.info("🔐 Configurando certificado cliente no contexto do navegador...")
-        context = browser.new_context(
-            ignore_https_errors=ignore_https_errors,
-            viewport={"width": 1920, "height": 1080},  # Full HD 1920x1080p
-            user_agent=(
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-            # Permite downloads automáticos sem validação de segurança
-            accept_downloads=True,
-            # Configura pasta de download padrão
-            # Os arquivos serão movidos para o destino correto após o download
-            # Configuração de certificado cliente (suportado desde Playwright 1.46+)
-            # O certificado será usado automaticamente para requisições HTTPS
-            # ao domínio especificado, sem exibir popup de seleção
-            client_certificates=[{
-                "origin": "https://www.nfse.gov.br",  # Domínio do portal NFSe
-                "pfx": conteudo_pfx,  # Conteúdo do certificado em bytes
-                "passphrase": senha  # Senha do certificado
-            }]
-        )
+        context = browser.new_context(**_opcoes_contexto(conteudo_pfx, senha, ignore_https_errors))
+        
+        # Serve CSS/JS/imagens do cache em disco e aborta fontes e analytics
+        # antes da primeira navegação. O Playwright avalia primeiro a última
+        # rota registrada, então o bloqueio tem precedência sobre o cache.
+        context.route(_RECURSOS_ESTATICOS_RE, _servir_recurso_estatico)
+        context.route(_RECURSOS_BLOQUEADOS_RE, lambda route: route.abort())
+        
+        def _remover_do_pool(_context: BrowserContext) -> None:
+            # Contexto fechado por quem chamou ou pelo encerramento do navegador
+            if contextos.get(chave, (None,))[0] is context:
+                del contextos[chave]
+        
+        context.on("close", _remover_do_pool)
+        contextos[chave] = (context, hash_pfx)
+        if len(contextos) > _TAMANHO_POOL_CONTEXTOS:
+            _, (contexto_antigo, _) = contextos.popitem(last=False)
+            contexto_antigo.close()
+        tempos["contexto"] = round((time.perf_counter() - inicio_contexto) * 1000, 1)
         
         logger.info("✅ Contexto do navegador criado com certificado cliente configurado")
         logger.info("   O certificado será usado automaticamente para autenticação")
@@ -204,10 +586,35 @@ def criar_contexto_com_certificado(
         raise NFSeAutenticacaoError(error_msg)
 
 
+def _fechar_pagina_e_contexto(page: Optional[Page], context: Optional[BrowserContext]) -> None:
+    """
+    Fecha a página e o contexto de um login (o navegador compartilhado fica aberto).
+    
+    Contextos que estão no pool da thread não são fechados: apenas a página,
+    para que o próximo login do mesmo CNPJ reaproveite o contexto.
+    
+    Args:
+        page: Página do login, se criada
+        context: Contexto do login, se criado
+    """
+    contextos = getattr(_instancias_thread, "contextos", {})
+    if any(context is em_pool for em_pool, _ in contextos.values()):
+        context = None
+    
+    for recurso in (page, context):
+        if recurso:
+            try:
+                recurso.close()
+            except PlaywrightError:
+                # Já fechado (ex: navegador encerrado)
+                pass
+
+
 def abrir_dashboard_nfse(
     cnpj: str,
     headless: bool = False,
-    timeout: int = 30000
+    timeout: int = 30000,
+    manter_aberto: bool = False
 ) -> dict:
     """
     Abre o dashboard do portal NFSe Nacional autenticado com certificado A1.
@@ -219,10 +626,16 @@ def abrir_dashboard_nfse(
     4. Espera por elementos que confirmem o login bem-sucedido
     5. Retorna informações sobre o resultado da autenticação
     
+    Em modo headless, page e context são fechados antes do retorno, a menos
+    que manter_aberto seja True; nesse caso quem chama passa a ser dono deles
+    e deve fechá-los (ver sessao_nfse). O navegador e o Playwright são
+    compartilhados entre logins e não fazem parte do resultado.
+    
     Args:
         cnpj: CNPJ da empresa (sem formatação, apenas números)
         headless: Se True, executa o navegador em modo headless (padrão: False - navegador visível)
         timeout: Timeout em milissegundos para operações do Playwright
+        manter_aberto: Se True, não fecha page e context ao final (mesmo em headless)
         
     Returns:
         Dicionário com informações sobre o resultado:
@@ -231,15 +644,18 @@ def abrir_dashboard_nfse(
             "url_atual": str,
             "titulo": str,
             "mensagem": str,
-            "logs": list[str]
+            "logs": list[str],
+            "tempos": dict[str, float],  # duração (ms) de cada etapa e "total"
+            "page": Page,
+            "context": BrowserContext
         }
         
     Raises:
         NFSeAutenticacaoError: Se a autenticação falhar
     """
     logs = []
-    playwright_instance = None
-    browser = None
+    tempos: Dict[str, float] = {}
+    inicio = time.perf_counter()
     context = None
     page = None
     
@@ -247,32 +663,24 @@ def abrir_dashboard_nfse(
         """Helper para logging com coleta de mensagens"""
         logger.info(msg)
         logs.append(msg)
-        print(msg)
     
     try:
         log(f"🚀 Iniciando automação NFSe para CNPJ: {cnpj}")
         
         # Cria contexto com certificado
         log("📋 Criando contexto do navegador com certificado A1...")
-        playwright_instance, browser, context = criar_contexto_com_certificado(
+        _, _, context = criar_contexto_com_certificado(
             cnpj=cnpj,
             headless=headless,
-            ignore_https_errors=True
+            ignore_https_errors=True,
+            tempos=tempos
         )
         log("✅ Contexto criado com sucesso")
         
         # Cria uma nova página
         log("📄 Criando nova página...")
-        page = context.new_page()
-        
-        # Maximiza a janela para fullscreen (1920x1080) quando não estiver em headless
-        if not headless:
-            try:
-                # Tenta maximizar a janela do navegador
-                page.set_viewport_size({"width": 1920, "height": 1080})
-                log("✅ Janela configurada para 1920x1080p (Full HD)")
-            except Exception as e:
-                log(f"⚠️  Não foi possível maximizar janela: {e}")
+        with _medir("pagina", tempos):
+            page = context.new_page()
         
         log("✅ Página criada")
         
@@ -280,113 +688,60 @@ def abrir_dashboard_nfse(
         log(f"🌐 Acessando portal NFSe Nacional: {BASE_URL}")
         # Usa 'domcontentloaded' ao invés de 'networkidle' para ser mais rápido
         # 'networkidle' espera por até 500ms sem requisições de rede, o que pode ser lento
-        page.goto(BASE_URL, wait_until="domcontentloaded", timeout=timeout)
+        with _medir("goto", tempos):
+            page.goto(BASE_URL, wait_until="domcontentloaded", timeout=timeout)
         log(f"✅ Página carregada: {page.url}")
         
-        # Aguarda apenas o necessário para elementos críticos carregarem
-        # Reduzido de 2000ms para 500ms - otimização de tempo
-        page.wait_for_timeout(500)
-        
-        # Tenta detectar se estamos na página de login ou já autenticados
-        current_url = page.url
-        page_title = page.title()
-        
-        log(f"📍 URL atual: {current_url}")
-        log(f"📝 Título da página: {page_title}")
-        
-        # Verifica se há elementos que indicam página de login
-        login_selectors = [
-            'button:has-text("Certificado")',
-            'a:has-text("Certificado")',
-            'input[type="button"][value*="ertificado"]',
-            '#btnCertificado',
-            '.btn-certificado',
-        ]
-        
-        # Verifica se há elementos que indicam dashboard/página autenticada
-        dashboard_selectors = [
-            'text=Dashboard',
-            'text=Painel',
-            '[href*="Dashboard"]',
-            '.dashboard',
-            '#dashboard',
-        ]
-        
-        # Tenta encontrar seletor de login
-        login_element = None
-        for selector in login_selectors:
-            try:
-                login_element = page.query_selector(selector)
-                if login_element:
-                    log(f"🔍 Encontrado elemento de login: {selector}")
-                    break
-            except:
-                continue
-        
-        # Tenta encontrar seletor de dashboard
-        dashboard_element = None
-        for selector in dashboard_selectors:
-            try:
-                dashboard_element = page.query_selector(selector)
-                if dashboard_element:
-                    log(f"✅ Encontrado elemento de dashboard: {selector}")
-                    break
-            except:
-                continue
-        
-        # Se encontrou elemento de login, tenta clicar
-        if login_element and not dashboard_element:
-            log("🔐 Elemento de login encontrado - tentando autenticar...")
+        with _medir("deteccao", tempos):
+            # Aguarda até que o botão de login ou o dashboard esteja no DOM
             try:
-                # Clica no botão de certificado
-                login_element.click(timeout=5000)
-                log("✅ Clique no botão de certificado realizado")
-                
-                # Aguarda redirecionamento de forma mais eficiente
-                # Reduzido de 3000ms para espera condicional - otimização de tempo
-                try:
-                    # Espera por mudança de URL ou elementos do dashboard (mais rápido)
-                    page.wait_for_load_state("domcontentloaded", timeout=10000)
-                    # Aguarda um pouco para JavaScript processar
-                    page.wait_for_timeout(500)
-                    
-                    # Verifica se dashboard apareceu
-                    page.wait_for_selector(
-                        'text=Dashboard',
-                        timeout=5000,
-                        state="visible"
-                    )
-                    log("✅ Dashboard detectado após autenticação!")
-                except:
-                    # Fallback: aguarda carregamento completo se necessário
-                    try:
-                        page.wait_for_load_state("load", timeout=5000)
-                        log("✅ Página carregada completamente")
-                    except:
-                        pass
-                
-            except Exception as e:
-                log(f"⚠️  Erro ao clicar no botão de certificado: {str(e)}")
-                # Continua mesmo assim, pode ter autenticado automaticamente
-        elif dashboard_element:
+                page.wait_for_selector(f"{LOGIN_SEL}, {DASH_SEL}", timeout=timeout, state="attached")
+            except PlaywrightTimeoutError:
+                # Segue para a detecção abaixo, que reporta a ausência dos elementos
+                pass
+            
+            # Verifica primeiro o dashboard; o botão de login só é usado se a
+            # página ainda não estiver autenticada
+            dashboard_visivel = page.locator(DASH_SEL).first.is_visible()
+        
+        if dashboard_visivel:
             log("✅ Já autenticado - dashboard detectado diretamente!")
         else:
-            log("⚠️  Não foi possível detectar elementos de login ou dashboard")
-            log("   Continuando com a URL atual...")
-        
-        # Verifica URL final
+            with _medir("autenticacao", tempos):
+                # O locator aguarda o botão de certificado ficar clicável e clica na
+                # mesma operação; a navegação para fora do login é aguardada junto
+                clicou = False
+                try:
+                    with page.expect_navigation(
+                        url=_url_autenticada,
+                        wait_until="domcontentloaded",
+                        timeout=timeout
+                    ):
+                        page.locator(LOGIN_SEL).first.click(timeout=5000)
+                        clicou = True
+                        log("🔐 Clique no botão de certificado realizado - autenticando...")
+                    log("✅ Dashboard alcançado após autenticação!")
+                
+                except PlaywrightTimeoutError:
+                    if clicou:
+                        log("⚠️  Dashboard não alcançado dentro do tempo limite")
+                    else:
+                        log("⚠️  Não foi possível detectar elementos de login ou dashboard")
+                        log("   Continuando com a URL atual...")
+                except PlaywrightError as e:
+                    log(f"⚠️  Erro ao clicar no botão de certificado: {str(e)}")
+                    # Continua mesmo assim, pode ter autenticado automaticamente
+        
+        # URL e título são lidos uma única vez, após a autenticação
         final_url = page.url
         final_title = page.title()
+        tempos["total"] = round((time.perf_counter() - inicio) * 1000, 1)
         
         log(f"📍 URL final: {final_url}")
         log(f"📝 Título final: {final_title}")
         
         # Determina se o login foi bem-sucedido
-        sucesso = (
-            "Dashboard" in final_url or
-            "Login" not in final_url or
-            dashboard_element is not None
-        )
+        sucesso = _url_autenticada(final_url) or dashboard_visivel
         
         if sucesso:
             log("🎉 Autenticação bem-sucedida!")
@@ -395,16 +750,17 @@ def abrir_dashboard_nfse(
             log("⚠️  Possível falha na autenticação")
             mensagem = "Não foi possível confirmar acesso ao dashboard"
         
+        log("⏱️  Tempos (ms): " + ", ".join(f"{etapa}={ms}" for etapa, ms in tempos.items()))
+        
         return {
             "sucesso": sucesso,
             "url_atual": final_url,
             "titulo": final_title,
             "mensagem": mensagem,
             "logs": logs,
+            "tempos": tempos,
             "page": page,
             "context": context,
-            "browser": browser,
-            "playwright": playwright_instance
         }
         
     except Exception as e:
@@ -412,40 +768,223 @@ def abrir_dashboard_nfse(
         logger.error(f"❌ {error_msg}")
         logs.append(f"❌ ERRO: {error_msg}")
         
+        # Em caso de erro o contexto nunca chega a quem chamou
+        if manter_aberto:
+            _fechar_pagina_e_contexto(page, context)
+        
         raise NFSeAutenticacaoError(error_msg)
         
     finally:
-        # Se estiver em modo headless, fecha tudo automaticamente
+        # Se estiver em modo headless, fecha a página e o contexto automaticamente
+        # (o navegador é compartilhado entre logins e fica aberto)
         # Se não estiver em headless, mantém o navegador aberto para o usuário ver
-        if headless:
-            # Limpa recursos apenas em modo headless
-            if page:
-                try:
-                    page.close()
-                except:
-                    pass
-            
-            if context:
-                try:
-                    context.close()
-                except:
-                    pass
-            
-            if browser:
-                try:
-                    browser.close()
-                except:
-                    pass
-            
-            if playwright_instance:
-                try:
-                    playwright_instance.stop()
-                except:
-                    pass
-            
+        # Com manter_aberto, quem chamou é responsável por fechá-los
+        if headless and not manter_aberto:
+            _fechar_pagina_e_contexto(page, context)
             log("🧹 Recursos liberados (modo headless)")
-        else:
+        elif not headless:
             # Em modo visível, mantém o navegador aberto
             log("🌐 Navegador mantido aberto para visualização")
             log("   O navegador será fechado quando o script terminar")
 
+
+@contextmanager
+def sessao_nfse(
+    cnpj: str,
+    headless: bool = True,
+    timeout: int = 30000
+) -> Iterator[dict]:
+    """
+    Login no portal NFSe cuja página é fechada ao sair do bloco with.
+    
+    O contexto volta ao pool de contextos da thread (ver
+    criar_contexto_com_certificado) para o próximo login do mesmo CNPJ.
+    
+    Exemplo:
+        with sessao_nfse(cnpj) as resultado:
+            page = resultado["page"]
+            ...
+    
+    Args:
+        cnpj: CNPJ da empresa (sem formatação, apenas números)
+        headless: Se True, executa o navegador em modo headless
+        timeout: Timeout em milissegundos para operações do Playwright
+        
+    Yields:
+        O resultado de abrir_dashboard_nfse, com page e context abertos
+        
+    Raises:
+        NFSeAutenticacaoError: Se a autenticação falhar
+    """
+    resultado = abrir_dashboard_nfse(cnpj, headless=headless, timeout=timeout, manter_aberto=True)
+    try:
+        yield resultado
+    finally:
+        _fechar_pagina_e_contexto(resultado["page"], resultado["context"])
+
+
+async def abrir_dashboard_nfse_async(
+    cnpj: str,
+    browser: AsyncBrowser,
+    timeout: int = 30000
+) -> dict:
+    """
+    Versão assíncrona do login no portal NFSe, para vários CNPJs em paralelo.
+    
+    Segue o mesmo fluxo de abrir_dashboard_nfse, em um contexto próprio do
+    browser recebido (compartilhado entre as tarefas). O contexto é fechado
+    ao final, então o resultado não inclui page/context/browser.
+    
+    Args:
+        cnpj: CNPJ da empresa (sem formatação, apenas números)
+        browser: Chromium da async_api compartilhado pelos logins
+        timeout: Timeout em milissegundos para operações do Playwright
+        
+    Returns:
+        Dicionário com sucesso, url_atual, titulo, mensagem, logs e tempos
+        
+    Raises:
+        NFSeAutenticacaoError: Se a autenticação falhar
+    """
+    logs = []
+    tempos: Dict[str, float] = {}
+    inicio = time.perf_counter()
+    
+    def log(msg: str):
+        """Helper para logging com coleta de mensagens"""
+        logger.info(f"[{cnpj}] {msg}")
+        logs.append(msg)
+    
+    # A leitura e descriptografia do certificado são síncronas
+    with _medir("certificado", tempos):
+        conteudo_pfx, senha = await asyncio.to_thread(_carregar_certificado, cnpj)
+    
+    context = None
+    try:
+        with _medir("contexto", tempos):
+            context = await browser.new_context(**_opcoes_contexto(conteudo_pfx, senha, True))
+            await context.route(_RECURSOS_ESTATICOS_RE, _servir_recurso_estatico_async)
+            await context.route(_RECURSOS_BLOQUEADOS_RE, lambda route: route.abort())
+            page = await context.new_page()
+        
+        log(f"🌐 Acessando portal NFSe Nacional: {BASE_URL}")
+        with _medir("goto", tempos):
+            await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=timeout)
+        
+        with _medir("deteccao", tempos):
+            try:
+                await page.wait_for_selector(f"{LOGIN_SEL}, {DASH_SEL}", timeout=timeout, state="attached")
+            except PlaywrightTimeoutError:
+                pass
+            dashboard_visivel = await page.locator(DASH_SEL).first.is_visible()
+        
+        if dashboard_visivel:
+            log("✅ Já autenticado - dashboard detectado diretamente!")
+        else:
+            with _medir("autenticacao", tempos):
+                clicou = False
+                try:
+                    async with page.expect_navigation(
+                        url=_url_autenticada,
+                        wait_until="domcontentloaded",
+                        timeout=timeout
+                    ):
+                        await page.locator(LOGIN_SEL).first.click(timeout=5000)
+                        clicou = True
+                    log("✅ Dashboard alcançado após autenticação!")
+                except PlaywrightTimeoutError:
+                    if clicou:
+                        log("⚠️  Dashboard não alcançado dentro do tempo limite")
+                    else:
+                        log("⚠️  Não foi possível detectar elementos de login ou dashboard")
+        
+        final_url = page.url
+        final_title = await page.title()
+        tempos["total"] = round((time.perf_counter() - inicio) * 1000, 1)
+        sucesso = _url_autenticada(final_url) or dashboard_visivel
+        mensagem = (
+            "Dashboard acessado com sucesso" if sucesso
+            else "Não foi possível confirmar acesso ao dashboard"
+        )
+        log(f"{'🎉' if sucesso else '⚠️ '} {mensagem}")
+        log("⏱️  Tempos (ms): " + ", ".join(f"{etapa}={ms}" for etapa, ms in tempos.items()))
+        
+        return {
+            "sucesso": sucesso,
+            "url_atual": final_url,
+            "titulo": final_title,
+            "mensagem": mensagem,
+            "logs": logs,
+            "tempos": tempos,
+        }
+        
+    except Exception as e:
+        error_msg = f"Erro durante automação NFSe: {str(e)}"
+        logger.error(f"❌ [{cnpj}] {error_msg}")
+        raise NFSeAutenticacaoError(error_msg)
+        
+    finally:
+        if context:
+            try:
+                await context.close()
+            except PlaywrightError:
+                pass
+
+
+async def _abrir_dashboards_async(
+    cnpjs: List[str],
+    headless: bool,
+    concorrencia: int,
+    timeout: int
+) -> List[Union[dict, BaseException]]:
+    """Executa abrir_dashboard_nfse_async para cada CNPJ em um único Chromium."""
+    semaforo = asyncio.Semaphore(concorrencia)
+    
+    async with async_playwright() as playwright:
+        if _CDP_ENDPOINT:
+            browser = await playwright.chromium.connect_over_cdp(_CDP_ENDPOINT)
+        else:
+            browser = await playwright.chromium.launch(headless=headless, args=_ARGS_CHROMIUM)
+        
+        async def _login(cnpj: str) -> dict:
+            # O semáforo limita quantos contextos ficam abertos ao mesmo tempo
+            async with semaforo:
+                return await abrir_dashboard_nfse_async(cnpj, browser, timeout=timeout)
+        
+        try:
+            return await asyncio.gather(*(_login(cnpj) for cnpj in cnpjs), return_exceptions=True)
+        finally:
+            await browser.close()
+
+
+def abrir_dashboards_em_lote(
+    cnpjs: List[str],
+    headless: bool = True,
+    concorrencia: int = _CONCORRENCIA_LOGINS,
+    timeout: int = 30000
+) -> List[Union[dict, BaseException]]:
+    """
+    Faz o login no portal NFSe para vários CNPJs em paralelo.
+    
+    Usa a async_api do Playwright: um único Chromium, com um contexto por
+    CNPJ e no máximo `concorrencia` contextos abertos ao mesmo tempo. Não
+    deve ser chamada de dentro de um event loop em execução (use
+    abrir_dashboard_nfse_async nesse caso).
+    
+    Args:
+        cnpjs: Lista de CNPJs (sem formatação, apenas números)
+        headless: Se True, executa o navegador em modo headless
+        concorrencia: Número máximo de logins simultâneos
+        timeout: Timeout em milissegundos para operações do Playwright
+        
+    Returns:
+        Lista na mesma ordem dos CNPJs, com o resultado do login ou a exceção
+    """
+    logger.info(f"🚀 Iniciando {len(cnpjs)} login(s) em lote (concorrência: {concorrencia})")
+    resultados = asyncio.run(_abrir_dashboards_async(cnpjs, headless, concorrencia, timeout))
+    
+    falhas = sum(1 for resultado in resultados if isinstance(resultado, BaseException))
+    if falhas:
+        logger.warning(f"⚠️ {falhas} de {len(cnpjs)} login(s) falharam")
+    
+    return resultados
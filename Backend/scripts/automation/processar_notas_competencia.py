@@ -5,16 +5,19 @@ Este módulo implementa a varredura completa de notas emitidas e recebidas para
 competência específica, fazendo download de XML e DANFS-e (PDF) para notas válidas.
 """
 
+import asyncio
 import logging
+import re
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 
 # Importa o módulo de gerenciamento de downloads
 from .download_manager import (
     set_downloads_base_path as set_base_path,
     get_download_base_path,
-    salvar_download_direto
+    salvar_download_direto,
+    baixar_arquivos_em_lote
 )
 
 # Configuração de logging
@@ -24,6 +27,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Lê, em uma única chamada ao navegador, os dados de todas as linhas da tabela:
+# competência (3ª coluna), alt/src do ícone de status (6ª coluna) e o texto da
+# primeira das 4 primeiras colunas que contém dígitos (número da nota), além
+# dos hrefs dos links de download do XML e do DANFS-e presentes no menu da linha
+_JS_DADOS_LINHAS = """
+linhas => linhas.map(tr => {
+    const celulas = Array.from(tr.cells);
+    const img = celulas[5] ? celulas[5].querySelector('img') : null;
+    const celulaNumero = celulas.slice(0, 4).find(td => /\\d/.test(td.innerText));
+    return {
+        competencia: celulas[2] ? celulas[2].innerText.trim() : null,
+        alt: img ? img.getAttribute('alt') : null,
+        src: img ? img.getAttribute('src') : null,
+        numero_nota: celulaNumero ? celulaNumero.innerText.trim() : null,
+        href_xml: (tr.querySelector('a[href*="/Download/NFSe/" i]') || {}).href || null,
+        href_pdf: (tr.querySelector('a[href*="/Download/DANFSe/" i]') || {}).href || null,
+    };
+})
+"""
+
+# Lê apenas [alt, src] do ícone de status (6ª coluna) de cada linha
+_JS_STATUS_LINHA = """
+linhas => linhas.map(tr => {
+    const img = tr.cells[5] ? tr.cells[5].querySelector('img') : null;
+    return img ? [img.getAttribute('alt'), img.getAttribute('src')] : [null, null];
+})
+"""
+
+# Termos que indicam nota cancelada/inválida no alt e no src do ícone de status
+_TERMOS_INVALIDA_ALT = ("cancelada", "cancel", "inválida", "invalid")
+_TERMOS_INVALIDA_SRC = ("cancel", "invalid")
+
+# Links de download do menu de ações da linha (CSS simples, resolvidos dentro
+# do menu; get_by_role calcularia o nome acessível de cada elemento da página)
+_XML_SEL = 'a:has-text("XML"), a[href*="xml" i]'
+_PDF_SEL = 'a:has-text("DANFS"), a[href*="danfs" i]'
+
+# Arquivos baixados de cada nota, com o seletor do link no menu e a chave do
+# href lido por _JS_DADOS_LINHAS
+_ARQUIVOS_NOTA = ("XML", "DANFS-e")
+_SELETOR_ARQUIVO = {"XML": _XML_SEL, "DANFS-e": _PDF_SEL}
+_HREF_ARQUIVO = {"XML": "href_xml", "DANFS-e": "href_pdf"}
+
+# Competência no formato "MM/AAAA"
+_COMPETENCIA_RE = re.compile(r"(\d{2})/(\d{4})")
+
+# Tempo máximo (s) de espera por cada download disparado no menu de ações
+_TIMEOUT_DOWNLOAD = 30
+
+# Número padrão de abas que baixam as notas de uma página da tabela em paralelo
+_CONCORRENCIA_LINHAS = 4
+
 
 def set_downloads_base_path(path: str) -> None:
     """
@@ -41,6 +96,75 @@ def set_downloads_base_path(path: str) -> None:
 # Use salvar_download_direto() do módulo download_manager para salvar downloads
 
 
+def _nota_valida(alt_text: Optional[str], src_text: Optional[str]) -> bool:
+    """
+    Verifica pelos atributos do ícone de status se uma nota fiscal é válida.
+    
+    Args:
+        alt_text: Atributo alt do ícone (None se não houver ícone)
+        src_text: Atributo src do ícone (None se não houver ícone)
+        
+    Returns:
+        False se algum atributo indicar nota cancelada/inválida, True caso contrário
+    """
+    # Considera válida se não houver indicadores de inválida/cancelada
+    if alt_text:
+        alt_lower = alt_text.lower()
+        if any(palavra in alt_lower for palavra in _TERMOS_INVALIDA_ALT):
+            return False
+    
+    if src_text:
+        src_lower = src_text.lower()
+        if any(palavra in src_lower for palavra in _TERMOS_INVALIDA_SRC):
+            return False
+    
+    return True
+
+
+def _chave_competencia(competencia: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Converte uma competência "MM/AAAA" em uma chave ordenável (ano, mês).
+    
+    Args:
+        competencia: Competência no formato "MM/AAAA" (ex: "10/2025")
+        
+    Returns:
+        Tupla (ano, mês) ou None se o texto não estiver no formato esperado
+    """
+    match = _COMPETENCIA_RE.fullmatch((competencia or "").strip())
+    if not match:
+        return None
+    return int(match.group(2)), int(match.group(1))
+
+
+def _formatar_numero_nota(texto: Optional[str]) -> Optional[str]:
+    """
+    Converte o texto da célula com o número da nota em um prefixo de nome de arquivo.
+    
+    Args:
+        texto: Texto da célula (None se nenhuma célula tiver dígitos)
+        
+    Returns:
+        Texto sem barras e espaços, limitado a 50 caracteres, ou None
+    """
+    if not texto:
+        return None
+    return texto.replace("/", "-").replace("\\", "-").replace(" ", "_")[:50]
+
+
+async def coletar_dados_linhas(page: Page) -> List[Dict[str, Any]]:
+    """
+    Coleta os dados de todas as linhas da tabela em uma única chamada ao navegador.
+    
+    Args:
+        page: Página do Playwright com a tabela de notas carregada
+        
+    Returns:
+        Lista (na ordem da tabela) de dicts com competencia, alt, src e numero_nota
+    """
+    return await page.locator("table tbody tr").evaluate_all(_JS_DADOS_LINHAS)
+
+
 async def verificar_nota_valida(row_locator) -> bool:
     """
     Verifica se uma nota fiscal é válida baseado no ícone na coluna 6.
@@ -52,49 +176,41 @@ async def verificar_nota_valida(row_locator) -> bool:
         True se a nota for válida, False caso contrário
     """
     try:
-        # Tenta encontrar o ícone na coluna 6 (índice 5, pois começa em 0)
-        # Para emitidas: coluna 6, para recebidas: coluna 6 também
-        celulas = row_locator.locator("td")
-        coluna_status = celulas.nth(5)  # 6ª coluna (índice 5)
-        
-        # Procura por imagem na coluna de status
-        img_status = coluna_status.locator("img")
-        
-        if await img_status.count() > 0:
-            # Verifica atributos que indicam nota válida
-            alt_text = await img_status.get_attribute("alt")
-            src_text = await img_status.get_attribute("src")
-            class_text = await img_status.get_attribute("class")
-            
-            # Considera válida se não houver indicadores de inválida/cancelada
-            if alt_text:
-                alt_lower = alt_text.lower()
-                if any(palavra in alt_lower for palavra in ["cancelada", "cancel", "inválida", "invalid"]):
-                    return False
-            
-            if src_text:
-                src_lower = src_text.lower()
-                if any(palavra in src_lower for palavra in ["cancel", "invalid"]):
-                    return False
-            
-            # Se não encontrou indicadores negativos, assume válida
+        # Lê alt e src do ícone em uma única chamada ao navegador
+        status = await row_locator.evaluate_all(_JS_STATUS_LINHA)
+        if not status:
             return True
-        
-        # Se não encontrou imagem, assume válida por padrão
-        return True
+        return _nota_valida(*status[0])
         
     except Exception as e:
         logger.warning(f"Erro ao verificar validade da nota: {e}. Assumindo válida.")
         return True
 
 
+async def _garantir_menu(menu_suspenso, icone_acoes, aberto: bool) -> None:
+    """
+    Deixa o menu de ações da linha aberto ou fechado, clicando no ícone só se necessário.
+    
+    Args:
+        menu_suspenso: Locator do menu suspenso da linha
+        icone_acoes: Locator do ícone que alterna o menu
+        aberto: True para abrir o menu, False para fechá-lo
+    """
+    if await menu_suspenso.is_visible() != aberto:
+        await icone_acoes.click()
+    if aberto:
+        await menu_suspenso.wait_for(state='visible', timeout=3000)
+
+
 async def baixar_arquivos_da_linha(
     page: Page,
     row_locator,
     competencia_alvo: str,
     nome_empresa: str,
     tipo_nota: str,
-) -> None:
+    numero_nota: Optional[str] = None,
+    arquivos: Tuple[str, ...] = _ARQUIVOS_NOTA,
+) -> bool:
     """
     Baixa XML e DANFS-e (PDF) de uma linha da tabela.
     
@@ -107,6 +223,13 @@ async def baixar_arquivos_da_linha(
         competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
         nome_empresa: Nome da empresa (do certificado digital)
         tipo_nota: "Emitidas" ou "Recebidas"
+        numero_nota: Prefixo do nome dos arquivos, já lido com coletar_dados_linhas
+            (se None, é extraído das células da linha)
+        arquivos: Arquivos a baixar ("XML" e/ou "DANFS-e")
+            
+    Returns:
+        True se todos os arquivos pedidos foram baixados e salvos, False caso contrário
+        (os erros são registrados no log)
     """
     try:
         # Obtém o caminho base configurado
@@ -120,376 +243,430 @@ async def baixar_arquivos_da_linha(
         # Extrai informações da linha para criar nomes de arquivo melhores
         celulas = row_locator.locator("td")
         
-        # Tenta extrair número da nota ou data de emissão da linha
-        numero_nota = None
-        try:
-            # Tenta várias colunas comuns onde pode estar o número da nota
-            for idx in [0, 1, 2, 3]:
-                try:
-                    texto_celula = await celulas.nth(idx).inner_text()
-                    texto_celula = texto_celula.strip()
-                    # Se contém números que parecem número de nota
-                    if texto_celula and any(c.isdigit() for c in texto_celula):
-                        numero_nota = texto_celula.replace("/", "-").replace("\\", "-").replace(" ", "_")
-                        # Limita tamanho do nome
-                        if len(numero_nota) > 50:
-                            numero_nota = numero_nota[:50]
-                        break
-                except:
-                    continue
-        except Exception as e:
-            logger.warning(f"Não foi possível extrair número da nota: {e}")
+        # Extrai número da nota ou data de emissão da linha, se não foi informado
+        if numero_nota is None:
+            try:
+                dados = await row_locator.evaluate_all(_JS_DADOS_LINHAS)
+                if dados:
+                    numero_nota = _formatar_numero_nota(dados[0]["numero_nota"])
+            except Exception as e:
+                logger.warning(f"Não foi possível extrair número da nota: {e}")
         
         # Clica no ícone de ações da nota
         coluna_acoes = celulas.nth(coluna_acoes_idx)
         icone_acoes = coluna_acoes.locator("div a i, a i").first
         
-        # Abre o menu de ações
-        await icone_acoes.click()
-        logger.info(f"Menu de ações aberto para nota {tipo_nota}")
-        
-        # Aguarda o popover aparecer - usa seletor do menu suspenso
+        # Abre o menu de ações (o popover usa o seletor do menu suspenso)
         menu_suspenso = row_locator.locator('.menu-suspenso-tabela')
-        await menu_suspenso.wait_for(state='visible', timeout=3000)
-        
-        # ============================================================
-        # BAIXA XML
-        # ============================================================
-        try:
-            logger.info(f"Baixando XML da nota {tipo_nota}...")
-            
-            # Intercepta o download
-            async with page.expect_download() as download_info:
-                # Encontra o link de download XML
-                link_xml = None
-                try:
-                    link_xml = page.get_by_role("link", name="Download XML").first
-                    if await link_xml.count() == 0:
-                        raise Exception("Role não encontrado")
-                except:
-                    # Fallback: tenta encontrar por texto dentro do menu suspenso
-                    link_xml = menu_suspenso.locator('a:has-text("XML")').first
-                
-                await link_xml.wait_for(state='visible', timeout=2000)
-                await link_xml.click()
-            
-            download = await download_info.value
-            
-            # Usa o módulo download_manager para salvar corretamente
-            prefixo_nome = f"{numero_nota}_" if numero_nota else None
-            arquivo_xml = await salvar_download_direto(
-                download=download,
-                base_path=base_path,
-                competencia=competencia_alvo,
-                empresa=nome_empresa,
-                tipo_nota=tipo_nota,
-                nome_arquivo_prefixo=prefixo_nome
-            )
-            logger.info(f"✅ XML baixado e salvo em: {arquivo_xml}")
-            
-        except Exception as e:
-            logger.error(f"Erro ao baixar XML: {e}")
-            import traceback
-            logger.debug(traceback.format_exc())
+        await _garantir_menu(menu_suspenso, icone_acoes, aberto=True)
+        logger.info(f"Menu de ações aberto para nota {tipo_nota}")
         
-        # Fecha o menu e reabre para baixar o PDF
-        await icone_acoes.click()  # Fecha o menu
-        await page.wait_for_timeout(200)
+        # Localiza os links do menu (XML e/ou DANFS-e); a falta de um deles
+        # não impede o download do outro
+        links = {}
+        for rotulo in arquivos:
+            link = menu_suspenso.locator(_SELETOR_ARQUIVO[rotulo]).first
+            try:
+                await link.wait_for(state='visible', timeout=2000)
+                links[rotulo] = await link.element_handle()
+            except PlaywrightTimeoutError:
+                logger.error(f"Link de download {rotulo} não encontrado no menu da nota {tipo_nota}")
         
-        # Reabre o menu para baixar DANFS-e
-        await icone_acoes.click()
-        await menu_suspenso.wait_for(state='visible', timeout=3000)
+        if not links:
+            await _garantir_menu(menu_suspenso, icone_acoes, aberto=False)
+            return False
         
-        # ============================================================
-        # BAIXA DANFS-e (PDF)
-        # ============================================================
+        # Dispara os downloads de uma vez: os cliques são feitos em uma única
+        # chamada ao navegador, então o fechamento do menu após o primeiro
+        # clique não impede o segundo
+        logger.info(f"Baixando {' e '.join(links)} da nota {tipo_nota}...")
+        fila_downloads: asyncio.Queue = asyncio.Queue()
+        ao_baixar = fila_downloads.put_nowait
+        page.on("download", ao_baixar)
+        downloads = []
         try:
-            logger.info(f"Baixando DANFS-e (PDF) da nota {tipo_nota}...")
-            
-            # Intercepta o download
-            async with page.expect_download() as download_info:
-                # Encontra o link de download DANFS-e
-                link_danfse = None
-                try:
-                    link_danfse = page.get_by_role("link", name="Download DANFS-e").first
-                    if await link_danfse.count() == 0:
-                        raise Exception("Role não encontrado")
-                except:
-                    # Fallback: tenta encontrar por texto dentro do menu suspenso
-                    link_danfse = menu_suspenso.locator('a:has-text("DANFS-e")').first
-                
-                await link_danfse.wait_for(state='visible', timeout=2000)
-                await link_danfse.click()
-            
-            download = await download_info.value
-            
-            # Usa o módulo download_manager para salvar corretamente
-            prefixo_nome = f"{numero_nota}_" if numero_nota else None
-            arquivo_pdf = await salvar_download_direto(
-                download=download,
-                base_path=base_path,
-                competencia=competencia_alvo,
-                empresa=nome_empresa,
-                tipo_nota=tipo_nota,
-                nome_arquivo_prefixo=prefixo_nome
+            await page.evaluate("links => links.forEach(link => link.click())", list(links.values()))
+            for _ in links:
+                downloads.append(await asyncio.wait_for(fila_downloads.get(), _TIMEOUT_DOWNLOAD))
+        except asyncio.TimeoutError:
+            # Os downloads que chegaram ainda são salvos abaixo
+            logger.error(
+                f"{len(links) - len(downloads)} de {len(links)} download(s) não iniciaram "
+                f"em {_TIMEOUT_DOWNLOAD}s"
             )
-            logger.info(f"✅ DANFS-e baixado e salvo em: {arquivo_pdf}")
-            
-        except Exception as e:
-            logger.error(f"Erro ao baixar DANFS-e: {e}")
-            import traceback
-            logger.debug(traceback.format_exc())
+        finally:
+            page.remove_listener("download", ao_baixar)
         
-        # Fecha o menu novamente
-        await icone_acoes.click()
-        await page.wait_for_timeout(200)
+        # Salva os arquivos em paralelo; a extensão (XML ou PDF) é detectada
+        # pelo download_manager a partir do conteúdo
+        prefixo_nome = f"{numero_nota}_" if numero_nota else None
+        resultados = await asyncio.gather(
+            *(
+                salvar_download_direto(
+                    download=download,
+                    base_path=base_path,
+                    competencia=competencia_alvo,
+                    empresa=nome_empresa,
+                    tipo_nota=tipo_nota,
+                    nome_arquivo_prefixo=prefixo_nome
+                )
+                for download in downloads
+            ),
+            return_exceptions=True,
+        )
+        salvos = 0
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                logger.error(f"Erro ao salvar download: {resultado}")
+            else:
+                salvos += 1
+                logger.info(f"✅ Arquivo baixado e salvo em: {resultado}")
+        
+        # Fecha o menu, se os cliques nos links não o fecharam
+        await _garantir_menu(menu_suspenso, icone_acoes, aberto=False)
+        return salvos == len(arquivos)
         
     except Exception as e:
         logger.error(f"Erro ao baixar arquivos da linha: {e}")
-        import traceback
-        logger.debug(traceback.format_exc())
+        # exc_info só formata o traceback se o nível DEBUG estiver habilitado
+        logger.debug("Detalhes do erro ao baixar arquivos da linha", exc_info=True)
+        return False
 
 
-async def processar_tabela_emitidas(page: Page, competencia_alvo: str, nome_empresa: str) -> None:
+async def _baixar_linhas_por_href(
+    page: Page,
+    linhas_validas: List[Tuple[int, Dict[str, Any]]],
+    competencia_alvo: str,
+    nome_empresa: str,
+    tipo_nota: str,
+    concorrencia: int,
+) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[int, Tuple[str, ...]]]:
     """
-    Processa a tabela de notas emitidas, varrendo todas as páginas.
+    Baixa via HTTP o XML e o DANFS-e das linhas cujos links já estão na tabela.
+    
+    As requisições usam o APIRequestContext do contexto do navegador, que
+    compartilha cookies e certificado digital da sessão, sem abrir menus nem
+    aguardar eventos de download. Os arquivos recebem o mesmo nome que
+    teriam no download pelo menu (salvar_download_direto).
     
     Args:
-        page: Página do Playwright
+        page: Página do Playwright com a tabela carregada
+        linhas_validas: Lista de (índice da linha, dados de coletar_dados_linhas)
         competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
         nome_empresa: Nome da empresa (do certificado digital)
+        tipo_nota: "Emitidas" ou "Recebidas"
+        concorrencia: Número máximo de downloads simultâneos
+        
+    Returns:
+        Tupla (linhas pendentes, arquivos faltantes por índice de linha). As
+        linhas pendentes (sem os dois links ou com algum download falho) devem
+        ser baixadas pelo menu de ações, apenas com os arquivos faltantes
     """
-    logger.info(f"Iniciando processamento de Notas Emitidas para competência {competencia_alvo}")
+    com_links = [item for item in linhas_validas if item[1]["href_xml"] and item[1]["href_pdf"]]
+    if not com_links:
+        return linhas_validas, {}
     
-    while True:
+    base_path = str(get_download_base_path())
+    tarefas = []
+    origem_tarefas = []
+    for i, dados in com_links:
+        numero_nota = _formatar_numero_nota(dados["numero_nota"])
+        for rotulo in _ARQUIVOS_NOTA:
+            tarefas.append({
+                "href": dados[_HREF_ARQUIVO[rotulo]],
+                "base_path": base_path,
+                "competencia": competencia_alvo,
+                "empresa": nome_empresa,
+                "tipo_nota": tipo_nota,
+                "nome_arquivo_prefixo": f"{numero_nota}_" if numero_nota else "",
+            })
+            origem_tarefas.append((i, rotulo))
+    resultados = await baixar_arquivos_em_lote(page, tarefas, concorrencia=max(concorrencia, 1))
+    
+    # Só os arquivos que falharam são baixados de novo pelo menu
+    faltantes: Dict[int, Tuple[str, ...]] = {}
+    for (i, rotulo), resultado in zip(origem_tarefas, resultados):
+        if isinstance(resultado, BaseException):
+            faltantes[i] = faltantes.get(i, ()) + (rotulo,)
+        else:
+            logger.info(f"✅ Arquivo baixado e salvo em: {resultado}")
+    
+    baixadas = {i for i, _ in com_links} - faltantes.keys()
+    return [item for item in linhas_validas if item[0] not in baixadas], faltantes
+
+
+async def _baixar_linhas_em_paralelo(
+    page: Page,
+    linhas_validas: List[Tuple[int, Dict[str, Any]]],
+    competencia_alvo: str,
+    nome_empresa: str,
+    tipo_nota: str,
+    concorrencia: int,
+    arquivos_faltantes: Dict[int, Tuple[str, ...]],
+) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Baixa as notas de uma página da tabela usando várias abas em paralelo.
+    
+    Cada trabalhador abre uma aba no mesmo contexto da página (compartilhando
+    certificado e cookies da sessão), carrega a mesma URL da tabela e consome
+    as linhas de uma fila. Antes de baixar, confere se a linha na aba tem os
+    mesmos dados lidos na página principal.
+    
+    Args:
+        page: Página do Playwright com a tabela carregada
+        linhas_validas: Lista de (índice da linha, dados de coletar_dados_linhas)
+        competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
+        nome_empresa: Nome da empresa (do certificado digital)
+        tipo_nota: "Emitidas" ou "Recebidas"
+        concorrencia: Número máximo de abas
+        arquivos_faltantes: Arquivos a baixar por índice de linha (linhas
+            ausentes baixam XML e DANFS-e)
+        
+    Returns:
+        Linhas que não puderam ser baixadas nas abas (linha diferente na aba,
+        aba que não carregou ou download com falha) e devem ser processadas
+        na página principal
+    """
+    url_tabela = page.url
+    fila: asyncio.Queue = asyncio.Queue()
+    for item in linhas_validas:
+        fila.put_nowait(item)
+    pendentes: List[Tuple[int, Dict[str, Any]]] = []
+    
+    async def _trabalhador() -> None:
+        aba = await page.context.new_page()
         try:
-            # Aguarda a tabela carregar
-            await page.wait_for_selector("table tbody tr", timeout=10000)
-            
-            # Obtém todas as linhas do tbody
-            linhas = page.locator("table tbody tr")
-            total_linhas = await linhas.count()
-            
-            if total_linhas == 0:
-                logger.info("Nenhuma linha encontrada na tabela. Encerrando.")
-                break
-            
-            logger.info(f"Processando {total_linhas} linhas na página atual (Emitidas)")
-            
-            # Processa cada linha
-            encontrou_competencia = False
+            await aba.goto(url_tabela, wait_until="domcontentloaded")
+            await aba.wait_for_selector("table tbody tr", timeout=10000)
+            linhas_aba = aba.locator("table tbody tr")
+            dados_aba = await linhas_aba.evaluate_all(_JS_DADOS_LINHAS)
             
-            for i in range(total_linhas):
-                linha = linhas.nth(i)
-                celulas = linha.locator("td")
-                
-                # Lê a competência da 3ª coluna (índice 2)
-                try:
-                    competencia_texto = await celulas.nth(2).inner_text()
-                    competencia_texto = competencia_texto.strip()
-                    
-                    if competencia_texto == competencia_alvo:
-                        encontrou_competencia = True
-                        logger.info(f"Nota encontrada na linha {i+1} com competência {competencia_alvo}")
-                        
-                        # Verifica se a nota é válida
-                        nota_valida = await verificar_nota_valida(linha)
-                        
-                        if nota_valida:
-                            logger.info(f"Nota válida confirmada. Baixando arquivos...")
-                            await baixar_arquivos_da_linha(page, linha, competencia_alvo, nome_empresa, "Emitidas")
-                        else:
-                            logger.info(f"Nota inválida/cancelada. Pulando download.")
-                    
-                except Exception as e:
-                    logger.warning(f"Erro ao processar linha {i+1}: {e}")
+            while not fila.empty():
+                i, dados = fila.get_nowait()
+                if i >= len(dados_aba) or dados_aba[i] != dados:
+                    pendentes.append((i, dados))
                     continue
-            
-            # Verifica se precisa continuar na próxima página
-            # Se a última linha ainda tem a competência alvo, continua
-            if encontrou_competencia and total_linhas > 0:
-                ultima_linha = linhas.nth(total_linhas - 1)
-                celulas_ultima = ultima_linha.locator("td")
-                
-                try:
-                    competencia_ultima = await celulas_ultima.nth(2).inner_text()
-                    competencia_ultima = competencia_ultima.strip()
-                    
-                    if competencia_ultima == competencia_alvo:
-                        # Ainda há notas da competência, vai para próxima página
-                        logger.info("Última linha ainda tem competência alvo. Navegando para próxima página...")
-                        
-                        try:
-                            # Tenta encontrar o botão de próxima página
-                            # Baseado no código existente: li:nth-of-type(8) i
-                            # XPath de referência: /html/body/div[1]/div[3]/div[1]/ul/li[6]/a/i
-                            botao_proxima = page.locator("li:nth-of-type(8) i").first
-                            
-                            # Verifica se o botão existe e está habilitado
-                            if await botao_proxima.count() > 0:
-                                # Verifica se não está desabilitado
-                                parent_link = botao_proxima.locator("..")  # Pega o elemento pai (link)
-                                is_disabled = await parent_link.get_attribute("disabled")
-                                
-                                if not is_disabled:
-                                    await botao_proxima.click()
-                                    await page.wait_for_load_state("networkidle", timeout=10000)
-                                    await page.wait_for_selector("table tbody tr", timeout=8000)
-                                    logger.info("Navegou para próxima página")
-                                    continue
-                                else:
-                                    logger.info("Botão de próxima página desabilitado. Encerrando.")
-                                    break
-                            else:
-                                logger.info("Botão de próxima página não encontrado. Encerrando.")
-                                break
-                                
-                        except Exception as e:
-                            logger.warning(f"Erro ao navegar para próxima página: {e}")
-                            break
-                    else:
-                        # Passou da competência desejada
-                        logger.info("Passou da competência alvo. Encerrando busca em Emitidas.")
-                        break
-                        
-                except Exception as e:
-                    logger.warning(f"Erro ao verificar última linha: {e}")
-                    break
-            else:
-                # Não encontrou mais notas da competência
-                logger.info("Nenhuma nota da competência encontrada nesta página. Encerrando Emitidas.")
-                break
                 
-        except PlaywrightTimeoutError:
-            logger.error("Timeout ao aguardar tabela. Encerrando.")
-            break
-        except Exception as e:
-            logger.error(f"Erro ao processar tabela de emitidas: {e}")
-            break
+                logger.info(f"Nota válida confirmada. Baixando arquivos (linha {i+1})...")
+                baixou = await baixar_arquivos_da_linha(
+                    aba, linhas_aba.nth(i), competencia_alvo, nome_empresa, tipo_nota,
+                    numero_nota=_formatar_numero_nota(dados["numero_nota"]),
+                    arquivos=arquivos_faltantes.get(i, _ARQUIVOS_NOTA),
+                )
+                if not baixou:
+                    pendentes.append((i, dados))
+        finally:
+            await aba.close()
     
-    logger.info("Processamento de Notas Emitidas finalizado")
+    trabalhadores = min(concorrencia, len(linhas_validas))
+    resultados = await asyncio.gather(
+        *(_trabalhador() for _ in range(trabalhadores)),
+        return_exceptions=True,
+    )
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            logger.warning(f"Erro em aba de download paralelo: {resultado}")
+    
+    # Linhas que sobraram na fila (abas que falharam) também voltam para a página principal
+    while not fila.empty():
+        pendentes.append(fila.get_nowait())
+    
+    if pendentes:
+        logger.info(f"{len(pendentes)} linha(s) serão baixadas na página principal")
+    return sorted(pendentes, key=lambda item: item[0])
 
 
-async def processar_tabela_recebidas(page: Page, competencia_alvo: str, nome_empresa: str) -> None:
+async def _processar_tabela(
+    page: Page,
+    competencia_alvo: str,
+    nome_empresa: str,
+    tipo_nota: str,
+    concorrencia: int = _CONCORRENCIA_LINHAS,
+) -> None:
     """
-    Processa a tabela de notas recebidas, varrendo todas as páginas.
+    Processa a tabela de notas (emitidas ou recebidas), varrendo todas as páginas.
+    
+    Os dados de todas as linhas de cada página são lidos em uma única chamada
+    ao navegador (coletar_dados_linhas); só os downloads das notas válidas da
+    competência alvo interagem com as linhas.
     
     Args:
         page: Página do Playwright
         competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
         nome_empresa: Nome da empresa (do certificado digital)
+        tipo_nota: "Emitidas" ou "Recebidas"
+        concorrencia: Número máximo de abas baixando notas de uma página ao mesmo tempo
     """
-    logger.info(f"Iniciando processamento de Notas Recebidas para competência {competencia_alvo}")
+    # Locators criados uma vez e reaproveitados em todas as páginas da tabela
+    linhas = page.locator("table tbody tr")
+    # Botão de próxima página, baseado no código existente: li:nth-of-type(8) i
+    # XPath de referência: /html/body/div[1]/div[3]/div[1]/ul/li[6]/a/i
+    botao_proxima = page.locator("li:nth-of-type(8) i").first
+    link_proxima = botao_proxima.locator("..")  # Elemento pai (link)
+    chave_alvo = _chave_competencia(competencia_alvo)
+    # URL da página anterior da tabela: se a paginação não muda a URL, as abas
+    # paralelas carregariam sempre a primeira página e não são usadas
+    url_anterior: Optional[str] = None
     
     while True:
         try:
             # Aguarda a tabela carregar
             await page.wait_for_selector("table tbody tr", timeout=10000)
             
-            # Obtém todas as linhas do tbody
-            linhas = page.locator("table tbody tr")
-            total_linhas = await linhas.count()
+            # Lê todas as linhas do tbody de uma vez
+            dados_linhas = await linhas.evaluate_all(_JS_DADOS_LINHAS)
+            total_linhas = len(dados_linhas)
             
             if total_linhas == 0:
                 logger.info("Nenhuma linha encontrada na tabela. Encerrando.")
                 break
             
-            logger.info(f"Processando {total_linhas} linhas na página atual (Recebidas)")
+            logger.info(f"Processando {total_linhas} linhas na página atual ({tipo_nota})")
             
             # Processa cada linha
             encontrou_competencia = False
             
-            for i in range(total_linhas):
-                linha = linhas.nth(i)
-                celulas = linha.locator("td")
+            linhas_validas = []
+            
+            for i, dados in enumerate(dados_linhas):
+                # Compara a competência da 3ª coluna (índice 2)
+                if dados["competencia"] != competencia_alvo:
+                    continue
                 
-                # Lê a competência da 3ª coluna (índice 2)
+                encontrou_competencia = True
+                logger.info(f"Nota encontrada na linha {i+1} com competência {competencia_alvo}")
+                
+                # Verifica se a nota é válida
+                if _nota_valida(dados["alt"], dados["src"]):
+                    linhas_validas.append((i, dados))
+                else:
+                    logger.info(f"Nota inválida/cancelada. Pulando download.")
+            
+            # Notas com os links de download na linha são baixadas direto via HTTP
+            linhas_validas, arquivos_faltantes = await _baixar_linhas_por_href(
+                page, linhas_validas, competencia_alvo, nome_empresa, tipo_nota, concorrencia
+            )
+            
+            # As demais são baixadas pelo menu, em paralelo quando houver mais de uma
+            pendentes = linhas_validas
+            url_identifica_pagina = url_anterior is None or page.url != url_anterior
+            url_anterior = page.url
+            if concorrencia > 1 and len(linhas_validas) > 1 and url_identifica_pagina:
+                pendentes = await _baixar_linhas_em_paralelo(
+                    page, linhas_validas, competencia_alvo, nome_empresa, tipo_nota, concorrencia,
+                    arquivos_faltantes,
+                )
+            
+            for i, dados in pendentes:
                 try:
-                    competencia_texto = await celulas.nth(2).inner_text()
-                    competencia_texto = competencia_texto.strip()
-                    
-                    if competencia_texto == competencia_alvo:
-                        encontrou_competencia = True
-                        logger.info(f"Nota encontrada na linha {i+1} com competência {competencia_alvo}")
-                        
-                        # Verifica se a nota é válida
-                        nota_valida = await verificar_nota_valida(linha)
-                        
-                        if nota_valida:
-                            logger.info(f"Nota válida confirmada. Baixando arquivos...")
-                            await baixar_arquivos_da_linha(page, linha, competencia_alvo, nome_empresa, "Recebidas")
-                        else:
-                            logger.info(f"Nota inválida/cancelada. Pulando download.")
-                    
+                    logger.info(f"Nota válida confirmada. Baixando arquivos...")
+                    await baixar_arquivos_da_linha(
+                        page, linhas.nth(i), competencia_alvo, nome_empresa, tipo_nota,
+                        numero_nota=_formatar_numero_nota(dados["numero_nota"]),
+                        arquivos=arquivos_faltantes.get(i, _ARQUIVOS_NOTA),
+                    )
                 except Exception as e:
                     logger.warning(f"Erro ao processar linha {i+1}: {e}")
                     continue
             
-            # Verifica se precisa continuar na próxima página
-            # Se a última linha ainda tem a competência alvo, continua
-            if encontrou_competencia and total_linhas > 0:
-                ultima_linha = linhas.nth(total_linhas - 1)
-                celulas_ultima = ultima_linha.locator("td")
+            # Verifica se precisa continuar na próxima página. A tabela é
+            # ordenada da competência mais recente para a mais antiga: enquanto
+            # a última linha não for anterior à competência alvo, ainda pode
+            # haver notas dela nas próximas páginas (páginas só com
+            # competências mais recentes são puladas sem nenhum download)
+            chave_ultima = _chave_competencia(dados_linhas[-1]["competencia"])
+            if chave_alvo and chave_ultima:
+                continuar = chave_ultima >= chave_alvo
+            else:
+                continuar = encontrou_competencia and dados_linhas[-1]["competencia"] == competencia_alvo
+            
+            if not continuar:
+                if encontrou_competencia:
+                    logger.info(f"Passou da competência alvo. Encerrando busca em {tipo_nota}.")
+                else:
+                    logger.info(f"Nenhuma nota da competência encontrada nesta página. Encerrando {tipo_nota}.")
+                break
+            
+            # Ainda há (ou pode haver) notas da competência, vai para próxima página
+            logger.info("Última linha não passou da competência alvo. Navegando para próxima página...")
+            
+            try:
+                # Verifica se o botão de próxima página existe e está habilitado
+                if await botao_proxima.count() == 0:
+                    logger.info("Botão de próxima página não encontrado. Encerrando.")
+                    break
                 
-                try:
-                    competencia_ultima = await celulas_ultima.nth(2).inner_text()
-                    competencia_ultima = competencia_ultima.strip()
-                    
-                    if competencia_ultima == competencia_alvo:
-                        # Ainda há notas da competência, vai para próxima página
-                        logger.info("Última linha ainda tem competência alvo. Navegando para próxima página...")
-                        
-                        try:
-                            # Tenta encontrar o botão de próxima página
-                            # Baseado no código existente: li:nth-of-type(8) i
-                            botao_proxima = page.locator("li:nth-of-type(8) i").first
-                            
-                            # Verifica se o botão existe e está habilitado
-                            if await botao_proxima.count() > 0:
-                                # Verifica se não está desabilitado
-                                parent_link = botao_proxima.locator("..")  # Pega o elemento pai (link)
-                                is_disabled = await parent_link.get_attribute("disabled")
-                                
-                                if not is_disabled:
-                                    await botao_proxima.click()
-                                    await page.wait_for_load_state("networkidle", timeout=10000)
-                                    await page.wait_for_selector("table tbody tr", timeout=8000)
-                                    logger.info("Navegou para próxima página")
-                                    continue
-                                else:
-                                    logger.info("Botão de próxima página desabilitado. Encerrando.")
-                                    break
-                            else:
-                                logger.info("Botão de próxima página não encontrado. Encerrando.")
-                                break
-                                
-                        except Exception as e:
-                            logger.warning(f"Erro ao navegar para próxima página: {e}")
-                            break
-                    else:
-                        # Passou da competência desejada
-                        logger.info("Passou da competência alvo. Encerrando busca em Recebidas.")
-                        break
-                        
-                except Exception as e:
-                    logger.warning(f"Erro ao verificar última linha: {e}")
+                if await link_proxima.get_attribute("disabled"):
+                    logger.info("Botão de próxima página desabilitado. Encerrando.")
                     break
-            else:
-                # Não encontrou mais notas da competência
-                logger.info("Nenhuma nota da competência encontrada nesta página. Encerrando Recebidas.")
+                
+                # Sem networkidle: a página está pronta quando a tabela
+                # anterior sai do DOM e a nova tem linhas
+                primeira_linha = await linhas.first.element_handle()
+                await botao_proxima.click()
+                await primeira_linha.wait_for_element_state("hidden", timeout=10000)
+                await page.wait_for_load_state("domcontentloaded", timeout=10000)
+                await page.wait_for_selector("table tbody tr", timeout=8000)
+                logger.info("Navegou para próxima página")
+                
+            except Exception as e:
+                logger.warning(f"Erro ao navegar para próxima página: {e}")
                 break
                 
         except PlaywrightTimeoutError:
             logger.error("Timeout ao aguardar tabela. Encerrando.")
             break
         except Exception as e:
-            logger.error(f"Erro ao processar tabela de recebidas: {e}")
+            logger.error(f"Erro ao processar tabela de {tipo_nota.lower()}: {e}")
             break
+
+
+async def processar_tabela_emitidas(
+    page: Page,
+    competencia_alvo: str,
+    nome_empresa: str,
+    concorrencia: int = _CONCORRENCIA_LINHAS,
+) -> None:
+    """
+    Processa a tabela de notas emitidas, varrendo todas as páginas.
     
+    Args:
+        page: Página do Playwright
+        competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
+        nome_empresa: Nome da empresa (do certificado digital)
+        concorrencia: Número máximo de abas baixando notas ao mesmo tempo
+    """
+    logger.info(f"Iniciando processamento de Notas Emitidas para competência {competencia_alvo}")
+    await _processar_tabela(page, competencia_alvo, nome_empresa, "Emitidas", concorrencia)
+    logger.info("Processamento de Notas Emitidas finalizado")
+
+
+async def processar_tabela_recebidas(
+    page: Page,
+    competencia_alvo: str,
+    nome_empresa: str,
+    concorrencia: int = _CONCORRENCIA_LINHAS,
+) -> None:
+    """
+    Processa a tabela de notas recebidas, varrendo todas as páginas.
+    
+    Args:
+        page: Página do Playwright
+        competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
+        nome_empresa: Nome da empresa (do certificado digital)
+        concorrencia: Número máximo de abas baixando notas ao mesmo tempo
+    """
+    logger.info(f"Iniciando processamento de Notas Recebidas para competência {competencia_alvo}")
+    await _processar_tabela(page, competencia_alvo, nome_empresa, "Recebidas", concorrencia)
     logger.info("Processamento de Notas Recebidas finalizado")
 
 
-async def processar_notas(page: Page, competencia_alvo: str, nome_empresa: str) -> None:
+async def processar_notas(
+    page: Page,
+    competencia_alvo: str,
+    nome_empresa: str,
+    concorrencia: int = _CONCORRENCIA_LINHAS,
+) -> None:
     """
     Função principal que processa notas fiscais de uma competência específica.
     
@@ -504,6 +681,8 @@ async def processar_notas(page: Page, competencia_alvo: str, nome_empresa: str)
         page: Página do Playwright (assume que já está logado no dashboard)
         competencia_alvo: Competência alvo no formato "MM/AAAA" (ex: "10/2025")
         nome_empresa: Nome da empresa (do certificado digital)
+        concorrencia: Número máximo de abas baixando notas ao mesmo tempo
+            (1 processa as linhas uma a uma na própria página)
     """
     logger.info(f"🚀 Iniciando processamento de notas para competência: {competencia_alvo}, empresa: {nome_empresa}")
     
@@ -520,13 +699,13 @@ async def processar_notas(page: Page, competencia_alvo: str, nome_empresa: str)
         
         # Aguarda navegação e carregamento da tabela
         await page.wait_for_url("**/Notas/Emitidas", timeout=15000)
-        await page.wait_for_load_state("networkidle", timeout=15000)
+        await page.wait_for_load_state("domcontentloaded", timeout=15000)
         await page.wait_for_selector("table tbody tr", timeout=10000)
         
         logger.info("✅ Acessou Notas Emitidas com sucesso")
         
         # 2) Processar tabela de Notas Emitidas
-        await processar_tabela_emitidas(page, competencia_alvo, nome_empresa)
+        await processar_tabela_emitidas(page, competencia_alvo, nome_empresa, concorrencia)
         
         # 4) Ir para "Notas fiscais recebidas"
         logger.info("Acessando menu 'Notas fiscais recebidas'...")
@@ -540,13 +719,13 @@ async def processar_notas(page: Page, competencia_alvo: str, nome_empresa: str)
         
         # Aguarda navegação e carregamento da tabela
         await page.wait_for_url("**/Notas/Recebidas", timeout=15000)
-        await page.wait_for_load_state("networkidle", timeout=15000)
+        await page.wait_for_load_state("domcontentloaded", timeout=15000)
         await page.wait_for_selector("table tbody tr", timeout=10000)
         
         logger.info("✅ Acessou Notas Recebidas com sucesso")
         
         # 5) Processar tabela de Notas Recebidas
-        await processar_tabela_recebidas(page, competencia_alvo, nome_empresa)
+        await processar_tabela_recebidas(page, competencia_alvo, nome_empresa, concorrencia)
         
         logger.info("🎉 Processamento completo finalizado!")
         
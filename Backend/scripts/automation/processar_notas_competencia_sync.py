@@ -6,11 +6,11 @@ competência específica, fazendo download de XML e DANFS-e (PDF) para notas vá
 Versão síncrona compatível com playwright.sync_api.
 """
 
+import functools
 import logging
-import re
+import os
 import time
 from pathlib import Path
-from urllib.parse import urljoin
 from playwright.sync_api import Page, Download, TimeoutError as PlaywrightTimeoutError, APIResponse
 
 # Importa função para configurar caminho base de downloads
@@ -25,6 +25,25 @@ except ImportError:
         def set_base_path(path: str) -> None:
             logger.warning(f"download_manager não disponível. Caminho não configurado: {path}")
 
+# Padrões de sanitização, detecção de tipo e montagem de URLs compartilhados
+# com download_manager
+try:
+    from .download_manager import (
+        _CARACTERES_INVALIDOS_ARQUIVO_RE,
+        _CARACTERES_INVALIDOS_PASTA_RE,
+        _ESPACOS_RE,
+        _extensao_pelo_conteudo,
+        _montar_url_absoluta,
+    )
+except ImportError:
+    from download_manager import (
+        _CARACTERES_INVALIDOS_ARQUIVO_RE,
+        _CARACTERES_INVALIDOS_PASTA_RE,
+        _ESPACOS_RE,
+        _extensao_pelo_conteudo,
+        _montar_url_absoluta,
+    )
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -45,6 +64,7 @@ def set_downloads_base_path(path: str) -> None:
     set_base_path(path)
 
 
+@functools.lru_cache(maxsize=256)
 def sanitizar_nome_arquivo(nome: str) -> str:
     """
     Sanitiza o nome do arquivo removendo caracteres inválidos.
@@ -56,12 +76,13 @@ def sanitizar_nome_arquivo(nome: str) -> str:
         Nome sanitizado
     """
     # Remove caracteres inválidos para nomes de arquivo
-    nome = re.sub(r'[<>:"/\\|?*]', '_', nome)
+    nome = _CARACTERES_INVALIDOS_ARQUIVO_RE.sub('_', nome)
     # Remove espaços múltiplos
-    nome = re.sub(r'\s+', '_', nome)
+    nome = _ESPACOS_RE.sub('_', nome)
     return nome.strip()
 
 
+@functools.lru_cache(maxsize=1024)
 def sanitizar_nome_pasta(nome: str) -> str:
     """
     Sanitiza o nome para uso como nome de pasta.
@@ -74,12 +95,40 @@ def sanitizar_nome_pasta(nome: str) -> str:
     """
     nome = nome.strip()
     # Remove caracteres que não são letras, números, espaços, underscore ou hífen
-    nome = re.sub(r"[^\w\s\-]", "", nome)
+    nome = _CARACTERES_INVALIDOS_PASTA_RE.sub("", nome)
     # Remove espaços múltiplos e substitui por espaço único
-    nome = re.sub(r"\s+", " ", nome)
+    nome = _ESPACOS_RE.sub(" ", nome)
     return nome
 
 
+def _gravar_arquivo(caminho: Path, content: bytes) -> int:
+    """
+    Grava o conteúdo baixado em disco com uma única escrita e fsync.
+    
+    O conteúdo já está todo em memória, então o arquivo é aberto sem buffer
+    (sem cópia extra pelo BufferedWriter). Depois do fsync, as páginas do
+    arquivo são liberadas do cache do kernel quando o sistema suporta
+    posix_fadvise, deixando a memória livre para os próximos downloads.
+    
+    Args:
+        caminho: Caminho final do arquivo
+        content: Conteúdo binário
+        
+    Returns:
+        Número de bytes escritos
+    """
+    with open(caminho, "wb", buffering=0) as f:
+        visao = memoryview(content)
+        bytes_escritos = 0
+        # Escrita sem buffer pode ser parcial; repete até gravar tudo
+        while bytes_escritos < len(visao):
+            bytes_escritos += f.write(visao[bytes_escritos:])
+        os.fsync(f.fileno())  # Força sincronização com disco
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    return bytes_escritos
+
+
 def validar_download(caminho_arquivo: Path, tamanho_minimo: int = 100) -> dict:
     """
     Valida se um download foi bem-sucedido verificando:
@@ -287,7 +336,7 @@ def baixar_arquivo_direto_sync(
     Fluxo:
     1. Localiza o link na página usando o seletor CSS
     2. Extrai o atributo href
-    3. Monta URL absoluta usando urljoin
+    3. Monta URL absoluta a partir da origem da página
     4. Faz requisição HTTP direta com page.request.get()
     5. Detecta extensão pelo content-type ou conteúdo
     6. Extrai chave da nota do href
@@ -404,8 +453,7 @@ def baixar_arquivo_direto_sync(
     logger.debug(f"Href extraído: {href}")
     
     # ETAPA 4: Monta URL absoluta
-    current_url = page.url
-    full_url = urljoin(current_url, href)
+    full_url = _montar_url_absoluta(page.url, href)
     logger.debug(f"URL completa montada: {full_url}")
     
     # ETAPA 5: Extrai chave da nota do href (último segmento após /)
@@ -449,15 +497,9 @@ def baixar_arquivo_direto_sync(
     if not extensao or content_type == 'application/octet-stream':
         logger.debug("Content-type não específico ou genérico. Analisando conteúdo...")
         
-        # Lê primeiros bytes do conteúdo
-        primeiros_bytes = content[:10] if len(content) >= 10 else content
-        
-        if primeiros_bytes.startswith(b'<?xml') or primeiros_bytes.startswith(b'<'):
-            extensao = '.xml'
-            logger.info(f"✅ Extensão detectada pelo conteúdo (XML): {extensao}")
-        elif primeiros_bytes.startswith(b'%PDF'):
-            extensao = '.pdf'
-            logger.info(f"✅ Extensão detectada pelo conteúdo (PDF): {extensao}")
+        extensao = _extensao_pelo_conteudo(content[:4])
+        if extensao:
+            logger.info(f"✅ Extensão detectada pelo conteúdo: {extensao}")
         else:
             extensao = '.bin'
             logger.warning(f"⚠️ Não foi possível detectar extensão. Usando fallback: {extensao}")
@@ -554,27 +596,13 @@ def baixar_arquivo_direto_sync(
     # ETAPA 12: Salva o arquivo em disco
     try:
         logger.info(f"💾 Abrindo arquivo para escrita: {caminho_final}")
-        with open(caminho_final, "wb") as f:
-            bytes_escritos = f.write(content)
-            logger.info(f"✅ Escritos {bytes_escritos} bytes no arquivo")
-            f.flush()  # Força escrita imediata
-            import os
-            os.fsync(f.fileno())  # Força sincronização com disco
+        bytes_escritos = _gravar_arquivo(caminho_final, content)
+        logger.info(f"✅ Escritos {bytes_escritos} bytes no arquivo")
         
         # IMPORTANTE: Verifica imediatamente após fechar o arquivo
+        # (o fsync em _gravar_arquivo já garantiu a gravação em disco)
         logger.info(f"🔍 Verificando arquivo após escrita...")
         
-        # Força sincronização do sistema de arquivos
-        import os
-        try:
-            os.sync()  # Sincroniza todo o sistema de arquivos (Linux/macOS)
-        except:
-            pass  # Windows não tem os.sync()
-        
-        # Aguarda um pouco para garantir que o sistema de arquivos processou
-        import time
-        time.sleep(0.1)
-        
         # Verifica se o arquivo foi salvo corretamente
         caminho_absoluto = caminho_final.resolve()
         
@@ -622,10 +650,7 @@ def baixar_arquivo_direto_sync(
                     pasta_final.mkdir(parents=True, exist_ok=True)
                     logger.error(f"   Pasta criada. Tentando salvar novamente...")
                     # Tenta salvar novamente
-                    with open(caminho_final, "wb") as f:
-                        f.write(content)
-                        f.flush()
-                        os.fsync(f.fileno())
+                    _gravar_arquivo(caminho_final, content)
                     if caminho_final.exists():
                         logger.info(f"✅ Arquivo salvo na segunda tentativa!")
                     else:
@@ -692,12 +717,9 @@ def detectar_extensao_sync(download: Download, caminho_temp: Path = None) -> str
             logger.debug(f"Primeiros bytes lidos: {primeiros_bytes}")
             
             # Verifica assinatura do arquivo
-            if primeiros_bytes.startswith(b'<?xml') or primeiros_bytes.startswith(b'<'):
-                extensao = '.xml'
-                logger.info(f"✅ Extensão detectada pelo conteúdo (XML): {extensao}")
-            elif primeiros_bytes.startswith(b'%PDF'):
-                extensao = '.pdf'
-                logger.info(f"✅ Extensão detectada pelo conteúdo (PDF): {extensao}")
+            extensao = _extensao_pelo_conteudo(primeiros_bytes)
+            if extensao:
+                logger.info(f"✅ Extensão detectada pelo conteúdo: {extensao}")
             else:
                 logger.warning(f"⚠️ Assinatura não reconhecida. Primeiros bytes: {primeiros_bytes}")
         except Exception as e:
@@ -0,0 +1,41 @@
+#!/bin/bash
+# Script para iniciar um Chromium headless de longa duração para a automação NFSe
+#
+# Com o navegador em execução, defina no .env do backend:
+#   NFSE_CDP_ENDPOINT=http://127.0.0.1:9222
+# e os logins passam a se conectar a ele via CDP em vez de lançar um Chromium novo.
+
+# Porta do protocolo de depuração (CDP)
+PORTA="${NFSE_CDP_PORTA:-9222}"
+
+# Executável do Chromium (padrão: chromium no PATH)
+CHROMIUM="${CHROMIUM_BIN:-chromium}"
+
+if ! command -v "$CHROMIUM" > /dev/null 2>&1; then
+    echo "❌ ERRO: Chromium não encontrado: $CHROMIUM"
+    echo "   Defina CHROMIUM_BIN com o caminho do executável"
+    exit 1
+fi
+
+echo "🚀 Iniciando Chromium headless..."
+echo "   Endpoint CDP: http://127.0.0.1:${PORTA}"
+echo ""
+
+# Escuta apenas em localhost: o CDP dá controle total sobre o navegador
+exec "$CHROMIUM" \
+    --headless=new \
+    --remote-debugging-address=127.0.0.1 \
+    --remote-debugging-port="$PORTA" \
+    --user-data-dir="${TMPDIR:-/tmp}/autonacional-chromium" \
+    --disable-features=DownloadBubble,DownloadBubbleV2,SafeBrowsing,Translate,BackForwardCache \
+    --safebrowsing-disable-auto-update \
+    --safebrowsing-disable-download-protection \
+    --disable-notifications \
+    --disable-infobars \
+    --disable-dev-shm-usage \
+    --disable-gpu \
+    --disable-extensions \
+    --disable-background-networking \
+    --disable-sync \
+    --no-first-run \
+    --no-default-browser-check
@@ -75,17 +75,20 @@ def popular_banco_mock():
     conn = get_mock_conn()
     cursor = conn.cursor()
     
-    # Busca todos os arquivos .pfx.enc
+    # Busca os certificados armazenados: formato atual ({cnpj}.bundle.enc) e
+    # legado ({cnpj}.pfx.enc + {cnpj}.pwd.enc). Um CNPJ pode ter os dois
+    # formatos, então os arquivos são agrupados por CNPJ (primeiro encontrado)
     certificados_dir = Path(BASE_DIR)
-    arquivos_pfx = list(certificados_dir.glob("*.pfx.enc"))
+    arquivos_por_cnpj = {}
+    for sufixo in (".bundle.enc", ".pfx.enc"):
+        for arquivo in certificados_dir.glob(f"*{sufixo}"):
+            # Extrai CNPJ do nome do arquivo (formato: CNPJ.bundle.enc ou CNPJ.pfx.enc)
+            arquivos_por_cnpj.setdefault(arquivo.name[:-len(sufixo)].strip(), arquivo)
     
     empresas_criadas = 0
     empresas_atualizadas = 0
     
-    for arquivo_pfx in arquivos_pfx:
-        # Extrai CNPJ do nome do arquivo (formato: CNPJ.pfx.enc)
-        cnpj = arquivo_pfx.stem.replace(".pfx", "").strip()
-        
+    for cnpj, arquivo_pfx in arquivos_por_cnpj.items():
         # Valida CNPJ (deve ter 14 dígitos)
         cnpj_limpo = cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
         if len(cnpj_limpo) != 14 or not cnpj_limpo.isdigit():
@@ -7,14 +7,19 @@ caminhos de arquivos, variáveis de ambiente e constantes.
 
 import os
 from pathlib import Path
-from dotenv import load_dotenv, set_key, find_dotenv
+from dotenv import set_key, find_dotenv
 from cryptography.fernet import Fernet
 
-# Carrega variáveis de ambiente
+from _env import load_env
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Carrega variáveis de ambiente (uma única vez por processo, via _env)
 backend_dir = Path(__file__).parent.parent.parent
 env_path = backend_dir / ".env"
-load_dotenv(env_path)
-load_dotenv()  # Também tenta do diretório atual
+load_env()
 
 # ============================================================================
 # Caminhos de arquivos e diretórios
@@ -42,7 +47,7 @@ if env_key:
     FERNET_KEY = env_key
 else:
     # Chave não encontrada - gera UMA chave e SALVA no .env permanentemente
-    print("⚠️  FERNET_KEY não encontrada. Gerando chave permanente...")
+    logger.warning("FERNET_KEY não encontrada. Gerando chave permanente...")
     generated_key = Fernet.generate_key()
     FERNET_KEY = generated_key.decode()  # Converte bytes para string
     
@@ -62,18 +67,16 @@ else:
             # Adiciona ou atualiza a chave no arquivo existente
             set_key(env_file, "FERNET_KEY", FERNET_KEY)
         
-        print(f"✅ Chave FERNET_KEY gerada e salva permanentemente em: {env_file}")
-        print(f"   ⚠️  IMPORTANTE: Esta chave foi salva no arquivo .env")
-        print(f"   ⚠️  NÃO delete ou altere esta chave, ou você perderá acesso aos certificados!")
+        logger.warning("Chave FERNET_KEY gerada e salva permanentemente em: %s", env_file)
+        logger.warning("IMPORTANTE: NÃO delete ou altere esta chave, ou você perderá acesso aos certificados!")
         
-        # Recarrega o .env para garantir que está disponível
-        load_dotenv(env_file, override=True)
+        # Disponibiliza a chave no ambiente (load_env não relê o .env)
+        os.environ["FERNET_KEY"] = FERNET_KEY
         
     except Exception as e:
-        print(f"❌ ERRO ao salvar chave no .env: {str(e)}")
-        print(f"   Usando chave temporária (NÃO RECOMENDADO)")
-        print(f"   Para corrigir, adicione manualmente no arquivo {env_path}:")
-        print(f"   FERNET_KEY={FERNET_KEY}")
+        logger.error("ERRO ao salvar chave no .env: %s", e)
+        logger.error("Usando chave temporária (NÃO RECOMENDADO)")
+        logger.error("Para corrigir, adicione manualmente no arquivo %s: FERNET_KEY=%s", env_path, FERNET_KEY)
 
 # ============================================================================
 # Configurações de banco de dados
@@ -4,12 +4,42 @@ Centralização de logs do sistema.
 Este módulo fornece um logger configurado globalmente para uso em toda a aplicação.
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from typing import Optional
 
 # Configuração padrão do logger
 _logger: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+_FORMATO_PADRAO = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _criar_queue_handler() -> logging.Handler:
+    """
+    Cria o handler de fila: os registros são enfileirados na thread que loga e
+    escritos no stdout por uma thread de fundo (QueueListener), fora do event loop.
+    """
+    global _listener
+    
+    if _listener is not None:
+        _listener.stop()
+    
+    fila: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    # O QueueHandler já formata a mensagem; o listener apenas escreve a linha pronta
+    _listener = logging.handlers.QueueListener(fila, logging.StreamHandler(sys.stdout))
+    _listener.start()
+    return logging.handlers.QueueHandler(fila)
+
+
+@atexit.register
+def _parar_listener() -> None:
+    """Esvazia a fila de logs ao encerrar o processo."""
+    if _listener is not None:
+        _listener.stop()
 
 
 def get_logger(name: Optional[str] = None) -> logging.Logger:
@@ -25,14 +55,16 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
     global _logger
     
     if _logger is None:
-        # Configura o logger raiz
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        # Configura o logger raiz. Se outro módulo já configurou (basicConfig
+        # seria ignorado), não cria a fila para não deixar um listener ocioso.
+        if not logging.getLogger().handlers:
+            logging.basicConfig(
+                level=logging.INFO,
+                format=_FORMATO_PADRAO,
+                handlers=[
+                    _criar_queue_handler()
+                ]
+            )
         _logger = logging.getLogger()
     
     if name:
@@ -51,13 +83,13 @@ def configure_logger(level: int = logging.INFO, format_string: Optional[str] = N
     """
     global _logger
     
-    format_str = format_string or '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format_str = format_string or _FORMATO_PADRAO
     
     logging.basicConfig(
         level=level,
         format=format_str,
         handlers=[
-            logging.StreamHandler(sys.stdout)
+            _criar_queue_handler()
         ],
         force=True  # Força reconfiguração mesmo se já configurado
     )
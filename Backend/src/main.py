@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .infrastructure.config import CORS_ORIGINS
 from .infrastructure.logger import get_logger
@@ -15,6 +16,7 @@ API para automação NFSe (empresas, credenciais, jobs).
 - **Nunca** expõe senha.
 """,
     contact={"name": "Equipe AutoNacional", "email": "devs@autonacional.local"},
+    default_response_class=ORJSONResponse,
 )
 
 # CORS para o Angular
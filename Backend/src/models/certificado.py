@@ -30,3 +30,12 @@ class CertificadoImportResponse(BaseModel):
     dataVencimento: Optional[str] = None
     message: Optional[str] = None
 
+
+class CertificadoImportBatchItem(BaseModel):
+    """Resultado da importação de um arquivo na importação em lote."""
+    arquivo: Optional[str] = None
+    success: bool
+    empresa: Optional[str] = None
+    cnpj: Optional[str] = None
+    dataVencimento: Optional[str] = None
+    message: Optional[str] = None
@@ -45,10 +45,9 @@ class ExecucaoInfo(BaseModel):
     headless: bool = False  # Se True, executa navegador em modo headless
     
     # Campos adicionais para recursos do Playwright (não serializados)
+    # (o navegador e o Playwright são compartilhados entre execuções)
     page: Optional[Any] = None
     context: Optional[Any] = None
-    browser: Optional[Any] = None
-    playwright: Optional[Any] = None
     
     class Config:
         """Configuração do modelo Pydantic."""
@@ -5,15 +5,21 @@ Este módulo fornece endpoints REST para upload, importação e validação
 de certificados digitais ICP-Brasil, além de CRUD para metadados.
 """
 
+import asyncio
+import re
 from datetime import date
 from typing import List
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, status, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 
 from ..services.certificate_service import get_certificate_service
 from ..utils.certificado_utils import validar_pfx, extrair_informacoes_certificado
-from ..models.certificado import CertificadoUploadResponse, CertificadoImportResponse
+from ..models.certificado import (
+    CertificadoUploadResponse,
+    CertificadoImportResponse,
+    CertificadoImportBatchItem,
+)
 from ..schemas.certificado import (
     CertificadoCreate,
     CertificadoUpdate,
@@ -37,6 +43,75 @@ logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api/certificados", tags=["Certificados"])
 
+# Tabela para remover a formatação do CNPJ em uma única passada
+_CNPJ_STRIP = str.maketrans('', '', './- ')
+
+# Maior entrada de CNPJ aceita antes da limpeza (formatado tem 18 caracteres)
+_TAMANHO_MAXIMO_CNPJ_ENTRADA = 32
+
+# Formatos comuns do CNPJ (só dígitos ou 00.000.000/0000-00), validados e
+# extraídos em uma única varredura
+_CNPJ_RE = re.compile(r"\s*(?:(\d{14})|(\d{2})\.(\d{3})\.(\d{3})/(\d{4})-(\d{2}))\s*")
+
+# Tamanho dos blocos de leitura do upload (128 KiB)
+_TAMANHO_CHUNK_UPLOAD = 1 << 17
+
+# Tamanho máximo aceito para um .pfx/.p12 (arquivos reais têm poucos KiB)
+_TAMANHO_MAXIMO_PFX = 1 << 20
+
+
+def _arquivo_muito_grande() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Arquivo muito grande. Tamanho máximo: {_TAMANHO_MAXIMO_PFX // 1024} KiB"
+    )
+
+
+# Limita quantos processamentos PKCS12 (PBKDF2, CPU-bound) rodam ao mesmo
+# tempo, para não esgotar o threadpool compartilhado com o resto da API
+_LIMITE_PROCESSAMENTO_PFX = asyncio.Semaphore(4)
+
+
+async def _executar_em_thread(funcao, *args):
+    """Executa trabalho de certificado fora do event loop, com concorrência limitada."""
+    async with _LIMITE_PROCESSAMENTO_PFX:
+        return await asyncio.to_thread(funcao, *args)
+
+
+async def _ler_arquivo_upload(arquivo: UploadFile) -> bytes:
+    """
+    Lê o arquivo enviado em blocos de 128 KiB para um único buffer.
+    
+    Quando o Starlette informa o tamanho do arquivo, o buffer é preenchido
+    por fatias de memoryview sem realocações intermediárias.
+    
+    Raises:
+        HTTPException: 413 se o arquivo passar de _TAMANHO_MAXIMO_PFX
+    """
+    tamanho = getattr(arquivo, "size", None)
+    if tamanho and tamanho > _TAMANHO_MAXIMO_PFX:
+        raise _arquivo_muito_grande()
+    if tamanho:
+        buffer = bytearray(tamanho)
+        visao = memoryview(buffer)
+        lidos = 0
+        while lidos < tamanho:
+            chunk = await arquivo.read(min(_TAMANHO_CHUNK_UPLOAD, tamanho - lidos))
+            if not chunk:
+                break
+            visao[lidos:lidos + len(chunk)] = chunk
+            lidos += len(chunk)
+        visao.release()
+        del buffer[lidos:]
+        return bytes(buffer)
+    
+    buffer = bytearray()
+    while chunk := await arquivo.read(_TAMANHO_CHUNK_UPLOAD):
+        buffer.extend(chunk)
+        if len(buffer) > _TAMANHO_MAXIMO_PFX:
+            raise _arquivo_muito_grande()
+    return bytes(buffer)
+
 
 @router.post("", response_model=CertificadoUploadResponse, summary="Upload de certificado")
 async def upload_certificado(
@@ -61,7 +136,7 @@ async def upload_certificado(
         HTTPException: Se houver erro na validação ou salvamento
     """
     try:
-        logger.info(f"Endpoint /api/certificados chamado - CNPJ: {cnpj}")
+        logger.info("Endpoint /api/certificados chamado - CNPJ: %s", cnpj)
         
         # Validação básica do arquivo
         if not certificado.filename:
@@ -77,8 +152,17 @@ async def upload_certificado(
                 detail=f"Arquivo deve ser um certificado .pfx ou .p12. Recebido: {certificado.filename}"
             )
         
-        # Validação básica do CNPJ
-        cnpj_limpo = cnpj.strip().replace('.', '').replace('/', '').replace('-', '').replace(' ', '')
+        # Validação básica do CNPJ (caminho rápido para os formatos comuns)
+        cnpj_match = _CNPJ_RE.fullmatch(cnpj)
+        if cnpj_match:
+            cnpj_limpo = cnpj_match[1] or "".join(cnpj_match.group(2, 3, 4, 5, 6))
+        elif len(cnpj) > _TAMANHO_MAXIMO_CNPJ_ENTRADA:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="CNPJ inválido. Deve conter 14 dígitos."
+            )
+        else:
+            cnpj_limpo = cnpj.strip().translate(_CNPJ_STRIP)
         if not cnpj_limpo:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -98,7 +182,7 @@ async def upload_certificado(
                 detail="Senha não pode estar vazia"
             )
         
-        conteudo = await certificado.read()
+        conteudo = await _ler_arquivo_upload(certificado)
         
         if not conteudo:
             raise HTTPException(
@@ -106,24 +190,23 @@ async def upload_certificado(
                 detail="Arquivo vazio ou não foi possível ler o conteúdo"
             )
         
-        logger.info(f"Arquivo lido com sucesso. Tamanho: {len(conteudo)} bytes")
+        logger.debug("Arquivo lido com sucesso. Tamanho: %d bytes", len(conteudo))
         
-        # Valida o PFX
-        key, cert, additional_certs = validar_pfx(conteudo, senha)
+        # Valida o PFX (OpenSSL e escrita em disco rodam fora do event loop)
+        key, cert, additional_certs = await _executar_em_thread(validar_pfx, conteudo, senha)
         subject = cert.subject
         
-        # Salva criptografado usando o service
+        # Salva criptografado usando o service (o PFX já foi validado acima).
+        # A gravação termina antes dos metadados e da resposta: erros de disco
+        # chegam ao cliente e o banco nunca aponta para um arquivo inexistente
         certificate_service = get_certificate_service()
-        certificate_service.salvar_certificado(cnpj_limpo, conteudo, senha)
+        await _executar_em_thread(certificate_service.salvar_certificado, cnpj_limpo, conteudo, senha)
         
         # Extrai informações do certificado para salvar metadados
-        informacoes = certificate_service.validar_e_extrair_info(conteudo, senha, debug=False)
+        informacoes = certificate_service.extrair_info_do_certificado(cert)
         
         # Salva metadados no banco de dados (se disponível)
         try:
-            from ..db.session import get_db
-            from ..db.crud_certificado import criar_certificado, obter_certificado_por_cnpj
-            
             # Obtém sessão do banco
             db_gen = get_db()
             db = next(db_gen)
@@ -148,28 +231,26 @@ async def upload_certificado(
                             empresa=informacoes.empresa,
                             data_vencimento=data_vencimento
                         )
-                        logger.info(f"Metadados do certificado salvos no banco: CNPJ {cnpj_limpo}")
+                        logger.info("Metadados do certificado salvos no banco: CNPJ %s", cnpj_limpo)
                     except ValueError as ve:
-                        logger.warning(f"Erro ao converter data de vencimento: {ve}")
+                        logger.warning("Erro ao converter data de vencimento: %s", ve)
                     except Exception as e:
-                        logger.warning(f"Erro ao criar metadados no banco: {e}")
+                        logger.warning("Erro ao criar metadados no banco: %s", e)
                 elif certificado_existente:
-                    logger.info(f"Metadados do certificado já existem no banco: CNPJ {cnpj_limpo}")
+                    logger.debug("Metadados do certificado já existem no banco: CNPJ %s", cnpj_limpo)
             finally:
                 db.close()
         except Exception as e:
             # Não falha o upload se houver erro ao salvar metadados
-            logger.warning(f"Erro ao salvar metadados no banco (não crítico): {str(e)}")
+            logger.warning("Erro ao salvar metadados no banco (não crítico): %s", e)
         
         # Extrai o Common Name do subject
         common_name = None
         try:
-            for attr in subject:
-                if attr.oid == x509.NameOID.COMMON_NAME:
-                    common_name = attr.value
-                    break
+            atributos_cn = subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+            common_name = atributos_cn[0].value if atributos_cn else None
         except Exception as e:
-            logger.warning(f"Não foi possível extrair Common Name: {e}")
+            logger.warning("Não foi possível extrair Common Name: %s", e)
         
         resposta = CertificadoUploadResponse(
             message="Certificado salvo com sucesso",
@@ -178,19 +259,117 @@ async def upload_certificado(
             success=True
         )
         
-        logger.info(f"Retornando resposta de sucesso: {resposta}")
+        logger.debug("Retornando resposta de sucesso: %s", resposta)
         return resposta
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Erro ao processar certificado: {str(e)}", exc_info=True)
+        logger.error("Erro ao processar certificado: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao processar certificado: {str(e)}"
         )
 
 
+async def _processar_importacao(certificado: UploadFile, senha: str) -> CertificadoImportResponse:
+    """
+    Valida um certificado enviado, extrai suas informações e salva os metadados.
+    
+    Raises:
+        HTTPException: Se houver erro na validação ou extração
+    """
+    # Validação do arquivo
+    if not certificado.filename:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Nome do arquivo não fornecido"
+        )
+    
+    filename_lower = certificado.filename.lower()
+    if not (filename_lower.endswith('.pfx') or filename_lower.endswith('.p12')):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Arquivo deve ser um certificado .pfx ou .p12. Recebido: {certificado.filename}"
+        )
+    
+    # Validação da senha
+    if not senha or not senha.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Senha não pode estar vazia"
+        )
+    
+    # Lê o conteúdo do arquivo
+    conteudo = await _ler_arquivo_upload(certificado)
+    
+    if not conteudo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Arquivo vazio ou não foi possível ler o conteúdo"
+        )
+    
+    # Extrai informações do certificado usando o service
+    certificate_service = get_certificate_service()
+    informacoes = await _executar_em_thread(
+        certificate_service.validar_e_extrair_info, conteudo, senha, False
+    )
+    
+    # Valida se CNPJ foi encontrado
+    if not informacoes.cnpj_limpo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Não foi possível extrair o CNPJ do certificado. Verifique se é um certificado ICP-Brasil válido."
+        )
+    
+    # Salva metadados no banco de dados (se disponível)
+    try:
+        # Obtém sessão do banco
+        db_gen = get_db()
+        db = next(db_gen)
+        
+        try:
+            # Verifica se já existe
+            certificado_existente = obter_certificado_por_cnpj(db, informacoes.cnpj_limpo)
+            
+            if not certificado_existente and informacoes.dataVencimento:
+                try:
+                    # Converte data de vencimento de string ISO para date
+                    if isinstance(informacoes.dataVencimento, str):
+                        data_vencimento = date.fromisoformat(informacoes.dataVencimento)
+                    else:
+                        # Se já for date, usa diretamente
+                        data_vencimento = informacoes.dataVencimento
+                    
+                    # Cria registro no banco
+                    criar_certificado(
+                        db=db,
+                        cnpj=informacoes.cnpj_limpo,
+                        empresa=informacoes.empresa,
+                        data_vencimento=data_vencimento
+                    )
+                    logger.info(f"Metadados do certificado salvos no banco: CNPJ {informacoes.cnpj_limpo}")
+                except ValueError as ve:
+                    logger.warning(f"Erro ao converter data de vencimento: {ve}")
+                except Exception as e:
+                    logger.warning(f"Erro ao criar metadados no banco: {e}")
+            elif certificado_existente:
+                logger.info(f"Metadados do certificado já existem no banco: CNPJ {informacoes.cnpj_limpo}")
+        finally:
+            db.close()
+    except Exception as e:
+        # Não falha a importação se houver erro ao salvar metadados
+        logger.warning(f"Erro ao salvar metadados no banco (não crítico): {str(e)}")
+    
+    # Retorna informações extraídas
+    return CertificadoImportResponse(
+        success=True,
+        empresa=informacoes.empresa,
+        cnpj=informacoes.cnpj,
+        dataVencimento=informacoes.dataVencimento
+    )
+
+
 @router.post("/importar", response_model=CertificadoImportResponse, summary="Importar certificado e extrair informações")
 async def importar_certificado(
     certificado: UploadFile = File(...),
@@ -212,114 +391,9 @@ async def importar_certificado(
         HTTPException: Se houver erro na validação ou extração
     """
     try:
-        # Validação do arquivo
-        if not certificado.filename:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": "Nome do arquivo não fornecido"
-                }
-            )
-        
-        filename_lower = certificado.filename.lower()
-        if not (filename_lower.endswith('.pfx') or filename_lower.endswith('.p12')):
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": f"Arquivo deve ser um certificado .pfx ou .p12. Recebido: {certificado.filename}"
-                }
-            )
-        
-        # Validação da senha
-        if not senha or not senha.strip():
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": "Senha não pode estar vazia"
-                }
-            )
-        
-        # Lê o conteúdo do arquivo
-        conteudo = await certificado.read()
-        
-        if not conteudo:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": "Arquivo vazio ou não foi possível ler o conteúdo"
-                }
-            )
-        
-        # Extrai informações do certificado usando o service
-        certificate_service = get_certificate_service()
-        informacoes = certificate_service.validar_e_extrair_info(conteudo, senha, debug=False)
-        
-        # Valida se CNPJ foi encontrado
-        if not informacoes.cnpj_limpo:
-            return JSONResponse(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                content={
-                    "success": False,
-                    "message": "Não foi possível extrair o CNPJ do certificado. Verifique se é um certificado ICP-Brasil válido."
-                }
-            )
-        
-        # Salva metadados no banco de dados (se disponível)
-        try:
-            from ..db.session import get_db
-            from ..db.crud_certificado import criar_certificado, obter_certificado_por_cnpj
-            
-            # Obtém sessão do banco
-            db_gen = get_db()
-            db = next(db_gen)
-            
-            try:
-                # Verifica se já existe
-                certificado_existente = obter_certificado_por_cnpj(db, informacoes.cnpj_limpo)
-                
-                if not certificado_existente and informacoes.dataVencimento:
-                    try:
-                        # Converte data de vencimento de string ISO para date
-                        if isinstance(informacoes.dataVencimento, str):
-                            data_vencimento = date.fromisoformat(informacoes.dataVencimento)
-                        else:
-                            # Se já for date, usa diretamente
-                            data_vencimento = informacoes.dataVencimento
-                        
-                        # Cria registro no banco
-                        criar_certificado(
-                            db=db,
-                            cnpj=informacoes.cnpj_limpo,
-                            empresa=informacoes.empresa,
-                            data_vencimento=data_vencimento
-                        )
-                        logger.info(f"Metadados do certificado salvos no banco: CNPJ {informacoes.cnpj_limpo}")
-                    except ValueError as ve:
-                        logger.warning(f"Erro ao converter data de vencimento: {ve}")
-                    except Exception as e:
-                        logger.warning(f"Erro ao criar metadados no banco: {e}")
-                elif certificado_existente:
-                    logger.info(f"Metadados do certificado já existem no banco: CNPJ {informacoes.cnpj_limpo}")
-            finally:
-                db.close()
-        except Exception as e:
-            # Não falha a importação se houver erro ao salvar metadados
-            logger.warning(f"Erro ao salvar metadados no banco (não crítico): {str(e)}")
-        
-        # Retorna informações extraídas
-        return CertificadoImportResponse(
-            success=True,
-            empresa=informacoes.empresa,
-            cnpj=informacoes.cnpj,
-            dataVencimento=informacoes.dataVencimento
-        )
-        
+        return await _processar_importacao(certificado, senha)
     except HTTPException as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=e.status_code,
             content={
                 "success": False,
@@ -328,7 +402,7 @@ async def importar_certificado(
         )
     except Exception as e:
         logger.error(f"Erro ao processar certificado: {str(e)}", exc_info=True)
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
                 "success": False,
@@ -337,6 +411,60 @@ async def importar_certificado(
         )
 
 
+@router.post(
+    "/importar/batch",
+    response_model=List[CertificadoImportBatchItem],
+    summary="Importar vários certificados de uma vez"
+)
+async def importar_certificados_batch(
+    certificados: List[UploadFile] = File(...),
+    senhas: List[str] = Form(...)
+) -> List[CertificadoImportBatchItem]:
+    """
+    Importa vários certificados em uma única requisição.
+    
+    Os arquivos são processados concorrentemente (o parse PKCS12 roda no
+    threadpool, limitado por _LIMITE_PROCESSAMENTO_PFX). A falha de um arquivo
+    não interrompe os demais.
+    
+    Args:
+        certificados: Arquivos .pfx ou .p12
+        senhas: Senhas dos certificados, na mesma ordem dos arquivos
+        
+    Returns:
+        Lista com o resultado de cada arquivo, na ordem de envio
+        
+    Raises:
+        HTTPException: Se a quantidade de senhas não corresponder à de arquivos
+    """
+    if len(certificados) != len(senhas):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Informe uma senha por certificado. Recebido: {len(certificados)} arquivos e {len(senhas)} senhas"
+        )
+    
+    resultados = await asyncio.gather(
+        *(_processar_importacao(certificado, senha) for certificado, senha in zip(certificados, senhas)),
+        return_exceptions=True
+    )
+    
+    itens = []
+    for certificado, resultado in zip(certificados, resultados):
+        if isinstance(resultado, CertificadoImportResponse):
+            itens.append(CertificadoImportBatchItem(arquivo=certificado.filename, **resultado.model_dump()))
+        elif isinstance(resultado, HTTPException):
+            itens.append(CertificadoImportBatchItem(
+                arquivo=certificado.filename, success=False, message=resultado.detail
+            ))
+        else:
+            logger.error("Erro ao processar certificado %s: %s", certificado.filename, resultado, exc_info=resultado)
+            itens.append(CertificadoImportBatchItem(
+                arquivo=certificado.filename, success=False,
+                message=f"Erro ao processar certificado: {str(resultado)}"
+            ))
+    return itens
+
+
 # ============================================================================
 # Rotas de CRUD para metadados de certificados (persistência)
 # ============================================================================
@@ -6,6 +6,7 @@ do portal NFSe Nacional para uma empresa específica, coordenando todos os scrip
 necessários através do service de execução.
 """
 
+import traceback
 from fastapi import APIRouter, HTTPException, status, Query
 from typing import Optional
 
@@ -84,7 +85,6 @@ def obter_status_execucao(empresa_id: str) -> ExecucaoStatusResponse:
         raise
     except Exception as e:
         logger.error(f"Erro ao obter status: {str(e)}", exc_info=True)
-        import traceback
         traceback.print_exc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -250,7 +250,6 @@ def iniciar_execucao(
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
         logger.error(f"Erro ao iniciar execução: {str(e)}", exc_info=True)
         logger.error(f"Traceback completo:\n{error_trace}")
@@ -18,8 +18,6 @@ if _src_dir not in sys.path:
     sys.path.insert(0, _src_dir)
 
 # Adiciona scripts/automation ao path
-import os
-import sys
 _backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 _scripts_automation_path = os.path.join(_backend_dir, "scripts", "automation")
 if _scripts_automation_path not in sys.path:
@@ -8,8 +8,11 @@ Este service centraliza toda a lógica relacionada a certificados:
 """
 
 import os
-from typing import Tuple
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from dotenv import load_dotenv, set_key, find_dotenv
 from cryptography import x509
 
@@ -17,29 +20,65 @@ from ..infrastructure.config import CERTIFICATES_DIR, FERNET_KEY
 from ..infrastructure.logger import get_logger
 from ..utils.certificado_utils import (
     validar_pfx,
-    extrair_informacoes_certificado
+    extrair_informacoes_certificado,
+    extrair_informacoes_de_cert,
+)
+from ..utils.criptografia_utils import (
+    derivar_chave_aesgcm,
+    criptografar,
+    descriptografar,
+    escrever_bundle,
+    ler_bundle,
 )
 from ..models.certificado import CertificadoInfo
 
 logger = get_logger(__name__)
 
+# Quantidade máxima de certificados descriptografados mantidos em memória
+_TAMANHO_CACHE_CERTIFICADOS = 16
+
+# Tabela para remover a formatação do CNPJ em uma única passada
+_CNPJ_STRIP = str.maketrans('', '', './- \t\n')
+
+
+def _versao_arquivos(*caminhos) -> Optional[Tuple[int, ...]]:
+    """
+    Identifica a versão gravada de um certificado pelo mtime dos seus arquivos.
+    
+    Args:
+        caminhos: Arquivos que compõem o certificado
+        
+    Returns:
+        Tupla com o mtime (ns) de cada arquivo, ou None se algum não existir
+    """
+    try:
+        return tuple(os.stat(caminho).st_mtime_ns for caminho in caminhos)
+    except FileNotFoundError:
+        return None
+
 
 class CertificateService:
     """Service para gerenciamento de certificados digitais."""
     
     def __init__(self):
         """Inicializa o service de certificado."""
-        # Inicializa Fernet com a chave de configuração
+        # Inicializa as cifras com a chave de configuração
         if not FERNET_KEY:
             raise ValueError("FERNET_KEY não configurada. Verifique o arquivo .env")
         
         try:
             # FERNET_KEY vem como string do config, precisa converter para bytes
             key_bytes = FERNET_KEY.encode() if isinstance(FERNET_KEY, str) else FERNET_KEY
+            # Fernet é mantido apenas para ler arquivos legados
             self.fernet = Fernet(key_bytes)
+            self.aesgcm = AESGCM(derivar_chave_aesgcm(key_bytes))
         except Exception as e:
-            logger.error(f"Erro ao inicializar Fernet: {str(e)}")
+            logger.error(f"Erro ao inicializar criptografia: {str(e)}")
             raise ValueError(f"FERNET_KEY inválida: {str(e)}")
+        
+        # Certificados já descriptografados: cnpj -> (versão dos arquivos, pfx, senha)
+        self._cache_certificados: "OrderedDict[str, Tuple[Tuple[int, ...], bytes, str]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
     
     def salvar_certificado(self, cnpj: str, conteudo_pfx: bytes, senha: str) -> None:
         """
@@ -57,27 +96,23 @@ class CertificateService:
         """
         try:
             # Valida CNPJ
-            cnpj_limpo = cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
+            cnpj_limpo = cnpj.translate(_CNPJ_STRIP)
             if len(cnpj_limpo) != 14:
                 raise ValueError(f"CNPJ inválido: {cnpj}")
             
             # Criptografa certificado e senha
-            encrypted_pfx = self.fernet.encrypt(conteudo_pfx)
-            encrypted_pwd = self.fernet.encrypt(senha.encode())
+            encrypted_pfx = criptografar(self.aesgcm, conteudo_pfx)
+            encrypted_pwd = criptografar(self.aesgcm, senha.encode())
             
-            # Define caminhos dos arquivos
-            file_path = CERTIFICATES_DIR / f"{cnpj_limpo}.pfx.enc"
-            pwd_path = CERTIFICATES_DIR / f"{cnpj_limpo}.pwd.enc"
+            # Certificado e senha são gravados juntos em um único arquivo
+            bundle_path = CERTIFICATES_DIR / f"{cnpj_limpo}.bundle.enc"
             
-            logger.info(f"Salvando certificado em: {file_path}")
-            logger.info(f"Salvando senha em: {pwd_path}")
+            logger.info(f"Salvando certificado e senha em: {bundle_path}")
             
-            # Salva arquivos
-            with open(file_path, "wb") as f:
-                f.write(encrypted_pfx)
+            escrever_bundle(bundle_path, encrypted_pfx, encrypted_pwd)
             
-            with open(pwd_path, "wb") as f:
-                f.write(encrypted_pwd)
+            with self._cache_lock:
+                self._cache_certificados.pop(cnpj_limpo, None)
             
             logger.info(f"Certificado salvo com sucesso para CNPJ: {cnpj_limpo}")
             
@@ -97,6 +132,9 @@ class CertificateService:
         """
         Lê e descriptografa o certificado e a senha para uso na automação.
         
+        O resultado fica em cache (LRU) enquanto os arquivos do certificado
+        não forem alterados, evitando leitura e descriptografia a cada login.
+        
         Args:
             cnpj: CNPJ da empresa (apenas números, 14 dígitos)
             
@@ -111,24 +149,41 @@ class CertificateService:
         if not cnpj:
             raise ValueError("CNPJ não pode ser None ou vazio")
         
-        cnpj_limpo = str(cnpj).strip().replace(".", "").replace("/", "").replace("-", "")
+        cnpj_limpo = str(cnpj).translate(_CNPJ_STRIP)
         if not cnpj_limpo or len(cnpj_limpo) != 14:
             raise ValueError(f"CNPJ inválido: {cnpj}")
         
+        bundle_path = CERTIFICATES_DIR / f"{cnpj_limpo}.bundle.enc"
+        # Formato legado: certificado e senha em arquivos separados
         file_path = CERTIFICATES_DIR / f"{cnpj_limpo}.pfx.enc"
         pwd_path = CERTIFICATES_DIR / f"{cnpj_limpo}.pwd.enc"
         
-        if not file_path.exists() or not pwd_path.exists():
-            raise FileNotFoundError(f"Certificado ou senha não encontrados para CNPJ: {cnpj_limpo}")
+        # Reaproveita o certificado já descriptografado se os arquivos não mudaram
+        versao = _versao_arquivos(bundle_path) or _versao_arquivos(file_path, pwd_path)
+        if versao is not None:
+            with self._cache_lock:
+                em_cache = self._cache_certificados.get(cnpj_limpo)
+                if em_cache is not None and em_cache[0] == versao:
+                    self._cache_certificados.move_to_end(cnpj_limpo)
+                    return em_cache[1], em_cache[2]
         
+        # Sem exists(): o próprio open() sinaliza a ausência do arquivo
         try:
-            with open(file_path, "rb") as f:
-                encrypted_pfx = f.read()
-            with open(pwd_path, "rb") as f:
-                encrypted_pwd = f.read()
+            try:
+                encrypted_pfx, encrypted_pwd = ler_bundle(bundle_path)
+            except FileNotFoundError:
+                try:
+                    with open(file_path, "rb") as f:
+                        encrypted_pfx = f.read()
+                    with open(pwd_path, "rb") as f:
+                        encrypted_pwd = f.read()
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        f"Certificado ou senha não encontrados para CNPJ: {cnpj_limpo}"
+                    ) from None
             
-            conteudo_pfx = self.fernet.decrypt(encrypted_pfx)
-            senha_bytes = self.fernet.decrypt(encrypted_pwd)
+            conteudo_pfx = descriptografar(self.aesgcm, self.fernet, encrypted_pfx)
+            senha_bytes = descriptografar(self.aesgcm, self.fernet, encrypted_pwd)
             
             if senha_bytes is None:
                 raise ValueError(f"Senha descriptografada está None para CNPJ: {cnpj_limpo}")
@@ -138,9 +193,18 @@ class CertificateService:
             if not senha:
                 raise ValueError(f"Senha descriptografada está vazia para CNPJ: {cnpj_limpo}")
             
+            if versao is not None:
+                with self._cache_lock:
+                    self._cache_certificados[cnpj_limpo] = (versao, conteudo_pfx, senha)
+                    self._cache_certificados.move_to_end(cnpj_limpo)
+                    if len(self._cache_certificados) > _TAMANHO_CACHE_CERTIFICADOS:
+                        self._cache_certificados.popitem(last=False)
+            
             logger.info(f"Certificado carregado com sucesso para CNPJ: {cnpj_limpo}")
             return conteudo_pfx, senha
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao carregar certificado para CNPJ {cnpj_limpo}: {str(e)}", exc_info=True)
             raise Exception(f"Erro ao carregar certificado: {str(e)}")
@@ -160,14 +224,24 @@ class CertificateService:
         Raises:
             HTTPException: Se o certificado ou senha forem inválidos
         """
-        # Valida o certificado primeiro
-        validar_pfx(conteudo_pfx, senha)
-        
-        # Extrai informações
+        # Valida o certificado (via validar_pfx) e extrai informações
         info_dict = extrair_informacoes_certificado(conteudo_pfx, senha, debug)
         
         return CertificadoInfo(**info_dict)
     
+    def extrair_info_do_certificado(self, cert: x509.Certificate, debug: bool = False) -> CertificadoInfo:
+        """
+        Extrai informações de um certificado já validado por validar_pfx.
+        
+        Args:
+            cert: Certificado X.509 retornado por validar_pfx
+            debug: Se True, imprime logs de debug
+            
+        Returns:
+            CertificadoInfo com informações extraídas
+        """
+        return CertificadoInfo(**extrair_informacoes_de_cert(cert, debug))
+    
     def obter_common_name(self, conteudo_pfx: bytes, senha: str) -> str:
         """
         Obtém o Common Name (CN) do certificado.
@@ -183,11 +257,8 @@ class CertificateService:
             key, cert, additional_certs = validar_pfx(conteudo_pfx, senha)
             subject = cert.subject
             
-            for attr in subject:
-                if attr.oid == x509.NameOID.COMMON_NAME:
-                    return attr.value
-            
-            return None
+            atributos_cn = subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+            return atributos_cn[0].value if atributos_cn else None
         except Exception as e:
             logger.warning(f"Não foi possível extrair Common Name: {e}")
             return None
@@ -187,6 +187,20 @@ class ExecutionService:
         
         logger.info("Iniciando processamento da fila de execuções em contexto isolado")
         
+        try:
+            self._consumir_fila()
+        finally:
+            # O Playwright e o Chromium da thread não podem ser fechados por
+            # outra thread: são encerrados aqui, antes de a thread terminar
+            playwright_nfse = sys.modules.get("playwright_nfse")
+            if playwright_nfse is not None:
+                playwright_nfse.encerrar_navegador_da_thread()
+                logger.info("Navegador da thread executora encerrado")
+    
+    def _consumir_fila(self):
+        """
+        Consome a fila de execuções até ela ficar vazia por QUEUE_TIMEOUT segundos.
+        """
         while True:
             try:
                 # Pega próxima execução (bloqueia até ter uma)
@@ -275,10 +289,13 @@ class ExecutionService:
             headless = execucao.headless if execucao.headless is not None else PLAYWRIGHT_HEADLESS
             
             try:
+                # page e context ficam abertos para o processamento das notas
+                # e são fechados por _limpar_recursos
                 resultado_auth = abrir_dashboard_nfse(
                     cnpj=cnpj_str,
                     headless=headless,
-                    timeout=PLAYWRIGHT_TIMEOUT
+                    timeout=PLAYWRIGHT_TIMEOUT,
+                    manter_aberto=True
                 )
                 self._adicionar_log(execucao, "abrir_dashboard_nfse concluído")
             except Exception as e:
@@ -295,8 +312,6 @@ class ExecutionService:
             # Armazena recursos do Playwright para cleanup posterior
             execucao.page = resultado_auth.get("page")  # type: ignore
             execucao.context = resultado_auth.get("context")  # type: ignore
-            execucao.browser = resultado_auth.get("browser")  # type: ignore
-            execucao.playwright = resultado_auth.get("playwright")  # type: ignore
             execucao.url_atual = resultado_auth.get("url_atual")
             execucao.titulo = resultado_auth.get("titulo")
             
@@ -513,30 +528,18 @@ class ExecutionService:
             headless = execucao.headless if execucao.headless is not None else PLAYWRIGHT_HEADLESS
             
             if headless:
-                # Em modo headless, fecha tudo
+                # Em modo headless, fecha a página da execução
                 if execucao.page:
                     try:
                         execucao.page.close()
-                    except:
+                    except Exception:
+                        # Página já fechada (ex: navegador encerrado)
                         pass
                 
-                if execucao.context:
-                    try:
-                        execucao.context.close()
-                    except:
-                        pass
-                
-                if execucao.browser:
-                    try:
-                        execucao.browser.close()
-                    except:
-                        pass
-                
-                if execucao.playwright:
-                    try:
-                        execucao.playwright.stop()
-                    except:
-                        pass
+                # O context fica no pool do playwright_nfse para o próximo login
+                # da mesma empresa; o browser e o playwright são compartilhados
+                # entre as execuções da fila e encerrados quando a thread
+                # trabalhadora termina (encerrar_navegador_da_thread)
                 
                 self._adicionar_log(execucao, "🧹 Recursos liberados (modo headless)")
             else:
@@ -2,8 +2,13 @@
 Utilitários para manipulação de certificados digitais ICP-Brasil.
 """
 
+import hashlib
+import logging
+import os
 import re
-from typing import Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
 from cryptography.hazmat.primitives.serialization import pkcs12
 from cryptography import x509
 from fastapi import HTTPException
@@ -13,20 +18,74 @@ from ..infrastructure.logger import get_logger
 logger = get_logger(__name__)
 
 
+class _CacheLRU:
+    """Cache LRU simples e thread-safe (os endpoints chamam via asyncio.to_thread)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._dados: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: bytes) -> Any:
+        with self._lock:
+            valor = self._dados.get(chave)
+            if valor is not None:
+                self._dados.move_to_end(chave)
+            return valor
+
+    def put(self, chave: bytes, valor: Any) -> None:
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            if len(self._dados) > self.maxsize:
+                self._dados.popitem(last=False)
+
+
+# Caches chaveados por um BLAKE2b com chave de (conteúdo, senha): reenvios do
+# mesmo certificado (retries da interface) não refazem o PBKDF2 nem a extração.
+# Só o certificado é guardado; a chave privada nunca fica no cache.
+_pfx_cache = _CacheLRU(maxsize=128)
+_info_cache = _CacheLRU(maxsize=256)
+# Segredo aleatório por processo: os digests do cache não servem para
+# testar senhas offline (nem se repetem entre execuções).
+_SEGREDO_CACHE = os.urandom(32)
+
+
+def _chave_cache_pfx(conteudo_pfx: bytes, senha: str) -> bytes:
+    """Gera a chave do cache sem manter conteúdo ou senha em memória."""
+    digest = hashlib.blake2b(key=_SEGREDO_CACHE, digest_size=32)
+    # O tamanho do conteúdo delimita os campos (conteúdo + senha sem ambiguidade)
+    digest.update(len(conteudo_pfx).to_bytes(8, 'big'))
+    digest.update(conteudo_pfx)
+    digest.update(senha.encode('utf-8') if senha else b'')
+    return digest.digest()
+
+
 def validar_pfx(conteudo_pfx: bytes, senha: str) -> Tuple:
     """
     Valida se o arquivo .pfx e a senha são válidos usando cryptography.
     
+    Resultados válidos ficam em cache (LRU, 128 entradas): o mesmo arquivo
+    com a mesma senha não é interpretado novamente. O cache guarda apenas
+    (cert, additional_certs), então em um acerto a chave privada vem None.
+    
     Args:
         conteudo_pfx: Conteúdo do arquivo .pfx em bytes
         senha: Senha do certificado
         
     Returns:
-        Tupla (key, cert, additional_certs) se válido
+        Tupla (key, cert, additional_certs) se válido; key é None quando
+        o resultado vem do cache
         
     Raises:
         HTTPException: Se o certificado ou senha forem inválidos
     """
+    chave_cache = _chave_cache_pfx(conteudo_pfx, senha)
+    em_cache = _pfx_cache.get(chave_cache)
+    if em_cache is not None:
+        cert, additional_certs = em_cache
+        return None, cert, additional_certs
+    
     try:
         senha_bytes = senha.encode('utf-8') if senha else None
         
@@ -53,18 +112,59 @@ def validar_pfx(conteudo_pfx: bytes, senha: str) -> Tuple:
                 detail="Certificado não encontrado no arquivo PKCS12"
             )
         
+        _pfx_cache.put(chave_cache, (cert, additional_certs))
         return key, cert, additional_certs
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Erro ao validar certificado: {str(e)}", exc_info=True)
+        logger.error("Erro ao validar certificado: %s", e, exc_info=True)
         raise HTTPException(
             status_code=400,
             detail=f"Certificado inválido ou senha incorreta: {str(e)}"
         )
 
 
+# Padrões de CNPJ compilados uma única vez.
+# Ordem de prioridade: formatos mais específicos primeiro. Cada padrão é
+# procurado com search() (primeira ocorrência), pois finditer em um padrão
+# único não enxerga ocorrências sobrepostas de formatos de maior prioridade.
+_CNPJ_PADROES = tuple(re.compile(padrao) for padrao in (
+    # CNPJ: 00.000.000/0000-00 ou CNPJ 00.000.000/0000-00
+    r'CNPJ[:\s\-]*(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})',
+    # 00.000.000/0000-00 (formato completo com pontuação)
+    r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})',
+    # 00000000000000 (14 dígitos consecutivos - mais específico)
+    r'\b(\d{14})\b',
+    # 00.000.000/0000-00 (formato flexível)
+    r'(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})',
+    # Qualquer sequência de 14 dígitos (último recurso)
+    r'(\d{14})',
+))
+_NAO_DIGITO_RE = re.compile(r'[^\d]')
+_CNPJ_ZERADO = '0' * 14
+# Tabela que remove dígitos ASCII (usada para detectar dígitos em uma só passada)
+_REMOVE_DIGITOS = str.maketrans('', '', '0123456789')
+_DIGITOS_ASCII = b'0123456789'
+
+
+# OID do ICP-Brasil que carrega o CNPJ do titular
+_OID_CNPJ_ICP_BRASIL = x509.ObjectIdentifier("2.16.76.1.3.3")
+# Atributos já verificados nas prioridades 1 e 2 da extração
+_OIDS_NOME_E_OU = frozenset((x509.NameOID.COMMON_NAME, x509.NameOID.ORGANIZATIONAL_UNIT_NAME))
+
+
+def _nome_pode_conter_cnpj(nome: x509.Name) -> bool:
+    """
+    Verifica, com uma passada sobre o DER do Name, se algum atributo pode conter CNPJ.
+    
+    Bytes de tag/tamanho podem coincidir com dígitos ASCII, então a contagem é
+    um limite superior: menos de 14 dígitos garante que não há CNPJ.
+    """
+    der = nome.public_bytes()
+    return len(der) - len(der.translate(None, _DIGITOS_ASCII)) >= 14
+
+
 def extrair_cnpj_do_texto(texto: str) -> Optional[str]:
     """
     Extrai CNPJ de um texto, tentando vários formatos.
@@ -81,32 +181,34 @@ def extrair_cnpj_do_texto(texto: str) -> Optional[str]:
     # Remove espaços e converte para maiúsculo
     texto = texto.strip().upper()
     
-    # Tenta encontrar padrão CNPJ em vários formatos
-    # Ordem de prioridade: formatos mais específicos primeiro
-    padroes = [
-        # CNPJ: 00.000.000/0000-00 ou CNPJ 00.000.000/0000-00
-        r'CNPJ[:\s\-]*(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})',
-        # 00.000.000/0000-00 (formato completo com pontuação)
-        r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})',
-        # 00000000000000 (14 dígitos consecutivos - mais específico)
-        r'\b(\d{14})\b',
-        # 00.000.000/0000-00 (formato flexível)
-        r'(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})',
-        # Qualquer sequência de 14 dígitos (último recurso)
-        r'(\d{14})',
-    ]
+    # Caminho rápido: formato ICP-Brasil "NOME:00000000000000" (ou só os dígitos),
+    # sem nenhum outro dígito antes do ":" que pudesse disputar a prioridade
+    cabeca, _, cauda = texto.rpartition(':')
+    cauda = cauda.strip()
+    if (
+        len(cauda) == 14
+        and cauda.isdigit()
+        and cauda != _CNPJ_ZERADO
+        and len(cabeca.translate(_REMOVE_DIGITOS)) == len(cabeca)
+    ):
+        return cauda
     
-    for padrao in padroes:
-        match = re.search(padrao, texto)
+    # Rejeição antecipada: sem 14 dígitos no texto não há CNPJ possível
+    # (a contagem com translate só vale para ASCII; \d do re aceita outros dígitos)
+    if len(texto) < 14 or (
+        texto.isascii() and len(texto) - len(texto.translate(_REMOVE_DIGITOS)) < 14
+    ):
+        return None
+    
+    # Tenta encontrar padrão CNPJ em vários formatos (ver _CNPJ_PADROES)
+    for padrao in _CNPJ_PADROES:
+        match = padrao.search(texto)
         if match:
-            cnpj = match.group(1) if match.lastindex and match.lastindex >= 1 else match.group(0)
-            # Remove formatação
-            cnpj_limpo = re.sub(r'[^\d]', '', cnpj)
-            # Valida que tem exatamente 14 dígitos
-            if len(cnpj_limpo) == 14:
-                # Validação básica: não pode ser tudo zeros
-                if cnpj_limpo != '0' * 14:
-                    return cnpj_limpo
+            # Remove formatação (os padrões garantem exatamente 14 dígitos)
+            cnpj_limpo = _NAO_DIGITO_RE.sub('', match.group(1))
+            # Validação básica: não pode ser tudo zeros
+            if cnpj_limpo != _CNPJ_ZERADO:
+                return cnpj_limpo
     
     return None
 
@@ -119,10 +221,14 @@ def extrair_informacoes_certificado(
     """
     Extrai informações do certificado digital ICP-Brasil.
     
+    O resultado fica em cache (LRU, 256 entradas) por (conteúdo, senha);
+    com debug=True a extração é sempre refeita para gerar os logs.
+    
     Args:
         conteudo_pfx: Conteúdo do arquivo .pfx em bytes
         senha: Senha do certificado
-        debug: Se True, imprime logs de debug (padrão: False)
+        debug: Se True e o logger estiver em DEBUG, registra a análise
+            detalhada dos atributos (padrão: False)
         
     Returns:
         Dict com: empresa (nome), cnpj, cnpj_limpo, dataVencimento
@@ -130,12 +236,48 @@ def extrair_informacoes_certificado(
     Raises:
         HTTPException: Se houver erro ao processar o certificado
     """
-    try:
-        # Carrega o certificado
-        key, cert, additional_certs = validar_pfx(conteudo_pfx, senha)
+    # Os logs de debug só são montados se o logger estiver em DEBUG
+    debug = debug and logger.isEnabledFor(logging.DEBUG)
+    
+    chave_cache = _chave_cache_pfx(conteudo_pfx, senha)
+    if not debug:
+        resultado = _info_cache.get(chave_cache)
+        if resultado is not None:
+            return dict(resultado)
+    
+    # Carrega o certificado
+    key, cert, additional_certs = validar_pfx(conteudo_pfx, senha)
+    
+    resultado = extrair_informacoes_de_cert(cert, debug)
+    _info_cache.put(chave_cache, resultado)
+    return dict(resultado)
+
+
+def extrair_informacoes_de_cert(cert: x509.Certificate, debug: bool = False) -> dict:
+    """
+    Extrai informações de um certificado ICP-Brasil já carregado.
+    
+    Use quando o PKCS12 já foi validado (ex.: retorno de validar_pfx), para
+    não repetir o parse do arquivo.
+    
+    Args:
+        cert: Certificado X.509 do titular
+        debug: Se True e o logger estiver em DEBUG, registra a análise
+            detalhada dos atributos (padrão: False)
+        
+    Returns:
+        Dict com: empresa (nome), cnpj, cnpj_limpo, dataVencimento
         
-        # Extrai informações do subject
-        subject = cert.subject
+    Raises:
+        HTTPException: Se houver erro ao processar o certificado
+    """
+    debug = debug and logger.isEnabledFor(logging.DEBUG)
+    try:
+        # Extrai informações do subject (percorrido uma única vez)
+        atributos_subject = list(cert.subject)
+        valores_por_oid = {}
+        for attr in atributos_subject:
+            valores_por_oid.setdefault(attr.oid, []).append(attr.value)
         nome_empresa = None
         cnpj = None
         
@@ -143,115 +285,110 @@ def extrair_informacoes_certificado(
         if debug:
             logger.debug("=" * 60)
             logger.debug("Analisando atributos do certificado:")
-            for attr in subject:
-                logger.debug(f"  OID: {attr.oid}, Nome: {attr.oid._name}, Valor: {attr.value}")
+            for attr in atributos_subject:
+                logger.debug("  OID: %s, Nome: %s, Valor: %s", attr.oid, attr.oid._name, attr.value)
             logger.debug("=" * 60)
         
         # Prioridade 1: Tenta extrair CNPJ do Common Name (CN)
-        for attr in subject:
-            if attr.oid == x509.NameOID.COMMON_NAME:
-                nome_empresa_completo = attr.value
+        for nome_empresa_completo in valores_por_oid.get(x509.NameOID.COMMON_NAME, ()):
+            if debug:
+                logger.debug("Common Name encontrado: %s", nome_empresa_completo)
+            
+            # Verifica se tem ":" no Common Name (formato comum: "NOME:CNPJ")
+            if ':' in nome_empresa_completo:
+                partes = nome_empresa_completo.split(':', 1)
+                nome_empresa = partes[0].strip()
+                parte_cnpj = partes[1].strip() if len(partes) > 1 else ''
+                
                 if debug:
-                    logger.debug(f"Common Name encontrado: {nome_empresa_completo}")
+                    logger.debug("Common Name dividido - Nome: '%s', Parte CNPJ: '%s'", nome_empresa, parte_cnpj)
                 
-                # Verifica se tem ":" no Common Name (formato comum: "NOME:CNPJ")
-                if ':' in nome_empresa_completo:
-                    partes = nome_empresa_completo.split(':', 1)
-                    nome_empresa = partes[0].strip()
-                    parte_cnpj = partes[1].strip() if len(partes) > 1 else ''
-                    
+                # Tenta extrair CNPJ da parte após ":"
+                cnpj_extraido = extrair_cnpj_do_texto(parte_cnpj)
+                if cnpj_extraido:
+                    cnpj = cnpj_extraido
                     if debug:
-                        logger.debug(f"Common Name dividido - Nome: '{nome_empresa}', Parte CNPJ: '{parte_cnpj}'")
-                    
-                    # Tenta extrair CNPJ da parte após ":"
-                    cnpj_extraido = extrair_cnpj_do_texto(parte_cnpj)
+                        logger.debug("CNPJ extraído do Common Name (após ':'): %s", cnpj)
+                else:
+                    # Se não encontrou após ":", tenta no Common Name inteiro
+                    nome_empresa = nome_empresa_completo
+                    cnpj_extraido = extrair_cnpj_do_texto(nome_empresa_completo)
                     if cnpj_extraido:
                         cnpj = cnpj_extraido
                         if debug:
-                            logger.debug(f"CNPJ extraído do Common Name (após ':'): {cnpj}")
-                    else:
-                        # Se não encontrou após ":", tenta no Common Name inteiro
-                        nome_empresa = nome_empresa_completo
-                        cnpj_extraido = extrair_cnpj_do_texto(nome_empresa_completo)
-                        if cnpj_extraido:
-                            cnpj = cnpj_extraido
-                            if debug:
-                                logger.debug(f"CNPJ extraído do Common Name completo: {cnpj}")
-                else:
-                    # Se não tem ":", usa o Common Name completo como nome
-                    nome_empresa = nome_empresa_completo
-                    # Tenta extrair CNPJ do CN também
-                    if not cnpj:
-                        cnpj = extrair_cnpj_do_texto(attr.value)
-                        if cnpj and debug:
-                            logger.debug(f"CNPJ extraído do CN: {cnpj}")
+                            logger.debug("CNPJ extraído do Common Name completo: %s", cnpj)
+            else:
+                # Se não tem ":", usa o Common Name completo como nome
+                nome_empresa = nome_empresa_completo
+                # Tenta extrair CNPJ do CN também
+                if not cnpj:
+                    cnpj = extrair_cnpj_do_texto(nome_empresa_completo)
+                    if cnpj and debug:
+                        logger.debug("CNPJ extraído do CN: %s", cnpj)
         
         # Prioridade 2: Tenta extrair CNPJ do Organizational Unit (OU)
         if not cnpj:
-            for attr in subject:
-                if attr.oid == x509.NameOID.ORGANIZATIONAL_UNIT_NAME:
-                    valor_ou = attr.value
+            for valor_ou in valores_por_oid.get(x509.NameOID.ORGANIZATIONAL_UNIT_NAME, ()):
+                if debug:
+                    logger.debug("OU encontrado: %s", valor_ou)
+                cnpj_extraido = extrair_cnpj_do_texto(valor_ou)
+                if cnpj_extraido:
+                    cnpj = cnpj_extraido
                     if debug:
-                        logger.debug(f"OU encontrado: {valor_ou}")
-                    cnpj_extraido = extrair_cnpj_do_texto(valor_ou)
-                    if cnpj_extraido:
-                        cnpj = cnpj_extraido
-                        if debug:
-                            logger.debug(f"CNPJ extraído do OU: {cnpj}")
-                        break
+                        logger.debug("CNPJ extraído do OU: %s", cnpj)
+                    break
         
         # Prioridade 3: Verifica OID específico do ICP-Brasil para CNPJ (2.16.76.1.3.3)
         if not cnpj:
             try:
-                cnpj_oid = x509.ObjectIdentifier("2.16.76.1.3.3")
-                for attr in subject:
-                    if attr.oid == cnpj_oid:
-                        cnpj = extrair_cnpj_do_texto(attr.value)
-                        if cnpj:
-                            if debug:
-                                logger.debug(f"CNPJ extraído do OID ICP-Brasil (2.16.76.1.3.3): {cnpj}")
-                            break
+                for valor_icp in valores_por_oid.get(_OID_CNPJ_ICP_BRASIL, ()):
+                    cnpj = extrair_cnpj_do_texto(valor_icp)
+                    if cnpj:
+                        if debug:
+                            logger.debug("CNPJ extraído do OID ICP-Brasil (2.16.76.1.3.3): %s", cnpj)
+                        break
             except Exception as e:
                 if debug:
-                    logger.debug(f"Erro ao verificar OID ICP-Brasil: {e}")
+                    logger.debug("Erro ao verificar OID ICP-Brasil: %s", e)
         
         # Prioridade 4: Verifica todos os outros atributos do subject
         if not cnpj:
-            for attr in subject:
-                if attr.oid in [x509.NameOID.COMMON_NAME, x509.NameOID.ORGANIZATIONAL_UNIT_NAME]:
+            for attr in atributos_subject:
+                if attr.oid in _OIDS_NOME_E_OU:
                     continue
                 valor_attr = attr.value
                 cnpj_extraido = extrair_cnpj_do_texto(valor_attr)
                 if cnpj_extraido:
                     cnpj = cnpj_extraido
                     if debug:
-                        logger.debug(f"CNPJ extraído do atributo {attr.oid._name}: {cnpj}")
+                        logger.debug("CNPJ extraído do atributo %s: %s", attr.oid._name, cnpj)
                     break
         
-        # Prioridade 5: Verifica o Issuer também
-        if not cnpj:
-            issuer = cert.issuer
+        # Prioridade 5: Verifica o Issuer também (sem percorrer os atributos se o
+        # DER do issuer não tiver dígitos suficientes para um CNPJ)
+        issuer = cert.issuer if not cnpj else None
+        if issuer is not None and (debug or _nome_pode_conter_cnpj(issuer)):
             if debug:
                 logger.debug("Verificando atributos do Issuer:")
             for attr in issuer:
                 if debug:
-                    logger.debug(f"  Issuer OID: {attr.oid}, Valor: {attr.value}")
+                    logger.debug("  Issuer OID: %s, Valor: %s", attr.oid, attr.value)
                 if attr.oid == x509.NameOID.ORGANIZATIONAL_UNIT_NAME:
                     cnpj_extraido = extrair_cnpj_do_texto(attr.value)
                     if cnpj_extraido:
                         cnpj = cnpj_extraido
                         if debug:
-                            logger.debug(f"CNPJ extraído do Issuer OU: {cnpj}")
+                            logger.debug("CNPJ extraído do Issuer OU: %s", cnpj)
                         break
         
         # Prioridade 6: Tenta extrair CNPJ do Serial Number
         if not cnpj:
             serial_number = cert.serial_number
             if debug:
-                logger.debug(f"Serial Number: {serial_number}")
+                logger.debug("Serial Number: %s", serial_number)
             cnpj = extrair_cnpj_do_texto(str(serial_number))
             if cnpj and debug:
-                logger.debug(f"CNPJ extraído do Serial Number: {cnpj}")
+                logger.debug("CNPJ extraído do Serial Number: %s", cnpj)
         
         # Prioridade 7: Tenta extrair CNPJ do Subject Alternative Name (SAN)
         if not cnpj:
@@ -262,13 +399,13 @@ def extrair_informacoes_certificado(
                     if debug:
                         logger.debug("Subject Alternative Name encontrado")
                     for name in san:
-                        if isinstance(name, x509.DirectoryName):
+                        if isinstance(name, x509.DirectoryName) and _nome_pode_conter_cnpj(name.value):
                             for attr in name.value:
                                 cnpj_extraido = extrair_cnpj_do_texto(attr.value)
                                 if cnpj_extraido:
                                     cnpj = cnpj_extraido
                                     if debug:
-                                        logger.debug(f"CNPJ extraído do SAN: {cnpj}")
+                                        logger.debug("CNPJ extraído do SAN: %s", cnpj)
                                     break
                         if cnpj:
                             break
@@ -277,7 +414,7 @@ def extrair_informacoes_certificado(
                     logger.debug("Subject Alternative Name não encontrado")
             except Exception as e:
                 if debug:
-                    logger.debug(f"Erro ao processar SAN: {e}")
+                    logger.debug("Erro ao processar SAN: %s", e)
         
         # Extrai data de vencimento
         data_vencimento = cert.not_valid_after
@@ -287,7 +424,7 @@ def extrair_informacoes_certificado(
         if cnpj:
             cnpj_formatado = f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
             if debug:
-                logger.debug(f"CNPJ final formatado: {cnpj_formatado}")
+                logger.debug("CNPJ final formatado: %s", cnpj_formatado)
         else:
             if debug:
                 logger.warning("CNPJ não encontrado em nenhum campo!")
@@ -300,7 +437,7 @@ def extrair_informacoes_certificado(
         }
         
         if debug:
-            logger.debug(f"Resultado final: {resultado}")
+            logger.debug("Resultado final: %s", resultado)
             logger.debug("=" * 60)
         
         return resultado
@@ -308,7 +445,7 @@ def extrair_informacoes_certificado(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Erro ao extrair informações do certificado: {str(e)}", exc_info=True)
+        logger.error("Erro ao extrair informações do certificado: %s", e, exc_info=True)
         raise HTTPException(
             status_code=400,
             detail=f"Erro ao extrair informações do certificado: {str(e)}"
@@ -0,0 +1,134 @@
+"""
+Utilitários de criptografia para o armazenamento de certificados.
+
+Os arquivos .enc são gravados no formato:
+    versão (1 byte) || nonce (12 bytes) || ciphertext || tag (16 bytes)
+
+usando AES-256-GCM (acelerado por AES-NI via OpenSSL). Arquivos antigos,
+criptografados com Fernet, continuam legíveis pelo caminho de fallback.
+
+Certificado e senha criptografados são gravados juntos em um único arquivo
+{cnpj}.bundle.enc, com um cabeçalho de tamanhos:
+    len(pfx) (uint32 LE) || len(senha) (uint32 LE) || pfx || senha
+"""
+
+import base64
+import os
+import struct
+from typing import Tuple, Union
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# Prefixo de versão dos arquivos AES-GCM.
+# Tokens Fernet sempre começam com "g" (0x80 em base64), então não há colisão.
+VERSAO_AESGCM = b"\x01"
+
+_TAMANHO_NONCE = 12
+_HKDF_INFO = b"autonacional-certificados-aesgcm"
+
+# Cabeçalho do bundle e tamanho do buffer de leitura/escrita (128 KiB)
+_CABECALHO_BUNDLE = struct.Struct("<II")
+TAMANHO_BUFFER = 1 << 17
+
+
+def derivar_chave_aesgcm(fernet_key: Union[str, bytes]) -> bytes:
+    """
+    Deriva uma chave AES-256 a partir da FERNET_KEY existente.
+
+    Args:
+        fernet_key: Chave Fernet (base64 url-safe) em str ou bytes
+
+    Returns:
+        Chave de 32 bytes para uso com AESGCM
+    """
+    key_bytes = fernet_key.encode() if isinstance(fernet_key, str) else fernet_key
+    material = base64.urlsafe_b64decode(key_bytes)
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=_HKDF_INFO,
+    ).derive(material)
+
+
+def criptografar(aesgcm: AESGCM, dados: bytes) -> bytes:
+    """
+    Criptografa os dados com AES-GCM, prefixando versão e nonce.
+
+    Args:
+        aesgcm: Instância AESGCM já inicializada
+        dados: Conteúdo em bytes
+
+    Returns:
+        Bytes no formato versão || nonce || ciphertext || tag
+    """
+    nonce = os.urandom(_TAMANHO_NONCE)
+    return VERSAO_AESGCM + nonce + aesgcm.encrypt(nonce, dados, None)
+
+
+def descriptografar(aesgcm: AESGCM, fernet: Fernet, token: bytes) -> bytes:
+    """
+    Descriptografa um conteúdo gravado em AES-GCM ou no formato Fernet legado.
+
+    Args:
+        aesgcm: Instância AESGCM já inicializada
+        fernet: Instância Fernet para arquivos legados
+        token: Conteúdo lido do arquivo .enc
+
+    Returns:
+        Conteúdo descriptografado em bytes
+    """
+    if token[:1] == VERSAO_AESGCM:
+        inicio_dados = 1 + _TAMANHO_NONCE
+        return aesgcm.decrypt(token[1:inicio_dados], token[inicio_dados:], None)
+
+    # Fallback: arquivo criptografado com Fernet. Os arquivos são gravados
+    # localmente e não expiram, então a verificação de TTL é desativada.
+    return fernet.decrypt(token, ttl=None)
+
+
+def escrever_bundle(caminho, encrypted_pfx: bytes, encrypted_pwd: bytes) -> None:
+    """
+    Grava certificado e senha criptografados em um único arquivo.
+
+    Args:
+        caminho: Caminho do arquivo {cnpj}.bundle.enc
+        encrypted_pfx: Certificado criptografado
+        encrypted_pwd: Senha criptografada
+    """
+    with open(caminho, "wb", buffering=TAMANHO_BUFFER) as f:
+        f.write(_CABECALHO_BUNDLE.pack(len(encrypted_pfx), len(encrypted_pwd)))
+        f.write(encrypted_pfx)
+        f.write(encrypted_pwd)
+
+
+def ler_bundle(caminho) -> Tuple[bytes, bytes]:
+    """
+    Lê certificado e senha criptografados de um arquivo bundle.
+
+    Args:
+        caminho: Caminho do arquivo {cnpj}.bundle.enc
+
+    Returns:
+        Tupla (encrypted_pfx, encrypted_pwd)
+
+    Raises:
+        FileNotFoundError: Se o arquivo não existir
+        ValueError: Se o arquivo estiver corrompido
+    """
+    with open(caminho, "rb", buffering=TAMANHO_BUFFER) as f:
+        conteudo = f.read()
+
+    if len(conteudo) < _CABECALHO_BUNDLE.size:
+        raise ValueError(f"Arquivo de certificado corrompido: {caminho}")
+
+    tamanho_pfx, tamanho_pwd = _CABECALHO_BUNDLE.unpack_from(conteudo)
+    inicio_pfx = _CABECALHO_BUNDLE.size
+    fim_pfx = inicio_pfx + tamanho_pfx
+    if len(conteudo) != fim_pfx + tamanho_pwd:
+        raise ValueError(f"Arquivo de certificado corrompido: {caminho}")
+
+    return conteudo[inicio_pfx:fim_pfx], conteudo[fim_pfx:]